@@ -1,11 +1,26 @@
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 import logging
 
-from .routers import token, upload
+from .routers import token, upload, jobs, presign, admin
 from .utils.config import SERVICE_NAME, API_VERSION
+from .utils.token_cache import token_cache
+from .utils.http_client import init_http_clients, close_http_clients
+from .utils.executor import upload_executor, io_executor
+from .utils.s3_client_cache import s3_client_cache
+from .utils.source_cache import source_cache
+from .utils.job_manager import job_manager
+from .utils.token_store import token_store
+from .utils.token_service import get_token_service
+from .utils.auth import token_validations
+from .utils.metrics import MetricsMiddleware, render_metrics
+from .utils.tracing import ServerTimingMiddleware, init_tracing, shutdown_tracing
+from .utils.loop_monitor import loop_monitor
+from .utils.admission import admission, AdmissionMiddleware
+from .utils.spool import spool
 
 # 配置日志
 logging.basicConfig(
@@ -21,6 +36,9 @@ app = FastAPI(
     version=API_VERSION
 )
 
+# 直接上传的准入控制需要在解析请求体之前进行（其余上传在路由中控制）
+app.add_middleware(AdmissionMiddleware, paths=["/R2api/upload-direct"])
+
 # 添加CORS中间件
 app.add_middleware(
     CORSMiddleware,
@@ -30,9 +48,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求耗时指标与单个请求的阶段耗时（Server-Timing / OpenTelemetry）
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+
 # 注册路由
 app.include_router(token.router)
 app.include_router(upload.router)
+app.include_router(jobs.router)
+app.include_router(presign.router)
+app.include_router(admin.router)
+
+
+# 应用生命周期：共享HTTP连接池、上传线程池、后台任务、Token索引同步与事件循环诊断
+@app.on_event("startup")
+async def startup_event():
+    init_tracing()
+    loop_monitor.start()
+    await init_http_clients()
+    await job_manager.start()
+    token_store.start(get_token_service())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await token_store.stop()
+    await job_manager.stop()
+    await close_http_clients()
+    await loop_monitor.stop()
+    shutdown_tracing()
+    upload_executor.shutdown()
+    io_executor.shutdown()
+    s3_client_cache.clear()
 
 
 # 全局异常处理
@@ -48,7 +95,26 @@ async def global_exception_handler(request: Request, exc: Exception):
 # 健康检查端点
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": SERVICE_NAME, "version": API_VERSION}
+    return {
+        "status": "healthy",
+        "service": SERVICE_NAME,
+        "version": API_VERSION,
+        "token_cache": token_cache.stats(),
+        "token_validations": token_validations.stats(),
+        "token_store": token_store.stats(),
+        "s3_client_cache": s3_client_cache.stats(),
+        "source_cache": source_cache.stats(),
+        "admission": admission.stats(),
+        "spool": spool.stats(),
+        "jobs": job_manager.stats(),
+        "event_loop": loop_monitor.stats()
+    }
+
+
+# Prometheus指标端点
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(render_metrics(), headers={"Content-Type": CONTENT_TYPE_LATEST})
 
 
 # 根路径重定向到文档
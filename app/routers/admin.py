@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException, Depends
+
+from ..utils.auth import verify_admin_token
+from ..utils.loop_monitor import loop_monitor
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(verify_admin_token)])
+
+
+@router.get("/event-loop")
+async def event_loop_diagnostics():
+    """
+    当前worker进程的事件循环延迟分布和最近的阻塞事件（含阻塞时事件循环线程的调用栈）
+    """
+    if not loop_monitor.enabled:
+        raise HTTPException(status_code=404, detail="事件循环诊断未启用，请设置LOOP_MONITOR_ENABLED=true")
+    return {
+        "status": "success",
+        "message": "事件循环诊断信息",
+        "data": loop_monitor.report()
+    }
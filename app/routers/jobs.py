@@ -0,0 +1,82 @@
+from fastapi import APIRouter, HTTPException, Depends
+from pydantic import HttpUrl, Field
+from typing import Dict, Any, Optional
+
+from .upload import UploadRequest, UploadResponse
+from ..utils.auth import get_current_token
+from ..utils.job_manager import job_manager, public_job, JobQueueFull
+from ..utils.admission import token_key
+from ..utils.transfer_settings import TransferSettings
+
+router = APIRouter(prefix="/R2api", tags=["jobs"])
+
+
+class JobRequest(UploadRequest):
+    webhookUrl: Optional[HttpUrl] = Field(None, description="任务结束后回调的URL，POST任务信息(可选)")
+
+
+@router.post("/jobs", response_model=UploadResponse, status_code=202)
+async def submit_job(
+    request: JobRequest,
+    token_data: Dict[str, Any] = Depends(get_current_token)
+):
+    """
+    提交异步上传任务，立即返回任务ID，通过GET /R2api/jobs/{job_id}查询进度
+    """
+    params = {
+        "file_url": str(request.fileUrl),
+        "bucket_name": request.bucketName,
+        "object_key": request.objectKey,
+        "endpoint": str(request.endpoint),
+        "access_key_id": request.accessKeyId,
+        "secret_access_key": request.secretAccessKey,
+        "custom_domain": str(request.customdomain) if request.customdomain else None,
+        "streaming": request.streaming,
+        "ranged": request.rangedDownload,
+        "transfer_settings": TransferSettings(
+            multipart_threshold=request.multipartThreshold,
+            part_size=request.partSize,
+            concurrency=request.concurrency
+        ),
+        "dedup": request.dedup,
+        "use_source_cache": request.sourceCache
+    }
+    
+    try:
+        job = await job_manager.submit(
+            owner=token_data.get("id"),
+            params=params,
+            webhook_url=str(request.webhookUrl) if request.webhookUrl else None,
+            admission_key=token_key(token_data.get("token", ""))
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"提交任务失败: {str(e)}")
+    
+    return {
+        "status": "success",
+        "message": "任务已提交",
+        "data": public_job(job)
+    }
+
+
+@router.get("/jobs/{job_id}", response_model=UploadResponse)
+async def get_job(
+    job_id: str,
+    token_data: Dict[str, Any] = Depends(get_current_token)
+):
+    """
+    查询异步上传任务的状态、阶段和已传输字节数
+    """
+    job = await job_manager.get(job_id)
+    
+    # 只能查询自己提交的任务
+    if job is None or job["owner"] != token_data.get("id"):
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    return {
+        "status": "success",
+        "message": "查询成功",
+        "data": public_job(job)
+    }
@@ -0,0 +1,212 @@
+from fastapi import APIRouter, HTTPException, Depends
+from pydantic import BaseModel, HttpUrl, Field, validator
+from typing import Dict, Any, Optional, List
+
+from .upload import UploadResponse
+from ..utils.auth import get_current_token
+from ..utils.presign_service import PresignService
+from ..utils.admission import admission, token_key, AdmissionRejected
+from ..utils.config import MULTIPART_MAX_PART_SIZE
+from ..utils.transfer_settings import MIN_PART_SIZE, MAX_PARTS
+
+router = APIRouter(prefix="/R2api", tags=["presign"])
+
+
+class PresignTarget(BaseModel):
+    bucketName: str = Field(..., min_length=1, description="R2存储桶名称")
+    objectKey: str = Field(..., min_length=1, description="对象键名(可包含路径，如'images/photo.jpg')")
+    endpoint: HttpUrl = Field(..., description="R2存储桶端点URL")
+    accessKeyId: str = Field(..., min_length=1, description="访问密钥ID")
+    secretAccessKey: str = Field(..., min_length=1, description="访问密钥")
+    
+    @validator('objectKey')
+    def validate_object_key(cls, v):
+        # 验证 objectKey 不以 / 开头
+        if v.startswith('/'):
+            raise ValueError("objectKey 不能以 '/' 开头")
+        return v
+
+
+class PresignRequest(PresignTarget):
+    contentType: Optional[str] = Field(None, description="文件内容类型，指定后上传时必须发送相同的Content-Type(可选)")
+    size: Optional[int] = Field(None, ge=0, description="文件字节数，指定后上传时必须发送相同的Content-Length(可选)")
+    expiresIn: Optional[int] = Field(None, ge=1, description="URL有效秒数(可选)")
+    customdomain: Optional[HttpUrl] = Field(None, description="自定义域名(可选)")
+
+
+class MultipartPresignRequest(PresignTarget):
+    size: int = Field(..., ge=1, description="文件字节数，用于计算分片数")
+    contentType: Optional[str] = Field(None, description="文件内容类型(可选)")
+    partSize: Optional[int] = Field(None, ge=MIN_PART_SIZE, le=MULTIPART_MAX_PART_SIZE, description=f"分片大小(字节)，5MB到{MULTIPART_MAX_PART_SIZE // (1024 * 1024)}MB，默认根据文件大小自动选择(可选)")
+    expiresIn: Optional[int] = Field(None, ge=1, description="分片URL有效秒数(可选)")
+    customdomain: Optional[HttpUrl] = Field(None, description="自定义域名(可选)")
+
+
+class MultipartPartsRequest(PresignTarget):
+    uploadId: str = Field(..., min_length=1, description="分片上传ID")
+    partNumbers: List[int] = Field(..., min_length=1, max_length=MAX_PARTS, description="需要重新签名的分片序号")
+    expiresIn: Optional[int] = Field(None, ge=1, description="分片URL有效秒数(可选)")
+
+
+class CompletedPart(BaseModel):
+    partNumber: int = Field(..., ge=1, le=MAX_PARTS, description="分片序号")
+    etag: str = Field(..., min_length=1, description="上传该分片时R2返回的ETag响应头")
+
+
+class MultipartCompleteRequest(PresignTarget):
+    uploadId: str = Field(..., min_length=1, description="分片上传ID")
+    parts: Optional[List[CompletedPart]] = Field(None, description="各分片的ETag，省略时从R2查询已上传的分片(可选)")
+    size: Optional[int] = Field(None, ge=1, description="文件字节数，省略parts时必填，用于确认所有分片都已上传")
+    customdomain: Optional[HttpUrl] = Field(None, description="自定义域名(可选)")
+
+
+class MultipartAbortRequest(PresignTarget):
+    uploadId: str = Field(..., min_length=1, description="分片上传ID")
+
+
+def _credentials(request: PresignTarget) -> Dict[str, str]:
+    return {
+        "bucket_name": request.bucketName,
+        "object_key": request.objectKey,
+        "endpoint": str(request.endpoint),
+        "access_key_id": request.accessKeyId,
+        "secret_access_key": request.secretAccessKey
+    }
+
+
+@router.post("/presign", response_model=UploadResponse)
+async def presign_upload(
+    request: PresignRequest,
+    token_data: Dict[str, Any] = Depends(get_current_token)
+):
+    """
+    生成预签名PUT URL，客户端直接上传到R2
+    """
+    try:
+        result = await PresignService().presign_put(
+            **_credentials(request),
+            content_type=request.contentType,
+            size=request.size,
+            expires_in=request.expiresIn,
+            custom_domain=str(request.customdomain) if request.customdomain else None
+        )
+        return {
+            "status": "success",
+            "message": "预签名URL已生成",
+            "data": result
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成预签名URL失败: {str(e)}")
+
+
+@router.post("/presign/multipart", response_model=UploadResponse)
+async def presign_multipart_upload(
+    request: MultipartPresignRequest,
+    token_data: Dict[str, Any] = Depends(get_current_token)
+):
+    """
+    创建分片上传并返回每个分片的预签名URL，全部分片上传后调用/R2api/presign/multipart/complete
+    """
+    try:
+        async with admission.admit(token_key(token_data.get("token", "")), 0):
+            result = await PresignService().create_multipart(
+                **_credentials(request),
+                size=request.size,
+                content_type=request.contentType,
+                part_size=request.partSize,
+                expires_in=request.expiresIn,
+                custom_domain=str(request.customdomain) if request.customdomain else None
+            )
+        return {
+            "status": "success",
+            "message": "分片上传已创建",
+            "data": result
+        }
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"创建分片上传失败: {str(e)}")
+
+
+@router.post("/presign/multipart/parts", response_model=UploadResponse)
+async def presign_multipart_parts(
+    request: MultipartPartsRequest,
+    token_data: Dict[str, Any] = Depends(get_current_token)
+):
+    """
+    为已创建的分片上传重新签名指定分片（如原URL已过期）
+    """
+    try:
+        result = await PresignService().presign_parts(
+            **_credentials(request),
+            upload_id=request.uploadId,
+            part_numbers=request.partNumbers,
+            expires_in=request.expiresIn
+        )
+        return {
+            "status": "success",
+            "message": "分片URL已生成",
+            "data": result
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成分片URL失败: {str(e)}")
+
+
+@router.post("/presign/multipart/complete", response_model=UploadResponse)
+async def complete_multipart_upload(
+    request: MultipartCompleteRequest,
+    token_data: Dict[str, Any] = Depends(get_current_token)
+):
+    """
+    完成分片上传
+    """
+    try:
+        async with admission.admit(token_key(token_data.get("token", "")), 0):
+            result = await PresignService().complete_multipart(
+                **_credentials(request),
+                upload_id=request.uploadId,
+                parts=[part.model_dump() for part in request.parts] if request.parts else None,
+                size=request.size,
+                custom_domain=str(request.customdomain) if request.customdomain else None
+            )
+        return {
+            "status": "success",
+            "message": "文件上传成功",
+            "data": result
+        }
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"完成分片上传失败: {str(e)}")
+
+
+@router.post("/presign/multipart/abort", response_model=UploadResponse)
+async def abort_multipart_upload(
+    request: MultipartAbortRequest,
+    token_data: Dict[str, Any] = Depends(get_current_token)
+):
+    """
+    中止分片上传，R2删除已上传的分片
+    """
+    try:
+        async with admission.admit(token_key(token_data.get("token", "")), 0):
+            await PresignService().abort_multipart(**_credentials(request), upload_id=request.uploadId)
+        return {
+            "status": "success",
+            "message": "分片上传已中止",
+            "data": {"upload_id": request.uploadId}
+        }
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"中止分片上传失败: {str(e)}")
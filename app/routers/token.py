@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional
 
-from ..utils.token_service import TokenService
+from ..utils.token_service import TokenService, get_token_service
 
 router = APIRouter(prefix="/R2api", tags=["token"])
 
@@ -36,12 +36,14 @@ class RenewTokenResponse(BaseModel):
 
 
 @router.post("/register", response_model=TokenResponse)
-async def register_token(request: TokenRequest):
+async def register_token(
+    request: TokenRequest,
+    token_service: TokenService = Depends(get_token_service)
+):
     """
     注册新的API令牌
     """
     try:
-        token_service = TokenService()
         token_data = await token_service.create_token(
             username=request.username,
             email=request.email,
@@ -59,12 +61,14 @@ async def register_token(request: TokenRequest):
 
 
 @router.post("/renew", response_model=RenewTokenResponse)
-async def renew_token(request: RenewTokenRequest):
+async def renew_token(
+    request: RenewTokenRequest,
+    token_service: TokenService = Depends(get_token_service)
+):
     """
     续期现有的API令牌
     """
     try:
-        token_service = TokenService()
         result = await token_service.renew_token(
             token=request.token,
             extend_days=request.extend_days
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, Form, File
+import asyncio
+import json
+import math
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, Form, File, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, HttpUrl, Field, validator
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 
 from ..utils.auth import get_current_token
 from ..utils.file_service import FileService
-from ..utils.config import MAX_FILE_SIZE
+from ..utils.admission import admission, token_key, AdmissionRejected
+from ..utils.config import BATCH_MAX_ITEMS, BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY, MAX_FILE_SIZE, MULTIPART_MAX_PART_SIZE
+from ..utils.transfer_settings import TransferSettings, MIN_PART_SIZE
 
 router = APIRouter(prefix="/R2api", tags=["upload"])
 
@@ -17,6 +23,13 @@ class UploadRequest(BaseModel):
     accessKeyId: str = Field(..., min_length=1, description="访问密钥ID")
     secretAccessKey: str = Field(..., min_length=1, description="访问密钥")
     customdomain: Optional[HttpUrl] = Field(None, description="自定义域名(可选)")
+    streaming: Optional[bool] = Field(None, description="是否边下载边分片上传，不写临时文件(可选)")
+    rangedDownload: Optional[bool] = Field(None, description="源站支持Range请求时是否多连接分段下载，默认按文件大小自动选择(可选)")
+    multipartThreshold: Optional[int] = Field(None, ge=1, le=MULTIPART_MAX_PART_SIZE, description=f"超过该字节数使用分片上传，不超过{MULTIPART_MAX_PART_SIZE // (1024 * 1024)}MB(可选)")
+    partSize: Optional[int] = Field(None, ge=MIN_PART_SIZE, le=MULTIPART_MAX_PART_SIZE, description=f"分片大小(字节)，5MB到{MULTIPART_MAX_PART_SIZE // (1024 * 1024)}MB，默认根据文件大小自动选择(可选)")
+    concurrency: Optional[int] = Field(None, ge=1, description="同时上传的分片数(可选)")
+    dedup: Optional[bool] = Field(None, description="是否按内容SHA-256去重，R2中已有相同内容的同名对象时跳过上传(可选)")
+    sourceCache: bool = Field(True, description="同一URL已上传到同一对象且源文件未变化时跳过下载和上传，为false时总是重新传输(可选)")
     
     @validator('objectKey')
     def validate_object_key(cls, v):
@@ -26,6 +39,32 @@ class UploadRequest(BaseModel):
         return v
 
 
+class BatchUploadItem(BaseModel):
+    fileUrl: HttpUrl = Field(..., description="要下载的文件URL")
+    objectKey: str = Field(..., min_length=1, description="对象键名(可包含路径，如'images/photo.jpg')")
+    
+    @validator('objectKey')
+    def validate_object_key(cls, v):
+        # 验证 objectKey 不以 / 开头
+        if v.startswith('/'):
+            raise ValueError("objectKey 不能以 '/' 开头")
+        return v
+
+
+class BatchUploadRequest(BaseModel):
+    bucketName: str = Field(..., min_length=1, description="R2存储桶名称")
+    endpoint: HttpUrl = Field(..., description="R2存储桶端点URL")
+    accessKeyId: str = Field(..., min_length=1, description="访问密钥ID")
+    secretAccessKey: str = Field(..., min_length=1, description="访问密钥")
+    customdomain: Optional[HttpUrl] = Field(None, description="自定义域名(可选)")
+    items: List[BatchUploadItem] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS, description="要上传的文件列表")
+    itemConcurrency: Optional[int] = Field(None, ge=1, description="同时处理的文件数(可选)")
+    streaming: Optional[bool] = Field(None, description="是否边下载边分片上传，不写临时文件(可选)")
+    dedup: Optional[bool] = Field(None, description="是否按内容SHA-256去重，R2中已有相同内容的同名对象时跳过上传(可选)")
+    sourceCache: bool = Field(True, description="同一URL已上传到同一对象且源文件未变化时跳过下载和上传，为false时总是重新传输(可选)")
+    ndjson: bool = Field(False, description="是否以NDJSON逐行返回每个文件的结果(可选)")
+
+
 class UploadResponse(BaseModel):
     status: str
     message: str
@@ -41,36 +80,38 @@ async def upload_file(
     从URL下载文件并上传到R2存储桶
     """
     file_service = FileService()
+    transfer_settings = TransferSettings(
+        multipart_threshold=request.multipartThreshold,
+        part_size=request.partSize,
+        concurrency=request.concurrency
+    )
     
     try:
-        # 下载文件
-        file, content_type, file_size = await file_service.download_file(str(request.fileUrl))
-        
-        # 验证文件大小
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413,
-                detail=f"文件大小超过限制: {file_size} > {MAX_FILE_SIZE} 字节"
+        # 文件大小未知，先按上限预留，得知Content-Length后缩小
+        async with admission.admit(token_key(token_data.get("token", "")), MAX_FILE_SIZE):
+            result = await file_service.upload_from_url(
+                file_url=str(request.fileUrl),
+                bucket_name=request.bucketName,
+                object_key=request.objectKey,
+                endpoint=str(request.endpoint),
+                access_key_id=request.accessKeyId,
+                secret_access_key=request.secretAccessKey,
+                custom_domain=str(request.customdomain) if request.customdomain else None,
+                streaming=request.streaming,
+                ranged=request.rangedDownload,
+                transfer_settings=transfer_settings,
+                dedup=request.dedup,
+                use_source_cache=request.sourceCache
             )
         
-        # 上传到R2
-        result = await file_service.upload_to_r2(
-            file=file,
-            content_type=content_type,
-            bucket_name=request.bucketName,
-            object_key=request.objectKey,
-            endpoint=str(request.endpoint),
-            access_key_id=request.accessKeyId,
-            secret_access_key=request.secretAccessKey,
-            custom_domain=str(request.customdomain) if request.customdomain else None
-        )
-        
         return {
             "status": "success",
             "message": "文件上传成功",
             "data": result
         }
         
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except ValueError as e:
         # 处理文件大小或其他验证错误
         raise HTTPException(status_code=400, detail=str(e))
@@ -79,6 +120,92 @@ async def upload_file(
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
 
+@router.post("/upload/batch", response_model=UploadResponse)
+async def upload_files_batch(
+    request: BatchUploadRequest,
+    http_request: Request,
+    token_data: Dict[str, Any] = Depends(get_current_token)
+):
+    """
+    批量从URL下载文件并上传到同一个R2存储桶
+    整批只验证一次Token、复用同一个存储后端（S3客户端），各文件以有限并发执行
+    请求ndjson=true或Accept: application/x-ndjson时，每完成一个文件输出一行结果
+    """
+    endpoint = str(request.endpoint)
+    custom_domain = str(request.customdomain) if request.customdomain else None
+    concurrency = min(request.itemConcurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    
+    try:
+        storage = await FileService().get_storage(endpoint, request.accessKeyId, request.secretAccessKey)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
+    
+    file_service = FileService(storage=storage)
+    semaphore = asyncio.Semaphore(concurrency)
+    admission_key = token_key(token_data.get("token", ""))
+    
+    async def upload_item(index: int, item: BatchUploadItem) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                # 批量请求已被接受，单个文件超出准入限制时一直排队而不是失败
+                async with admission.admit(admission_key, MAX_FILE_SIZE, queue_timeout=math.inf):
+                    result = await file_service.upload_from_url(
+                        file_url=str(item.fileUrl),
+                        bucket_name=request.bucketName,
+                        object_key=item.objectKey,
+                        endpoint=endpoint,
+                        access_key_id=request.accessKeyId,
+                        secret_access_key=request.secretAccessKey,
+                        custom_domain=custom_domain,
+                        streaming=request.streaming,
+                        dedup=request.dedup,
+                        use_source_cache=request.sourceCache
+                    )
+                return {"index": index, "objectKey": item.objectKey, "status": "success", "data": result}
+            except ValueError as e:
+                return {"index": index, "objectKey": item.objectKey, "status": "error", "detail": str(e)}
+            except Exception as e:
+                return {"index": index, "objectKey": item.objectKey, "status": "error", "detail": f"上传失败: {str(e)}"}
+    
+    tasks = [asyncio.create_task(upload_item(i, item)) for i, item in enumerate(request.items)]
+    
+    ndjson = request.ndjson or "application/x-ndjson" in http_request.headers.get("accept", "")
+    if ndjson:
+        async def result_lines():
+            succeeded = 0
+            try:
+                for future in asyncio.as_completed(tasks):
+                    result = await future
+                    succeeded += result["status"] == "success"
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+                yield json.dumps({
+                    "status": "done",
+                    "total": len(tasks),
+                    "succeeded": succeeded,
+                    "failed": len(tasks) - succeeded
+                }, ensure_ascii=False) + "\n"
+            finally:
+                # 客户端断开时取消剩余任务
+                for task in tasks:
+                    task.cancel()
+        
+        return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+    
+    results = await asyncio.gather(*tasks)
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    
+    return {
+        "status": "success" if succeeded == len(results) else "partial" if succeeded else "error",
+        "message": f"批量上传完成：成功{succeeded}个，失败{len(results) - succeeded}个",
+        "data": {
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results
+        }
+    }
+
+
 @router.post("/upload-direct", response_model=UploadResponse)
 async def upload_file_directly(
     bucket_name: str = Form(..., description="R2存储桶名称"),
@@ -87,6 +214,10 @@ async def upload_file_directly(
     access_key_id: str = Form(..., description="访问密钥ID"),
     secret_access_key: str = Form(..., description="访问密钥"),
     custom_domain: Optional[str] = Form(None, description="自定义域名(可选)"),
+    multipart_threshold: Optional[int] = Form(None, ge=1, le=MULTIPART_MAX_PART_SIZE, description=f"超过该字节数使用分片上传，不超过{MULTIPART_MAX_PART_SIZE // (1024 * 1024)}MB(可选)"),
+    part_size: Optional[int] = Form(None, ge=MIN_PART_SIZE, le=MULTIPART_MAX_PART_SIZE, description=f"分片大小(字节)，5MB到{MULTIPART_MAX_PART_SIZE // (1024 * 1024)}MB，默认根据文件大小自动选择(可选)"),
+    concurrency: Optional[int] = Form(None, ge=1, description="同时上传的分片数(可选)"),
+    dedup: Optional[bool] = Form(None, description="是否按内容SHA-256去重，R2中已有相同内容的同名对象时跳过上传(可选)"),
     file: UploadFile = File(..., description="要上传的文件"),
     token_data: Dict[str, Any] = Depends(get_current_token)
 ):
@@ -115,7 +246,13 @@ async def upload_file_directly(
             endpoint=endpoint,
             access_key_id=access_key_id,
             secret_access_key=secret_access_key,
-            custom_domain=custom_domain
+            custom_domain=custom_domain,
+            transfer_settings=TransferSettings(
+                multipart_threshold=multipart_threshold,
+                part_size=part_size,
+                concurrency=concurrency
+            ),
+            dedup=dedup
         )
         
         return {
@@ -0,0 +1,310 @@
+import asyncio
+import math
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from .config import (
+    MAX_FILE_SIZE,
+    DIRECT_UPLOAD_FORM_OVERHEAD,
+    ADMISSION_MAX_TRANSFERS,
+    ADMISSION_MAX_BYTES,
+    ADMISSION_TOKEN_MAX_TRANSFERS,
+    ADMISSION_TOKEN_MAX_BYTES,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_RETRY_AFTER,
+)
+from .token_cache import hash_token
+from .auth import authenticate as authenticate_token
+from .metrics import observe_phase, record_error
+
+
+class AdmissionRejected(Exception):
+    """超出准入限制且排队超时，调用方应返回429"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Reservation:
+    """一次传输占用的名额和预留字节数；得知实际大小后可以缩小预留"""
+
+    def __init__(self, controller: "AdmissionController", key: str, nbytes: int):
+        self.controller = controller
+        self.key = key
+        self.nbytes = nbytes
+        self._released = False
+
+    def shrink(self, nbytes: int) -> None:
+        if not self._released and 0 <= nbytes < self.nbytes:
+            self.controller._release(self.key, 0, self.nbytes - nbytes)
+            self.nbytes = nbytes
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.controller._release(self.key, 1, self.nbytes)
+
+
+# 当前请求（或批量上传中当前文件）的预留，供FileService在得知文件大小后缩小
+_current: ContextVar[Optional[Reservation]] = ContextVar("admission_reservation", default=None)
+
+
+def shrink_reservation(nbytes: int) -> None:
+    """已知传输实际大小（如源站Content-Length）时，释放多预留的字节"""
+    reservation = _current.get()
+    if reservation is not None:
+        reservation.shrink(nbytes)
+
+
+def token_key(token: str) -> str:
+    """按Token哈希区分调用方，不保存Token明文"""
+    return hash_token(token)
+
+
+class AdmissionController:
+    """
+    传输准入控制：按进行中的传输数和预留字节数限制，分全局和每个Token两级
+    URL上传在开始时按最大文件大小预留，得知Content-Length后缩小，临时文件占用的磁盘不会超过字节上限
+    超出限制时排队等待（最多queue_timeout秒），超时或queue_timeout为0时抛出AdmissionRejected
+    """
+
+    def __init__(
+        self,
+        max_transfers: int = ADMISSION_MAX_TRANSFERS,
+        max_bytes: int = ADMISSION_MAX_BYTES,
+        token_max_transfers: int = ADMISSION_TOKEN_MAX_TRANSFERS,
+        token_max_bytes: int = ADMISSION_TOKEN_MAX_BYTES,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        retry_after: int = ADMISSION_RETRY_AFTER
+    ):
+        self.max_transfers = max_transfers
+        self.max_bytes = max_bytes
+        self.token_max_transfers = token_max_transfers
+        self.token_max_bytes = token_max_bytes
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._transfers = 0
+        self._bytes = 0
+        self._per_token: Dict[str, List[int]] = {}
+        self._wakeup: Optional[asyncio.Future] = None
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _exceeds(limit: int, used: int, extra: int) -> bool:
+        return limit > 0 and used + extra > limit
+
+    def _clamp(self, nbytes: int) -> int:
+        """单个传输超过字节上限时按上限预留，只要没有其他传输就能执行"""
+        for limit in (self.max_bytes, self.token_max_bytes):
+            if limit > 0:
+                nbytes = min(nbytes, limit)
+        return max(nbytes, 0)
+
+    def _blocking_limit(self, key: str, nbytes: int) -> Optional[str]:
+        """返回阻止本次传输的限制，没有则返回None"""
+        transfers, used = self._per_token.get(key, (0, 0))
+        if self._exceeds(self.max_transfers, self._transfers, 1):
+            return f"全局传输数上限{self.max_transfers}"
+        if self._exceeds(self.max_bytes, self._bytes, nbytes):
+            return "全局传输字节上限"
+        if self._exceeds(self.token_max_transfers, transfers, 1):
+            return f"每个Token传输数上限{self.token_max_transfers}"
+        if self._exceeds(self.token_max_bytes, used, nbytes):
+            return "每个Token传输字节上限"
+        return None
+
+    def _release(self, key: str, transfers: int, nbytes: int) -> None:
+        self._transfers -= transfers
+        self._bytes -= nbytes
+        usage = self._per_token[key]
+        usage[0] -= transfers
+        usage[1] -= nbytes
+        if usage[0] == 0:
+            del self._per_token[key]
+        # 唤醒所有等待者重新检查限制
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def _wakeup_future(self) -> asyncio.Future:
+        # Future绑定到当前事件循环
+        loop = asyncio.get_running_loop()
+        if self._wakeup is None or self._wakeup.done() or self._wakeup.get_loop() is not loop:
+            self._wakeup = loop.create_future()
+        return self._wakeup
+
+    def _reject(self, reason: str) -> None:
+        self.rejected += 1
+        record_error("admission")
+        raise AdmissionRejected(f"服务繁忙，已达{reason}，请{self.retry_after}秒后重试", self.retry_after)
+
+    async def acquire(self, key: str, nbytes: int, queue_timeout: Optional[float] = None) -> Reservation:
+        """
+        占用一个传输名额并预留nbytes字节，返回的Reservation需要调用release()
+        queue_timeout为None时使用默认排队时间，为math.inf时一直等待
+        """
+        nbytes = self._clamp(nbytes)
+        reason = self._blocking_limit(key, nbytes)
+        if reason is not None:
+            timeout = self.queue_timeout if queue_timeout is None else queue_timeout
+            if timeout <= 0:
+                self._reject(reason)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            self.waiting += 1
+            try:
+                with observe_phase("admission_wait"):
+                    while reason is not None:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            self._reject(reason)
+                        try:
+                            await asyncio.wait_for(
+                                asyncio.shield(self._wakeup_future()),
+                                None if math.isinf(remaining) else remaining
+                            )
+                        except asyncio.TimeoutError:
+                            pass
+                        reason = self._blocking_limit(key, nbytes)
+            finally:
+                self.waiting -= 1
+
+        self._transfers += 1
+        self._bytes += nbytes
+        usage = self._per_token.setdefault(key, [0, 0])
+        usage[0] += 1
+        usage[1] += nbytes
+        self.admitted += 1
+        return Reservation(self, key, nbytes)
+
+    @asynccontextmanager
+    async def admit(self, key: str, nbytes: int, queue_timeout: Optional[float] = None) -> AsyncIterator[Reservation]:
+        """在代码块执行期间占用名额，代码块内的FileService可通过shrink_reservation缩小预留"""
+        reservation = await self.acquire(key, nbytes, queue_timeout)
+        context_token = _current.set(reservation)
+        try:
+            yield reservation
+        finally:
+            _current.reset(context_token)
+            reservation.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transfers": self._transfers,
+            "bytes": self._bytes,
+            "tokens": len(self._per_token),
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI中间件：在读取请求体之前对指定路径进行认证和准入控制
+    FastAPI在解析完multipart表单（写入临时文件）后才执行路由函数，直接上传需要在此处拦截
+    先验证Authorization头中的Token（结果写入Token缓存，路由中的验证直接命中），
+    无效时返回401，不占用名额也不读取请求体；有效时按Content-Length预留字节，按Token区分调用方
+    请求体超过max_body_size时返回413：Content-Length超限时直接拒绝，
+    分块传输（或Content-Length不实）时在读取到的字节数超限时中止，框架不会把超限的请求体写入临时文件
+    """
+
+    def __init__(
+        self,
+        app,
+        paths: Iterable[str],
+        controller: Optional[AdmissionController] = None,
+        authenticate: Optional[Callable[[str], Awaitable[Optional[Dict[str, Any]]]]] = None,
+        max_body_size: int = MAX_FILE_SIZE + DIRECT_UPLOAD_FORM_OVERHEAD
+    ):
+        self.app = app
+        self.paths = set(paths)
+        self.controller = controller or admission
+        self.authenticate = authenticate or authenticate_token
+        self.max_body_size = max_body_size
+
+    def _too_large(self) -> str:
+        return f"请求体超过限制：{self.max_body_size}字节"
+
+    def _limit_body(self, receive):
+        """包装receive，累计请求体字节数，超过上限时抛出413（由路由的异常处理返回响应）"""
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    record_error("size_limit")
+                    raise HTTPException(status_code=413, detail=self._too_large())
+            return message
+
+        return limited_receive
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length", b"").decode("latin-1")
+        nbytes = int(content_length) if content_length.isdigit() else MAX_FILE_SIZE
+        if content_length.isdigit() and nbytes > self.max_body_size:
+            record_error("size_limit")
+            response = JSONResponse(status_code=413, content={"detail": self._too_large()})
+            await response(scope, receive, send)
+            return
+        scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+        token = token.strip()
+
+        token_data = await self.authenticate(token) if scheme.lower() == "bearer" and token else None
+        if token_data is None:
+            record_error("unauthorized")
+            response = JSONResponse(
+                status_code=401,
+                content={"detail": "无效的认证凭据"},
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            reservation = await self.controller.acquire(token_key(token_data.get("token", token)), nbytes)
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": str(e)},
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        started = False
+
+        async def send_tracking(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, self._limit_body(receive), send_tracking)
+        except HTTPException as e:
+            # 请求体在路由之外被读取（未经路由的异常处理）时，在此返回413
+            if e.status_code != 413 or started:
+                raise
+            response = JSONResponse(status_code=413, content={"detail": e.detail})
+            await response(scope, receive, send)
+        finally:
+            reservation.release()
+
+
+# 进程级单例
+admission = AdmissionController()
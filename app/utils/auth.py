@@ -1,29 +1,66 @@
-from fastapi import Request, HTTPException, Depends
+import secrets
+from fastapi import Request, HTTPException, Depends, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional, Dict, Any
 
-from .token_service import TokenService
+from .token_service import TokenService, get_token_service
+from .token_cache import token_cache, hash_token
+from .singleflight import SingleFlight
+from .metrics import observe_phase, record_error
+from .tracing import span
+from .config import ADMIN_TOKEN
 
 # 定义安全模型
 security = HTTPBearer()
 
+# 合并同一Token的并发验证请求，突发的并行上传只会向青流发起一次查询
+token_validations = SingleFlight()
+
 
 async def get_current_token(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    token_service: TokenService = Depends(get_token_service)
 ) -> Dict[str, Any]:
     """
     依赖项函数，用于验证请求中的Token
     """
-    token_service = TokenService()
-    token = credentials.credentials
-    
-    is_valid, token_data, _ = await token_service.validate_token(token)
+    token_data = await authenticate(credentials.credentials, token_service)
     
-    if not is_valid or not token_data:
+    if token_data is None:
+        record_error("unauthorized")
         raise HTTPException(
             status_code=401,
             detail="无效的认证凭据",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return token_data
\ No newline at end of file
+    return token_data
+
+
+async def authenticate(token: str, token_service: Optional[TokenService] = None) -> Optional[Dict[str, Any]]:
+    """
+    验证Token，有效时返回Token数据，否则返回None
+    优先使用缓存的验证结果，同一Token的并发验证合并为一次查询
+    """
+    cached = token_cache.get(token)
+    if cached is not None:
+        is_valid, token_data = cached
+    else:
+        is_valid, token_data = await token_validations.do(
+            hash_token(token), lambda: _validate_and_cache(token, token_service or get_token_service())
+        )
+    return token_data if is_valid and token_data else None
+
+
+async def _validate_and_cache(token: str, token_service: TokenService):
+    with observe_phase("auth"), span("auth.validate", "auth"):
+        is_valid, token_data, _ = await token_service.validate_token(token)
+    token_cache.set(token, is_valid, token_data)
+    return is_valid, token_data
+
+
+async def verify_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    """管理端点鉴权：配置了ADMIN_TOKEN时要求X-Admin-Token请求头与之一致"""
+    if ADMIN_TOKEN and not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        record_error("unauthorized")
+        raise HTTPException(status_code=403, detail="无效的管理令牌")
@@ -0,0 +1,88 @@
+import time
+from typing import Awaitable, Callable, Optional
+
+from .config import (
+    DOWNLOAD_CHUNK_ADAPTIVE,
+    DOWNLOAD_CHUNK_MIN_SIZE,
+    DOWNLOAD_CHUNK_MAX_SIZE,
+    DOWNLOAD_CHUNK_INTERVAL,
+)
+
+
+class ChunkSizer:
+    """
+    根据观测到的下载吞吐量选择批量写入的大小：每批约为interval秒内收到的数据量，
+    取2的幂并限制在[min_size, max_size]之间；关闭自适应时固定为min_size
+    吞吐量越高批次越大，写入、哈希和进度回调的次数越少；慢速下载仍能及时上报进度
+    """
+
+    def __init__(
+        self,
+        min_size: int = DOWNLOAD_CHUNK_MIN_SIZE,
+        max_size: int = DOWNLOAD_CHUNK_MAX_SIZE,
+        interval: float = DOWNLOAD_CHUNK_INTERVAL,
+        adaptive: bool = DOWNLOAD_CHUNK_ADAPTIVE
+    ):
+        self.min_size = max(min_size, 1)
+        self.max_size = max(max_size, self.min_size)
+        self.interval = interval
+        self.adaptive = adaptive
+        self.size = self.min_size
+
+    def observe(self, nbytes: int, elapsed: float) -> None:
+        """记录一批数据（nbytes字节，耗时elapsed秒），调整下一批的大小"""
+        if not self.adaptive:
+            return
+        target = nbytes / elapsed * self.interval if elapsed > 0 else self.max_size
+        size = self.min_size
+        while size < target and size < self.max_size:
+            size *= 2
+        self.size = min(size, self.max_size)
+
+
+class ChunkBuffer:
+    """
+    可复用的bytearray写缓冲：把网络读到的小块拼成ChunkSizer决定的批次，再一次性交给flush
+    flush为协程函数（通常把写文件和哈希交给线程池），收到的是缓冲区的memoryview，
+    只在await期间有效，不能保存；flush完成前不会修改缓冲区
+    缓冲区为空且收到的块已不小于批次大小时直接转交，不经过缓冲区
+    """
+
+    def __init__(self, flush: Callable[[memoryview], Awaitable[None]], sizer: Optional[ChunkSizer] = None):
+        self.sizer = sizer or ChunkSizer()
+        self._flush = flush
+        self._buffer = bytearray(self.sizer.size)
+        self._view = memoryview(self._buffer)
+        self._length = 0
+        self._last_flush = time.perf_counter()
+
+    async def write(self, data: bytes) -> None:
+        data = memoryview(data)
+        while data:
+            if self._length == 0 and len(data) >= self.sizer.size:
+                await self._emit(data)
+                return
+            n = min(len(data), self.sizer.size - self._length)
+            self._view[self._length:self._length + n] = data[:n]
+            self._length += n
+            data = data[n:]
+            if self._length >= self.sizer.size:
+                await self.flush()
+
+    async def flush(self) -> None:
+        """写出缓冲区中的数据；下载结束时必须调用"""
+        if self._length:
+            length = self._length
+            self._length = 0
+            await self._emit(self._view[:length])
+
+    async def _emit(self, view: memoryview) -> None:
+        await self._flush(view)
+        now = time.perf_counter()
+        self.sizer.observe(len(view), now - self._last_flush)
+        self._last_flush = now
+        if self.sizer.size > len(self._buffer):
+            # 批次变大时换用更大的缓冲区（旧缓冲区仍被view引用，不能原地扩容）
+            self._view.release()
+            self._buffer = bytearray(self.sizer.size)
+            self._view = memoryview(self._buffer)
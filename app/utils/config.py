@@ -5,10 +5,17 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # 青流平台API配置
-QINGFLOW_API_BASE_URL = "https://api.qingflow.com"
-QINGFLOW_APP_ID = "aqddbt0obk02"
+QINGFLOW_API_BASE_URL = os.getenv("QINGFLOW_API_BASE_URL", "https://api.qingflow.com")
+QINGFLOW_APP_ID = os.getenv("QINGFLOW_APP_ID", "aqddbt0obk02")
 QINGFLOW_ACCESS_TOKEN = os.getenv("QINGFLOW_ACCESS_TOKEN", "72e12c93-debd-4def-a6ff-708c671425c9")
 
+# 青流平台HTTP连接池配置
+QINGFLOW_HTTP_TIMEOUT = float(os.getenv("QINGFLOW_HTTP_TIMEOUT", "30"))
+QINGFLOW_HTTP_MAX_CONNECTIONS = int(os.getenv("QINGFLOW_HTTP_MAX_CONNECTIONS", "100"))
+QINGFLOW_HTTP_MAX_KEEPALIVE = int(os.getenv("QINGFLOW_HTTP_MAX_KEEPALIVE", "20"))
+QINGFLOW_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("QINGFLOW_HTTP_KEEPALIVE_EXPIRY", "60"))
+QINGFLOW_HTTP2 = os.getenv("QINGFLOW_HTTP2", "true").lower() == "true"
+
 # 青流平台字段ID
 FIELD_ID_MAP = {
     "id": "360860723",
@@ -23,8 +30,110 @@ FIELD_ID_MAP = {
 
 # 应用配置
 MAX_FILE_SIZE = 200 * 1024 * 1024  # 200MB
+DIRECT_UPLOAD_FORM_OVERHEAD = int(os.getenv("DIRECT_UPLOAD_FORM_OVERHEAD", str(1024 * 1024)))  # 直接上传的请求体中除文件内容外（表单字段、分隔符）允许的字节数
 API_VERSION = "v1"
 SERVICE_NAME = "r2-uploader"
 
+# R2上传线程池配置
+UPLOAD_EXECUTOR_WORKERS = int(os.getenv("UPLOAD_EXECUTOR_WORKERS", "8"))  # 同时执行的上传数
+UPLOAD_EXECUTOR_MAX_PENDING = int(os.getenv("UPLOAD_EXECUTOR_MAX_PENDING", "64"))  # 执行中和排队中的任务上限
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "16"))  # 临时文件读写、哈希、签名等本地短任务的线程数
+IO_EXECUTOR_MAX_PENDING = int(os.getenv("IO_EXECUTOR_MAX_PENDING", "256"))  # 本地短任务执行中和排队中的上限
+
+# 源文件下载配置
+DOWNLOAD_HTTP_TIMEOUT = float(os.getenv("DOWNLOAD_HTTP_TIMEOUT", "60"))
+DOWNLOAD_HTTP_MAX_CONNECTIONS = int(os.getenv("DOWNLOAD_HTTP_MAX_CONNECTIONS", "200"))
+DOWNLOAD_HTTP_MAX_KEEPALIVE = int(os.getenv("DOWNLOAD_HTTP_MAX_KEEPALIVE", "50"))
+DOWNLOAD_RANGE_CONCURRENCY = int(os.getenv("DOWNLOAD_RANGE_CONCURRENCY", "4"))  # 分段并行下载的连接数，1表示禁用
+DOWNLOAD_RANGE_MIN_SIZE = int(os.getenv("DOWNLOAD_RANGE_MIN_SIZE", str(16 * 1024 * 1024)))  # 超过该大小才分段下载
+DOWNLOAD_CHUNK_ADAPTIVE = os.getenv("DOWNLOAD_CHUNK_ADAPTIVE", "true").lower() == "true"  # 根据下载吞吐量调整批量写入大小，关闭时固定为最小值
+DOWNLOAD_CHUNK_MIN_SIZE = int(os.getenv("DOWNLOAD_CHUNK_MIN_SIZE", str(64 * 1024)))  # 批量写入临时文件的最小（初始）字节数
+DOWNLOAD_CHUNK_MAX_SIZE = int(os.getenv("DOWNLOAD_CHUNK_MAX_SIZE", str(4 * 1024 * 1024)))  # 批量写入的最大字节数，即每个下载连接的写缓冲区上限
+DOWNLOAD_CHUNK_INTERVAL = float(os.getenv("DOWNLOAD_CHUNK_INTERVAL", "0.05"))  # 自适应模式下每批数据对应的下载秒数
+SPOOL_DIR = os.getenv("SPOOL_DIR") or None  # 下载临时文件的目录（如tmpfs挂载点），未设置时使用系统临时目录
+SPOOL_MIN_FREE_BYTES = int(os.getenv("SPOOL_MIN_FREE_BYTES", str(256 * 1024 * 1024)))  # 下载开始前临时目录需保留的最小剩余空间
+
+# 流式上传配置
+UPLOAD_STREAMING_DEFAULT = os.getenv("UPLOAD_STREAMING_DEFAULT", "false").lower() == "true"  # URL上传默认是否使用流式模式
+
+# 内容去重配置
+UPLOAD_DEDUP_DEFAULT = os.getenv("UPLOAD_DEDUP_DEFAULT", "false").lower() == "true"  # 未指定dedup时是否默认开启去重
+
+# 源文件条件请求缓存（URL -> ETag/Last-Modified和已上传的目标对象）
+SOURCE_CACHE_MAX_SIZE = int(os.getenv("SOURCE_CACHE_MAX_SIZE", "1000"))  # 0表示禁用缓存
+SOURCE_CACHE_TTL = float(os.getenv("SOURCE_CACHE_TTL", "3600"))  # 缓存条目的有效秒数
+
+# 分片上传配置（可被单个请求覆盖）
+MULTIPART_THRESHOLD = int(os.getenv("MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))  # 超过该大小使用分片上传
+MULTIPART_PART_SIZE = int(os.getenv("MULTIPART_PART_SIZE", str(8 * 1024 * 1024)))  # 默认分片大小，不小于5MB
+MULTIPART_CONCURRENCY = int(os.getenv("MULTIPART_CONCURRENCY", "4"))  # 默认同时上传的分片数
+MULTIPART_MAX_CONCURRENCY = int(os.getenv("MULTIPART_MAX_CONCURRENCY", "16"))  # 请求可指定的最大分片并发数
+MULTIPART_ADAPTIVE_PART_SIZE = os.getenv("MULTIPART_ADAPTIVE_PART_SIZE", "true").lower() == "true"  # 根据文件大小自动选择分片大小
+MULTIPART_TARGET_PARTS = int(os.getenv("MULTIPART_TARGET_PARTS", "16"))  # 自适应模式下的目标分片数
+MULTIPART_MAX_PART_SIZE = int(os.getenv("MULTIPART_MAX_PART_SIZE", str(64 * 1024 * 1024)))  # 最大分片大小和分片阈值（含自适应选择和请求指定的值）
+UPLOAD_MMAP_ENABLED = os.getenv("UPLOAD_MMAP_ENABLED", "true").lower() == "true"  # 临时文件上传到S3时通过mmap直接发送分片，不经过中间bytes副本
+
+# 准入控制配置（每个worker进程独立计数，0表示不限制）
+ADMISSION_MAX_TRANSFERS = int(os.getenv("ADMISSION_MAX_TRANSFERS", "32"))  # 同时进行的传输数
+ADMISSION_MAX_BYTES = int(os.getenv("ADMISSION_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))  # 进行中传输占用的字节数
+ADMISSION_TOKEN_MAX_TRANSFERS = int(os.getenv("ADMISSION_TOKEN_MAX_TRANSFERS", "8"))  # 每个Token同时进行的传输数
+ADMISSION_TOKEN_MAX_BYTES = int(os.getenv("ADMISSION_TOKEN_MAX_BYTES", str(1024 * 1024 * 1024)))  # 每个Token进行中传输占用的字节数
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))  # 超出限制时排队等待的秒数，0表示立即返回429
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))  # 429响应中Retry-After的秒数
+
+# 存储后端配置
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3")  # 存储后端：s3（R2）、local（本地文件系统）或memory（进程内存，用于测试）
+STORAGE_LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT", "/tmp/r2-uploader-storage")  # local后端的根目录，对象保存在{根目录}/{bucket}/{key}
+
+# 预签名上传配置
+PRESIGN_EXPIRES = int(os.getenv("PRESIGN_EXPIRES", "3600"))  # 预签名URL默认有效秒数
+PRESIGN_MAX_EXPIRES = int(os.getenv("PRESIGN_MAX_EXPIRES", str(7 * 24 * 3600)))  # 请求可指定的最大有效秒数（SigV4上限为7天）
+
+# 批量上传配置
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))  # 单次批量请求的最大文件数
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # 默认同时处理的文件数
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))  # 请求可指定的最大并发数
+
+# 异步任务配置
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # 每个worker进程中并行执行的任务数
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "100"))  # 排队任务上限，超出返回429
+JOB_STORE = os.getenv("JOB_STORE", "sqlite")  # 任务存储：sqlite（多worker共享）或memory（仅限单worker）
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "/tmp/r2-uploader-jobs.db")  # SQLite任务存储路径
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", str(24 * 3600)))  # 任务结果保留秒数
+JOB_PURGE_INTERVAL = float(os.getenv("JOB_PURGE_INTERVAL", "600"))  # 清理过期任务的间隔秒数
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "1"))  # 进度写入存储的间隔秒数
+JOB_SHUTDOWN_GRACE = float(os.getenv("JOB_SHUTDOWN_GRACE", "50"))  # 关闭时等待进行中任务的秒数，应小于gunicorn的--graceful-timeout
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # 任务因worker回收或退出被中断后，最多执行的次数
+JOB_ADOPT_INTERVAL = float(os.getenv("JOB_ADOPT_INTERVAL", "2"))  # 领取其他worker交还的任务的轮询间隔秒数
+JOB_SPEC_KEY = os.getenv("JOB_SPEC_KEY", "")  # 加密保存任务参数的Fernet密钥，为空时由gunicorn主进程启动时生成
+JOB_WEBHOOK_TIMEOUT = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "10"))  # webhook回调超时秒数
+
+# S3客户端缓存配置
+S3_CLIENT_CACHE_MAX_SIZE = int(os.getenv("S3_CLIENT_CACHE_MAX_SIZE", "64"))  # 0表示禁用缓存
+S3_CLIENT_CACHE_IDLE_TTL = float(os.getenv("S3_CLIENT_CACHE_IDLE_TTL", "600"))  # 客户端空闲多少秒后淘汰
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "20"))  # 每个客户端的连接池大小
+
+# Token验证缓存配置
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))  # 0表示禁用缓存
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))  # 有效Token的缓存秒数
+TOKEN_CACHE_NEGATIVE_TTL = float(os.getenv("TOKEN_CACHE_NEGATIVE_TTL", "30"))  # 无效Token的缓存秒数
+
+# 本地Token索引配置
+TOKEN_STORE_ENABLED = os.getenv("TOKEN_STORE_ENABLED", "false").lower() == "true"  # 是否启用本地Token索引
+TOKEN_STORE_SYNC_INTERVAL = float(os.getenv("TOKEN_STORE_SYNC_INTERVAL", "60"))  # 后台同步间隔秒数
+TOKEN_STORE_MAX_STALENESS = float(os.getenv("TOKEN_STORE_MAX_STALENESS", "3600"))  # 同步失败时索引仍可使用的秒数
+TOKEN_STORE_PAGE_SIZE = int(os.getenv("TOKEN_STORE_PAGE_SIZE", "200"))  # 同步时每页拉取的记录数
+
+# 请求追踪配置
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"  # 是否输出OpenTelemetry span（需要安装opentelemetry）
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"  # 是否在响应中返回Server-Timing头
+
+# 事件循环诊断配置
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "false").lower() == "true"  # 是否采样事件循环延迟并检测阻塞调用
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))  # 采样间隔秒数
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))  # 事件循环被阻塞超过该秒数时记录调用栈
+LOOP_MONITOR_HISTORY = int(os.getenv("LOOP_MONITOR_HISTORY", "3000"))  # 用于计算分位数的最近样本数
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # 管理端点的访问令牌（X-Admin-Token请求头），未设置时不校验
+
 # 日志配置
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
\ No newline at end of file
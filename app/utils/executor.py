@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .config import (
+    UPLOAD_EXECUTOR_WORKERS,
+    UPLOAD_EXECUTOR_MAX_PENDING,
+    IO_EXECUTOR_WORKERS,
+    IO_EXECUTOR_MAX_PENDING,
+)
+
+
+class BoundedExecutor:
+    """
+    有界线程池，用于执行boto3等阻塞调用，避免阻塞事件循环
+    同时执行和排队的任务总数不超过max_pending，超出时调用方异步等待（背压）
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, thread_name_prefix: str):
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.thread_name_prefix = thread_name_prefix
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=self.thread_name_prefix
+            )
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # 信号量绑定到当前事件循环
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_pending)
+            self._loop = loop
+        return self._slots
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """在线程池中执行阻塞函数并等待结果，函数在调用方的contextvars上下文中执行（span的父子关系）"""
+        async with self._get_slots():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(),
+                functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+            )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# R2上传专用线程池
+upload_executor = BoundedExecutor(
+    max_workers=UPLOAD_EXECUTOR_WORKERS,
+    max_pending=UPLOAD_EXECUTOR_MAX_PENDING,
+    thread_name_prefix="r2-upload"
+)
+
+# 本地短任务专用线程池：下载写入临时文件、哈希、创建S3客户端和签名等
+# 与upload_executor分开，整个文件上传期间占用的R2上传线程不会阻塞其他传输的磁盘写入
+io_executor = BoundedExecutor(
+    max_workers=IO_EXECUTOR_WORKERS,
+    max_pending=IO_EXECUTOR_MAX_PENDING,
+    thread_name_prefix="local-io"
+)
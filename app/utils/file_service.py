@@ -1,71 +1,473 @@
 import httpx
 import asyncio
-import boto3
-import uuid
-import tempfile
+import hashlib
+import logging
+import threading
+import time
 import os
-from typing import Dict, Any, Tuple, BinaryIO, IO
+from typing import Dict, Any, Tuple, BinaryIO, IO, Optional, Callable, Awaitable
+from urllib.parse import urlsplit
 from botocore.exceptions import ClientError
 from fastapi import UploadFile
 
-from .config import MAX_FILE_SIZE
+from .config import (
+    SERVICE_NAME,
+    MAX_FILE_SIZE,
+    DOWNLOAD_RANGE_CONCURRENCY,
+    DOWNLOAD_RANGE_MIN_SIZE,
+    UPLOAD_STREAMING_DEFAULT,
+    UPLOAD_DEDUP_DEFAULT,
+)
+from .http_client import get_download_client
+from .executor import upload_executor, io_executor
+from .s3_client_cache import s3_client_cache
+from .multipart_upload import MultipartUploader
+from .storage import StorageBackend, S3Backend, shared_storage_backend
+from .source_cache import source_cache, source_validators, conditional_headers
+from .admission import shrink_reservation
+from .spool import spool, SpoolFull
+from .chunk_buffer import ChunkBuffer
+from .metrics import observe_phase, record_error, PHASE_SECONDS, TRANSFER_BYTES, TRANSFERS_IN_FLIGHT
+from .tracing import span
+from .transfer_settings import TransferSettings
+
+logger = logging.getLogger(SERVICE_NAME)
+
+# 进度回调：(阶段, 已传输字节数, 总字节数)，阶段为downloading/uploading/streaming
+ProgressCallback = Callable[[str, int, Optional[int]], None]
+
+# 去重模式下写入对象元数据（x-amz-meta-sha256）的内容哈希
+CONTENT_HASH_METADATA_KEY = "sha256"
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class _RangeNotSupported(Exception):
+    """源站未按Range请求返回206片段"""
+
+
+class _SourceNotModified(Exception):
+    """源文件与缓存的校验值一致（HEAD校验值未变化或条件GET返回304）"""
 
 
 class FileService:
-    def __init__(self):
+    def __init__(self, storage: Optional[StorageBackend] = None):
         self.max_file_size = MAX_FILE_SIZE
+        # 批量上传时由调用方传入同一个存储后端，整批复用
+        self.storage = storage
+
+    async def get_storage(self, endpoint: str, access_key_id: str, secret_access_key: str) -> StorageBackend:
+        """
+        获取存储后端：STORAGE_BACKEND为s3时使用请求凭据对应的缓存S3客户端（创建较慢，在线程池中执行），
+        为local或memory时使用进程级后端
+        """
+        if self.storage is not None:
+            return self.storage
+        shared = shared_storage_backend()
+        if shared is not None:
+            return shared
+        s3_client = await io_executor.run(
+            s3_client_cache.get_client, endpoint, access_key_id, secret_access_key
+        )
+        return S3Backend(s3_client)
+
+    @staticmethod
+    def _build_public_url(endpoint: str, bucket_name: str, object_key: str, custom_domain: str) -> str:
+        """构建对象的公共URL"""
+        if custom_domain:
+            # 使用自定义域名
+            return f"{custom_domain.rstrip('/')}/{object_key}"
+        # 使用默认R2 URL
+        return f"{endpoint.rstrip('/')}/{bucket_name}/{object_key}"
+
+    @staticmethod
+    def _upload_fileobj_sync(
+        storage: StorageBackend,
+        file: BinaryIO,
+        content_type: str,
+        bucket_name: str,
+        object_key: str,
+        transfer_settings: Optional[TransferSettings] = None,
+        progress: Optional[ProgressCallback] = None,
+        metadata: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Optional[str]]:
+        """
+        阻塞式上传文件对象到存储后端，返回(文件大小, 对象的ETag)
+        只应通过upload_executor在线程池中调用
+        """
+        # 确保获取文件大小
+        file.seek(0, os.SEEK_END)
+        file_size = file.tell()
+        file.seek(0)
+        
+        # 根据文件大小确定分片参数
+        settings = (transfer_settings or TransferSettings()).resolve(file_size)
+        
+        callback: Optional[Callable[[int], None]] = None
+        if progress is not None:
+            uploaded = 0
+            lock = threading.Lock()
+            
+            # 存储后端（如boto3）可能在多个传输线程中回调每次新增的字节数
+            def report_uploaded(bytes_amount: int) -> None:
+                nonlocal uploaded
+                with lock:
+                    uploaded += bytes_amount
+                    progress("uploading", uploaded, file_size)
+            
+            callback = report_uploaded
+        
+        # 上传文件
+        etag = storage.upload_file(bucket_name, object_key, file, file_size, content_type, settings, callback, metadata)
+        return file_size, etag
+
+    @staticmethod
+    def _hash_fileobj_sync(file: IO[bytes], hasher: Optional[Any] = None) -> Any:
+        """
+        从头读取文件对象更新SHA-256哈希，完成后回到文件开头
+        只应通过io_executor在线程池中调用
+        """
+        if hasher is None:
+            hasher = hashlib.sha256()
+        file.seek(0)
+        while True:
+            chunk = file.read(_HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+        file.seek(0)
+        return hasher
+
+    @staticmethod
+    def _object_matches_sync(
+        storage: StorageBackend,
+        bucket_name: str,
+        object_key: str,
+        content_hash: str,
+        content_type: str
+    ) -> bool:
+        """
+        通过HeadObject判断R2中的同名对象是否与待上传内容一致（元数据中的SHA-256和内容类型相同）
+        对象不存在或无法查询时返回False，按正常流程上传
+        """
+        try:
+            head = storage.head_object(bucket_name, object_key)
+        except Exception as e:
+            logger.warning(f"去重检查失败，继续上传: {object_key}: {str(e)}")
+            return False
+        return (
+            head is not None
+            and head["metadata"].get(CONTENT_HASH_METADATA_KEY) == content_hash
+            and head["content_type"] == content_type
+        )
+
+    @staticmethod
+    async def _abort_upload(uploader: Optional[MultipartUploader]) -> None:
+        """中止未完成的分片上传"""
+        if uploader is not None:
+            await uploader.abort()
+
+    @staticmethod
+    def _remove_temp_file_sync(file: IO[bytes]) -> None:
+        """关闭并删除临时文件"""
+        file.close()
+        if hasattr(file, 'name') and os.path.exists(file.name):
+            os.unlink(file.name)
+
+    @staticmethod
+    def _rewind_sync(file: IO[bytes], truncate: bool = False) -> None:
+        """刷新临时文件并回到开头，truncate为True时清空内容"""
+        file.flush()
+        file.seek(0)
+        if truncate:
+            file.truncate()
+
+    async def _write_response(
+        self,
+        response: httpx.Response,
+        temp_file: IO[bytes],
+        progress: Optional[ProgressCallback] = None,
+        hasher: Optional[Any] = None
+    ) -> int:
+        """
+        把响应体写入临时文件，返回文件大小；传入hasher时边下载边计算哈希
+        网络读到的数据先拼入可复用的缓冲区，按吞吐量自适应的批次写入文件、更新哈希和上报进度
+        """
+        file_size = 0
+        written = 0
+        
+        content_length = response.headers.get("content-length")
+        total_bytes = int(content_length) if content_length and content_length.isdigit() else None
+        
+        def write_sync(view: memoryview) -> None:
+            temp_file.write(view)
+            if hasher is not None:
+                hasher.update(view)
+        
+        async def flush(view: memoryview) -> None:
+            nonlocal written
+            # 写文件和计算哈希（每批最多数MB）在本地I/O线程池中执行，不阻塞事件循环，也不占用R2上传线程
+            with span("spool.write", offset=written, size=len(view)):
+                await io_executor.run(write_sync, view)
+            written += len(view)
+            if progress is not None:
+                progress("downloading", written, total_bytes)
+        
+        buffer = ChunkBuffer(flush)
+        async for chunk in response.aiter_bytes():
+            file_size += len(chunk)
+            
+            # 检查文件大小是否超过限制
+            if file_size > self.max_file_size:
+                raise ValueError(f"文件大小超过限制：{file_size} > {self.max_file_size}")
+            
+            await buffer.write(chunk)
+        await buffer.flush()
+        
+        return file_size
+
+    async def _download_stream(
+        self,
+        client: httpx.AsyncClient,
+        file_url: str,
+        temp_file: IO[bytes],
+        progress: Optional[ProgressCallback] = None,
+        hasher: Optional[Any] = None
+    ) -> int:
+        """重新发起单连接流式下载到临时文件（分段下载失败时回退），返回文件大小"""
+        async with client.stream("GET", file_url) as response:
+            response.raise_for_status()
+            return await self._write_response(response, temp_file, progress, hasher)
+
+    @staticmethod
+    def _pwriter(
+        fd: int,
+        offset: int,
+        on_chunk: Optional[Callable[[int], None]] = None
+    ) -> Callable[[memoryview], Awaitable[None]]:
+        """返回ChunkBuffer的写出函数：从offset开始依次写入文件中对应的位置（在本地I/O线程池中执行）"""
+        async def flush(view: memoryview) -> None:
+            nonlocal offset
+            with span("spool.write", offset=offset, size=len(view)):
+                await io_executor.run(os.pwrite, fd, view, offset)
+            offset += len(view)
+            if on_chunk is not None:
+                on_chunk(len(view))
+        return flush
 
-    async def download_file(self, file_url: str) -> Tuple[BinaryIO, str, int]:
+    @staticmethod
+    async def _download_range(
+        client: httpx.AsyncClient,
+        file_url: str,
+        fd: int,
+        start: int,
+        end: int,
+        etag: Optional[str],
+        on_chunk: Optional[Callable[[int], None]] = None
+    ) -> None:
+        """下载[start, end]字节区间，直接写入临时文件中对应的位置"""
+        headers = {"Range": f"bytes={start}-{end}"}
+        if etag:
+            # 源文件变化时服务器返回完整内容，而不是错位的片段
+            headers["If-Range"] = etag
+        
+        with span("source.range", start=start, end=end):
+            async with client.stream("GET", file_url, headers=headers) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise _RangeNotSupported()
+                
+                offset = start
+                buffer = ChunkBuffer(FileService._pwriter(fd, start, on_chunk))
+                async for chunk in response.aiter_bytes():
+                    if offset + len(chunk) > end + 1:
+                        raise _RangeNotSupported()
+                    await buffer.write(chunk)
+                    offset += len(chunk)
+                await buffer.flush()
+                
+                if offset != end + 1:
+                    raise Exception(f"分段下载不完整: bytes={start}-{end}, 实际收到{offset - start}字节")
+
+    @staticmethod
+    async def _read_first_range(
+        response: httpx.Response,
+        fd: int,
+        end: int,
+        on_chunk: Optional[Callable[[int], None]] = None
+    ) -> None:
+        """从已打开的完整GET响应中读取[0, end]字节区间，读够后不再读取剩余内容"""
+        with span("source.range", start=0, end=end):
+            offset = 0
+            buffer = ChunkBuffer(FileService._pwriter(fd, 0, on_chunk))
+            async for chunk in response.aiter_bytes():
+                chunk = chunk[:end + 1 - offset]
+                await buffer.write(chunk)
+                offset += len(chunk)
+                if offset > end:
+                    break
+            await buffer.flush()
+            
+            if offset != end + 1:
+                raise Exception(f"分段下载不完整: bytes=0-{end}, 实际收到{offset}字节")
+
+    async def _download_ranges(
+        self,
+        client: httpx.AsyncClient,
+        file_url: str,
+        temp_file: IO[bytes],
+        content_length: int,
+        etag: Optional[str],
+        concurrency: int,
+        progress: Optional[ProgressCallback] = None,
+        first_response: Optional[httpx.Response] = None
+    ) -> int:
+        """
+        并行分段下载：按Range请求把文件切成若干段同时下载，各段写入预分配文件中的对应位置
+        传入已打开的完整GET响应时，第一段直接从该响应读取，不再单独请求
+        服务器不支持分段时抛出_RangeNotSupported
+        """
+        # 预分配文件
+        await io_executor.run(temp_file.truncate, content_length)
+        fd = temp_file.fileno()
+        
+        received = 0
+        
+        def on_chunk(size: int) -> None:
+            nonlocal received
+            received += size
+            if progress is not None:
+                progress("downloading", received, content_length)
+        
+        range_size = -(-content_length // concurrency)
+        tasks = []
+        for start in range(0, content_length, range_size):
+            end = min(start + range_size, content_length) - 1
+            if start == 0 and first_response is not None:
+                coro = self._read_first_range(first_response, fd, end, on_chunk)
+            else:
+                coro = self._download_range(client, file_url, fd, start, end, etag, on_chunk)
+            tasks.append(asyncio.create_task(coro))
+        
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        return content_length
+
+    def _should_download_ranges(self, response: httpx.Response, ranged: Optional[bool]) -> bool:
+        """源站声明支持字节范围请求且文件足够大时使用分段下载"""
+        if ranged is False or DOWNLOAD_RANGE_CONCURRENCY <= 1:
+            return False
+        if response.headers.get("accept-ranges", "").lower() != "bytes":
+            return False
+        content_length = response.headers.get("content-length")
+        if not content_length or not content_length.isdigit() or int(content_length) == 0:
+            return False
+        # 显式要求分段下载时不检查最小文件大小
+        return ranged is True or int(content_length) >= DOWNLOAD_RANGE_MIN_SIZE
+
+    async def download_file(
+        self,
+        file_url: str,
+        ranged: Optional[bool] = None,
+        progress: Optional[ProgressCallback] = None,
+        hasher: Optional[Any] = None,
+        validators: Optional[Dict[str, str]] = None,
+        source_info: Optional[Dict[str, str]] = None
+    ) -> Tuple[BinaryIO, str, int]:
         """
         异步下载文件并返回临时文件对象、内容类型和文件大小
+        只发送一次GET，从响应头获取内容类型和大小，超过大小限制时提前关闭连接
+        响应头表明源站支持Range请求且文件较大时，其余部分改为多连接分段下载
+        传入hasher时用下载的内容更新哈希
+        传入上次上传时缓存的validators时发送条件GET，源文件未变化则抛出_SourceNotModified；
+        source_info中写入本次下载内容的ETag/Last-Modified
+        临时文件创建在SPOOL_DIR中，开始下载和得知Content-Length时检查剩余空间，不足时抛出SpoolFull
         """
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_file = await io_executor.run(spool.create_file)
         content_type = None
-        file_size = 0
+        file_size = None
+        downloaded_ranges = False
         
         try:
-            async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
-                # 发送HEAD请求获取文件大小和内容类型
-                head_response = await client.head(file_url)
-                head_response.raise_for_status()
+            client = get_download_client()
+            
+            connect_start = time.perf_counter()
+            async with client.stream("GET", file_url, headers=conditional_headers(validators)) as response:
+                # 源站响应头到达前的耗时
+                PHASE_SECONDS.labels("source_connect").observe(time.perf_counter() - connect_start)
+                if response.status_code == 304:
+                    raise _SourceNotModified()
+                response.raise_for_status()
                 
-                content_type = head_response.headers.get("content-type", "application/octet-stream")
+                # 源站不支持条件请求时，比较响应头中的校验值
+                response_validators = source_validators(response.headers)
+                if validators and response_validators == validators:
+                    raise _SourceNotModified()
+                if source_info is not None:
+                    source_info.update(response_validators or {})
+                
+                content_type = response.headers.get("content-type", "application/octet-stream")
                 
                 # 检查Content-Length头，如果存在则验证文件大小
-                content_length = head_response.headers.get("content-length")
+                content_length = response.headers.get("content-length")
                 if content_length and int(content_length) > self.max_file_size:
                     raise ValueError(f"文件大小超过限制：{int(content_length)} > {self.max_file_size}")
+                if content_length and content_length.isdigit():
+                    shrink_reservation(int(content_length))
+                    spool.ensure_space(temp_file, int(content_length))
                 
-                # 使用流式下载以支持大文件
-                async with client.stream("GET", file_url) as response:
-                    response.raise_for_status()
-                    
-                    async for chunk in response.aiter_bytes(chunk_size=8192):
-                        file_size += len(chunk)
-                        
-                        # 检查文件大小是否超过限制
-                        if file_size > self.max_file_size:
-                            temp_file.close()
-                            os.unlink(temp_file.name)
-                            raise ValueError(f"文件大小超过限制：{file_size} > {self.max_file_size}")
-                        
-                        temp_file.write(chunk)
-            
-            temp_file.flush()
-            temp_file.seek(0)
+                if self._should_download_ranges(response, ranged):
+                    try:
+                        file_size = await self._download_ranges(
+                            client,
+                            file_url,
+                            temp_file,
+                            int(content_length),
+                            response.headers.get("etag"),
+                            DOWNLOAD_RANGE_CONCURRENCY,
+                            progress,
+                            first_response=response
+                        )
+                        downloaded_ranges = True
+                    except _RangeNotSupported:
+                        # 已部分读取当前响应，回退时重新下载
+                        await io_executor.run(self._rewind_sync, temp_file, True)
+                else:
+                    file_size = await self._write_response(response, temp_file, progress, hasher)
+            
+            if file_size is None:
+                file_size = await self._download_stream(client, file_url, temp_file, progress, hasher)
+            elif downloaded_ranges and hasher is not None:
+                # 分段下载乱序写入，完成后再从临时文件计算哈希
+                await io_executor.run(temp_file.flush)
+                await io_executor.run(self._hash_fileobj_sync, temp_file, hasher)
+            
+            await io_executor.run(self._rewind_sync, temp_file)
             return temp_file, content_type, file_size
             
         except httpx.RequestError as e:
-            temp_file.close()
-            os.unlink(temp_file.name)
+            await io_executor.run(self._remove_temp_file_sync, temp_file)
+            record_error("source")
             raise Exception(f"下载文件时出错: {str(e)}")
-        except ValueError as e:
+        except ValueError:
+            await io_executor.run(self._remove_temp_file_sync, temp_file)
+            record_error("size_limit")
             # 重新抛出ValueError，用于文件大小验证
             raise
+        except (_SourceNotModified, SpoolFull):
+            await io_executor.run(self._remove_temp_file_sync, temp_file)
+            raise
         except Exception as e:
-            temp_file.close()
-            os.unlink(temp_file.name)
+            await io_executor.run(self._remove_temp_file_sync, temp_file)
+            record_error("source")
             raise Exception(f"处理文件时出错: {str(e)}")
+        finally:
+            spool.release(temp_file)
 
     async def upload_to_r2(
         self, 
@@ -76,134 +478,398 @@ class FileService:
         endpoint: str,
         access_key_id: str,
         secret_access_key: str,
-        custom_domain: str
+        custom_domain: str,
+        transfer_settings: Optional[TransferSettings] = None,
+        progress: Optional[ProgressCallback] = None,
+        content_hash: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         将文件上传到R2存储桶并返回公共URL
+        传入content_hash（SHA-256）时开启去重：R2中已有内容相同的同名对象则跳过上传
         """
         try:
-            # 创建S3客户端连接R2
-            s3_client = boto3.client(
-                service_name='s3',
-                endpoint_url=endpoint,
-                aws_access_key_id=access_key_id,
-                aws_secret_access_key=secret_access_key
-            )
-            
-            # 确保获取文件大小
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)
-            
-            # 上传文件
-            s3_client.upload_fileobj(
-                file,
-                bucket_name,
-                object_key,
-                ExtraArgs={
-                    'ContentType': content_type
-                }
-            )
+            # 获取存储后端，S3后端复用缓存的客户端及其到R2的连接
+            storage = await self.get_storage(endpoint, access_key_id, secret_access_key)
             
-            # 构建公共URL
-            if custom_domain:
-                # 使用自定义域名
-                public_url = f"{custom_domain.rstrip('/')}/{object_key}"
+            deduplicated = False
+            etag = None
+            if content_hash is not None:
+                with observe_phase("dedup_check"), span("r2.head_object", "r2", key=object_key):
+                    deduplicated = await upload_executor.run(
+                        self._object_matches_sync, storage, bucket_name, object_key, content_hash, content_type
+                    )
+            
+            if deduplicated:
+                file_size = await io_executor.run(lambda: file.seek(0, os.SEEK_END))
             else:
-                # 使用默认R2 URL
-                public_url = f"{endpoint.rstrip('/')}/{bucket_name}/{object_key}"
+                # 在专用线程池中上传，避免阻塞事件循环
+                file_size, etag = await upload_executor.run(
+                    self._upload_fileobj_sync,
+                    storage,
+                    file,
+                    content_type,
+                    bucket_name,
+                    object_key,
+                    transfer_settings,
+                    progress,
+                    {CONTENT_HASH_METADATA_KEY: content_hash} if content_hash is not None else None
+                )
+                TRANSFER_BYTES.labels("out").inc(file_size)
             
-            return {
+            # 构建公共URL
+            public_url = self._build_public_url(endpoint, bucket_name, object_key, custom_domain)
+            
+            result = {
                 "public_url": public_url,
                 "size": file_size,
                 "content_type": content_type
             }
+            if etag is not None:
+                result["etag"] = etag
+            if content_hash is not None:
+                result.update(deduplicated=deduplicated, sha256=content_hash)
+            return result
             
         except ClientError as e:
+            record_error("r2")
             raise Exception(f"上传到R2时出错: {str(e)}")
         except Exception as e:
+            record_error("r2")
             raise Exception(f"处理R2上传时出错: {str(e)}")
         finally:
             # 关闭并删除临时文件
-            file.close()
-            if hasattr(file, 'name') and os.path.exists(file.name):
-                os.unlink(file.name)
+            await io_executor.run(self._remove_temp_file_sync, file)
 
-    async def upload_file_directly(
-        self, 
-        upload_file: UploadFile,
-        bucket_name: str, 
+    async def stream_url_to_r2(
+        self,
+        file_url: str,
+        bucket_name: str,
         object_key: str,
         endpoint: str,
         access_key_id: str,
         secret_access_key: str,
-        custom_domain: str
+        custom_domain: str,
+        transfer_settings: Optional[TransferSettings] = None,
+        progress: Optional[ProgressCallback] = None,
+        validators: Optional[Dict[str, str]] = None,
+        source_info: Optional[Dict[str, str]] = None
     ) -> Dict[str, Any]:
         """
-        直接上传文件到R2存储桶并返回公共URL
+        流式模式：边下载边以分片上传到R2，不写临时文件
+        下载与上传重叠进行，内存中只保留有限个分片
+        传入validators时发送条件GET，源站返回304时抛出_SourceNotModified
         """
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
-        file_size = 0
+        uploader = None
         
         try:
-            # 将上传的文件保存到临时文件
-            content = await upload_file.read()
-            file_size = len(content)
-            
-            # 检查文件大小是否超过限制
-            if file_size > self.max_file_size:
-                raise ValueError(f"文件大小超过限制：{file_size} > {self.max_file_size}")
+            storage = await self.get_storage(endpoint, access_key_id, secret_access_key)
             
-            # 写入临时文件
-            temp_file.write(content)
-            temp_file.flush()
-            temp_file.seek(0)
-            
-            # 获取content_type
-            content_type = upload_file.content_type or "application/octet-stream"
-            
-            # 创建S3客户端连接R2
-            s3_client = boto3.client(
-                service_name='s3',
-                endpoint_url=endpoint,
-                aws_access_key_id=access_key_id,
-                aws_secret_access_key=secret_access_key
-            )
-            
-            # 上传文件
-            s3_client.upload_fileobj(
-                temp_file,
-                bucket_name,
-                object_key,
-                ExtraArgs={
-                    'ContentType': content_type
-                }
-            )
+            client = get_download_client()
+            connect_start = time.perf_counter()
+            async with client.stream("GET", file_url, headers=conditional_headers(validators)) as response:
+                PHASE_SECONDS.labels("source_connect").observe(time.perf_counter() - connect_start)
+                if response.status_code == 304:
+                    raise _SourceNotModified()
+                response.raise_for_status()
+                
+                # 源站不支持条件请求时，比较响应头中的校验值
+                response_validators = source_validators(response.headers)
+                if validators and response_validators == validators:
+                    raise _SourceNotModified()
+                if source_info is not None:
+                    source_info.update(response_validators or {})
+                
+                content_type = response.headers.get("content-type", "application/octet-stream")
+                
+                # 检查Content-Length头，如果存在则验证文件大小
+                content_length = response.headers.get("content-length")
+                if content_length and int(content_length) > self.max_file_size:
+                    raise ValueError(f"文件大小超过限制：{int(content_length)} > {self.max_file_size}")
+                if content_length and content_length.isdigit():
+                    shrink_reservation(int(content_length))
+                
+                settings = (transfer_settings or TransferSettings()).resolve(
+                    int(content_length) if content_length else None
+                )
+                uploader = MultipartUploader(storage, bucket_name, object_key, content_type, settings)
+                
+                async for chunk in response.aiter_bytes():
+                    # 边接收边检查文件大小
+                    if uploader.size + len(chunk) > self.max_file_size:
+                        raise ValueError(f"文件大小超过限制：{uploader.size + len(chunk)} > {self.max_file_size}")
+                    
+                    await uploader.write(chunk)
+                    
+                    if progress is not None:
+                        progress("streaming", uploader.size, int(content_length) if content_length else None)
             
-            # 构建公共URL
-            if custom_domain:
-                # 使用自定义域名
-                public_url = f"{custom_domain.rstrip('/')}/{object_key}"
-            else:
-                # 使用默认R2 URL
-                public_url = f"{endpoint.rstrip('/')}/{bucket_name}/{object_key}"
+            file_size = await uploader.complete()
+            TRANSFER_BYTES.labels("in").inc(file_size)
+            TRANSFER_BYTES.labels("out").inc(file_size)
             
-            return {
-                "public_url": public_url,
+            result = {
+                "public_url": self._build_public_url(endpoint, bucket_name, object_key, custom_domain),
                 "size": file_size,
-                "content_type": content_type,
-                "file_name": upload_file.filename
+                "content_type": content_type
             }
+            if uploader.etag is not None:
+                result["etag"] = uploader.etag
+            return result
             
-        except ClientError as e:
-            raise Exception(f"上传到R2时出错: {str(e)}")
-        except ValueError as e:
+        except ValueError:
+            await self._abort_upload(uploader)
+            record_error("size_limit")
             # 重新抛出ValueError，用于文件大小验证
             raise
+        except _SourceNotModified:
+            raise
         except Exception as e:
-            raise Exception(f"处理文件上传时出错: {str(e)}")
-        finally:
-            # 关闭并删除临时文件
-            temp_file.close()
-            if os.path.exists(temp_file.name):
-                os.unlink(temp_file.name)
\ No newline at end of file
+            await self._abort_upload(uploader)
+            if isinstance(e, httpx.RequestError):
+                record_error("source")
+                raise Exception(f"下载文件时出错: {str(e)}")
+            if isinstance(e, ClientError):
+                record_error("r2")
+                raise Exception(f"上传到R2时出错: {str(e)}")
+            record_error("source" if isinstance(e, httpx.HTTPStatusError) else "stream")
+            raise Exception(f"流式上传时出错: {str(e)}")
+
+    async def upload_from_url(
+        self,
+        file_url: str,
+        bucket_name: str,
+        object_key: str,
+        endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        custom_domain: str,
+        streaming: Optional[bool] = None,
+        ranged: Optional[bool] = None,
+        transfer_settings: Optional[TransferSettings] = None,
+        progress: Optional[ProgressCallback] = None,
+        dedup: Optional[bool] = None,
+        use_source_cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        从URL下载文件并上传到R2
+        streaming为True时边下载边上传，否则先下载到临时文件再上传
+        dedup为True时下载过程中计算SHA-256，R2中已有相同内容的同名对象则跳过上传
+        use_source_cache为True时，同一URL此前已上传到同一对象、源站ETag/Last-Modified未变化，
+        且用调用方的凭据HeadObject确认对象仍是当时上传的版本，则跳过下载和上传，
+        直接返回已有对象（data中not_modified为true）
+        """
+        if streaming is None:
+            streaming = UPLOAD_STREAMING_DEFAULT
+        if dedup is None:
+            dedup = UPLOAD_DEDUP_DEFAULT
+        
+        cache_key = None
+        cached = None
+        if use_source_cache and source_cache.enabled:
+            cache_key = source_cache.make_key(file_url, endpoint, access_key_id, secret_access_key, bucket_name, object_key)
+            cached = source_cache.get(cache_key)
+            if cached is not None:
+                object_etag = await self._head_etag(endpoint, access_key_id, secret_access_key, bucket_name, object_key)
+                if object_etag != cached[2]:
+                    # 凭据无效、对象已被删除或被其他途径覆盖，按正常流程上传
+                    source_cache.invalidate(cache_key)
+                    cached = None
+        validators = cached[0] if cached is not None else None
+        source_info: Dict[str, str] = {}
+        
+        with TRANSFERS_IN_FLIGHT.labels("url").track_inprogress():
+            try:
+                # 去重需要在上传前得到完整内容的哈希，流式模式下回退为临时文件模式
+                if streaming and not dedup:
+                    with observe_phase("stream"), span("stream", "stream", host=urlsplit(file_url).hostname):
+                        result = await self.stream_url_to_r2(
+                            file_url=file_url,
+                            bucket_name=bucket_name,
+                            object_key=object_key,
+                            endpoint=endpoint,
+                            access_key_id=access_key_id,
+                            secret_access_key=secret_access_key,
+                            custom_domain=custom_domain,
+                            transfer_settings=transfer_settings,
+                            progress=progress,
+                            validators=validators,
+                            source_info=source_info
+                        )
+                else:
+                    # 下载文件
+                    hasher = hashlib.sha256() if dedup else None
+                    with observe_phase("download"), span("source.download", "source", host=urlsplit(file_url).hostname):
+                        file, content_type, file_size = await self.download_file(
+                            file_url,
+                            ranged=ranged,
+                            progress=progress,
+                            hasher=hasher,
+                            validators=validators,
+                            source_info=source_info
+                        )
+                    TRANSFER_BYTES.labels("in").inc(file_size)
+                    
+                    # 上传到R2
+                    with observe_phase("upload"), span("r2.upload", "r2", bucket=bucket_name, key=object_key):
+                        result = await self.upload_to_r2(
+                            file=file,
+                            content_type=content_type,
+                            bucket_name=bucket_name,
+                            object_key=object_key,
+                            endpoint=endpoint,
+                            access_key_id=access_key_id,
+                            secret_access_key=secret_access_key,
+                            custom_domain=custom_domain,
+                            transfer_settings=transfer_settings,
+                            progress=progress,
+                            content_hash=hasher.hexdigest() if hasher is not None else None
+                        )
+            except _SourceNotModified:
+                source_cache.record(hit=True)
+                result = dict(
+                    cached[1],
+                    public_url=self._build_public_url(endpoint, bucket_name, object_key, custom_domain),
+                    not_modified=True
+                )
+                if "deduplicated" in result:
+                    # 本次没有上传，R2中已是相同内容
+                    result["deduplicated"] = True
+                return result
+        
+        if cached is not None:
+            source_cache.record(hit=False)
+        # 对象已被覆盖，其他来源URL指向它的缓存条目都已失效
+        source_cache.invalidate_object(endpoint, bucket_name, object_key)
+        if cache_key is not None and source_info:
+            # 上传响应中已有对象的ETag；去重跳过上传或后端未返回时才需要查询
+            object_etag = result.get("etag")
+            if object_etag is None:
+                object_etag = await self._head_etag(endpoint, access_key_id, secret_access_key, bucket_name, object_key)
+            source_cache.set(cache_key, source_info, result, object_etag)
+        return result
+
+    async def _head_etag(
+        self,
+        endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        bucket_name: str,
+        object_key: str
+    ) -> Optional[str]:
+        """用调用方的凭据查询对象的ETag，对象不存在或查询失败时返回None"""
+        try:
+            storage = await self.get_storage(endpoint, access_key_id, secret_access_key)
+            with observe_phase("source_cache_check"), span("r2.head_object", "r2", key=object_key):
+                head = await upload_executor.run(storage.head_object, bucket_name, object_key)
+        except Exception as e:
+            logger.info(f"查询对象ETag失败: {object_key}: {str(e)}")
+            return None
+        return head["etag"] if head is not None else None
+
+    async def upload_file_directly(
+        self, 
+        upload_file: UploadFile,
+        bucket_name: str, 
+        object_key: str,
+        endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        custom_domain: str,
+        transfer_settings: Optional[TransferSettings] = None,
+        progress: Optional[ProgressCallback] = None,
+        dedup: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        直接上传文件到R2存储桶并返回公共URL
+        按分片读取上传的文件并流式写入R2分片上传，不在内存中保留完整文件，也不再复制到临时文件
+        dedup为True时先计算SHA-256，R2中已有相同内容的同名对象则跳过上传
+        """
+        if dedup is None:
+            dedup = UPLOAD_DEDUP_DEFAULT
+        uploader = None
+        
+        with (
+            TRANSFERS_IN_FLIGHT.labels("direct").track_inprogress(),
+            observe_phase("direct_upload"),
+            span("r2.direct_upload", "r2", bucket=bucket_name, key=object_key)
+        ):
+            try:
+                # 已知文件大小时提前检查
+                if upload_file.size is not None and upload_file.size > self.max_file_size:
+                    raise ValueError(f"文件大小超过限制：{upload_file.size} > {self.max_file_size}")
+                
+                # 获取content_type
+                content_type = upload_file.content_type or "application/octet-stream"
+                
+                storage = await self.get_storage(endpoint, access_key_id, secret_access_key)
+                
+                metadata = None
+                if dedup:
+                    # 上传的文件已由框架保存在本地，先读一遍计算哈希
+                    with observe_phase("dedup_check"), span("dedup_check", key=object_key):
+                        content_hash = (await io_executor.run(self._hash_fileobj_sync, upload_file.file)).hexdigest()
+                        deduplicated = await upload_executor.run(
+                            self._object_matches_sync, storage, bucket_name, object_key, content_hash, content_type
+                        )
+                    if deduplicated:
+                        TRANSFER_BYTES.labels("in").inc(upload_file.size or 0)
+                        return {
+                            "public_url": self._build_public_url(endpoint, bucket_name, object_key, custom_domain),
+                            "size": upload_file.size,
+                            "content_type": content_type,
+                            "file_name": upload_file.filename,
+                            "deduplicated": True,
+                            "sha256": content_hash
+                        }
+                    metadata = {CONTENT_HASH_METADATA_KEY: content_hash}
+                
+                settings = (transfer_settings or TransferSettings()).resolve(upload_file.size)
+                uploader = MultipartUploader(storage, bucket_name, object_key, content_type, settings, metadata)
+                
+                while True:
+                    chunk = await upload_file.read(uploader.part_size)
+                    if not chunk:
+                        break
+                    
+                    # 边读取边检查文件大小
+                    if uploader.size + len(chunk) > self.max_file_size:
+                        raise ValueError(f"文件大小超过限制：{uploader.size + len(chunk)} > {self.max_file_size}")
+                    
+                    await uploader.write(chunk)
+                    
+                    if progress is not None:
+                        progress("uploading", uploader.size, upload_file.size)
+                
+                file_size = await uploader.complete()
+                TRANSFER_BYTES.labels("in").inc(file_size)
+                TRANSFER_BYTES.labels("out").inc(file_size)
+                source_cache.invalidate_object(endpoint, bucket_name, object_key)
+                
+                # 构建公共URL
+                public_url = self._build_public_url(endpoint, bucket_name, object_key, custom_domain)
+                
+                result = {
+                    "public_url": public_url,
+                    "size": file_size,
+                    "content_type": content_type,
+                    "file_name": upload_file.filename
+                }
+                if uploader.etag is not None:
+                    result["etag"] = uploader.etag
+                if metadata is not None:
+                    result.update(deduplicated=False, sha256=metadata[CONTENT_HASH_METADATA_KEY])
+                return result
+            
+            except ClientError as e:
+                await self._abort_upload(uploader)
+                record_error("r2")
+                raise Exception(f"上传到R2时出错: {str(e)}")
+            except ValueError:
+                await self._abort_upload(uploader)
+                record_error("size_limit")
+                # 重新抛出ValueError，用于文件大小验证
+                raise
+            except Exception as e:
+                await self._abort_upload(uploader)
+                record_error("direct_upload")
+                raise Exception(f"处理文件上传时出错: {str(e)}")
@@ -0,0 +1,97 @@
+import logging
+from typing import Optional
+
+import httpx
+
+from .config import (
+    SERVICE_NAME,
+    QINGFLOW_HTTP_TIMEOUT,
+    QINGFLOW_HTTP_MAX_CONNECTIONS,
+    QINGFLOW_HTTP_MAX_KEEPALIVE,
+    QINGFLOW_HTTP_KEEPALIVE_EXPIRY,
+    QINGFLOW_HTTP2,
+    DOWNLOAD_HTTP_TIMEOUT,
+    DOWNLOAD_HTTP_MAX_CONNECTIONS,
+    DOWNLOAD_HTTP_MAX_KEEPALIVE,
+)
+
+logger = logging.getLogger(SERVICE_NAME)
+
+_qingflow_client: Optional[httpx.AsyncClient] = None
+_download_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2需要安装h2依赖"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _create_qingflow_client() -> httpx.AsyncClient:
+    http2 = QINGFLOW_HTTP2 and _http2_available()
+    if QINGFLOW_HTTP2 and not http2:
+        logger.warning("未安装h2，青流API客户端回退到HTTP/1.1")
+
+    return httpx.AsyncClient(
+        timeout=QINGFLOW_HTTP_TIMEOUT,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=QINGFLOW_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=QINGFLOW_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=QINGFLOW_HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+
+
+def _create_download_client() -> httpx.AsyncClient:
+    # 源站下载使用HTTP/1.1，分段下载依赖多个并行连接
+    return httpx.AsyncClient(
+        timeout=DOWNLOAD_HTTP_TIMEOUT,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=DOWNLOAD_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=DOWNLOAD_HTTP_MAX_KEEPALIVE
+        )
+    )
+
+
+async def init_http_clients() -> None:
+    """应用启动时创建共享的HTTP客户端"""
+    global _qingflow_client, _download_client
+    if _qingflow_client is None or _qingflow_client.is_closed:
+        _qingflow_client = _create_qingflow_client()
+    if _download_client is None or _download_client.is_closed:
+        _download_client = _create_download_client()
+
+
+async def close_http_clients() -> None:
+    """应用关闭时释放连接池"""
+    global _qingflow_client, _download_client
+    if _qingflow_client is not None:
+        await _qingflow_client.aclose()
+        _qingflow_client = None
+    if _download_client is not None:
+        await _download_client.aclose()
+        _download_client = None
+
+
+def get_qingflow_client() -> httpx.AsyncClient:
+    """
+    获取青流API共享客户端
+    未经过应用启动流程（如脚本中直接调用）时按需创建
+    """
+    global _qingflow_client
+    if _qingflow_client is None or _qingflow_client.is_closed:
+        _qingflow_client = _create_qingflow_client()
+    return _qingflow_client
+
+
+def get_download_client() -> httpx.AsyncClient:
+    """获取源文件下载共享客户端"""
+    global _download_client
+    if _download_client is None or _download_client.is_closed:
+        _download_client = _create_download_client()
+    return _download_client
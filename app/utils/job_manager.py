@@ -0,0 +1,324 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from .config import (
+    SERVICE_NAME,
+    MAX_FILE_SIZE,
+    JOB_WORKERS,
+    JOB_QUEUE_MAX_DEPTH,
+    JOB_PROGRESS_INTERVAL,
+    JOB_PURGE_INTERVAL,
+    JOB_SHUTDOWN_GRACE,
+    JOB_MAX_ATTEMPTS,
+    JOB_ADOPT_INTERVAL,
+    JOB_SPEC_KEY,
+    JOB_WEBHOOK_TIMEOUT,
+)
+from .file_service import FileService
+from .admission import admission
+from .transfer_settings import TransferSettings
+from .http_client import get_download_client
+from .job_store import (
+    JobStore,
+    create_job_store,
+    JOB_QUEUED,
+    JOB_SUCCEEDED,
+    JOB_FAILED,
+)
+
+logger = logging.getLogger(SERVICE_NAME)
+
+# 任务参数加密密钥：gunicorn主进程启动时生成并由各worker继承（见gunicorn.conf.py）；
+# 直接用uvicorn启动且未配置时只在本进程内有效
+_cipher = Fernet(JOB_SPEC_KEY.encode() if JOB_SPEC_KEY else Fernet.generate_key())
+
+
+class JobQueueFull(Exception):
+    """任务队列已满"""
+
+
+class JobManager:
+    """
+    异步传输任务管理：提交后立即返回任务ID，由有界的后台worker池执行
+    任务参数（含R2凭据）加密后随任务保存，worker关闭（如--max-requests回收）时未完成的任务交还到存储中，
+    由其他worker领取后从头执行
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queue_depth: int = JOB_QUEUE_MAX_DEPTH):
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        self.store: Optional[JobStore] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._purge_task: Optional[asyncio.Task] = None
+        self._adopt_task: Optional[asyncio.Task] = None
+        self._active = 0
+        self._adopted = 0
+        self._stopping = False
+        self._pid = os.getpid()
+
+    @property
+    def started(self) -> bool:
+        return self._queue is not None
+
+    async def start(self) -> None:
+        if self.started or self._stopping:
+            return
+        self._pid = os.getpid()
+        self.store = create_job_store()
+        requeued, failed = await self.store.requeue_orphaned("worker进程已退出，任务中断", JOB_MAX_ATTEMPTS)
+        if requeued or failed:
+            logger.warning(f"worker进程已退出：{requeued}个任务重新排队，{failed}个任务标记为失败")
+        await self.store.purge_expired()
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue_depth)
+        self._worker_tasks = [asyncio.create_task(self._worker(self._queue)) for _ in range(self.workers)]
+        self._purge_task = asyncio.create_task(self._purge_periodically())
+        self._adopt_task = asyncio.create_task(self._adopt_periodically(self._queue))
+
+    async def stop(self) -> None:
+        """
+        停止接收和领取任务，排队中的任务立即交还给其他worker；
+        等待进行中的任务完成（最多JOB_SHUTDOWN_GRACE秒），仍未完成的任务交还后从头执行
+        """
+        if not self.started:
+            return
+        self._queue = None
+        self._stopping = True
+        error = "服务重启，任务中断"
+
+        requeued, failed = await self.store.requeue_unfinished(self._pid, error, JOB_MAX_ATTEMPTS, running=False)
+        deadline = time.monotonic() + JOB_SHUTDOWN_GRACE
+        while self._active and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+
+        tasks = self._worker_tasks + [task for task in (self._purge_task, self._adopt_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._purge_task = None
+        self._adopt_task = None
+
+        counts = await self.store.requeue_unfinished(self._pid, error, JOB_MAX_ATTEMPTS)
+        requeued += counts[0]
+        failed += counts[1]
+        if requeued or failed:
+            logger.warning(f"服务关闭：{requeued}个未完成的任务已交还给其他worker，{failed}个任务标记为失败")
+        await self.store.close()
+        self.store = None
+
+    async def submit(
+        self,
+        owner: Optional[str],
+        params: Dict[str, Any],
+        webhook_url: Optional[str] = None,
+        admission_key: str = ""
+    ) -> Dict[str, Any]:
+        """
+        提交任务，返回任务信息
+        params为FileService.upload_from_url的参数；admission_key为提交者的准入控制键（见admission.token_key），
+        任务执行时与同步上传共用全局和每个Token的传输限制；队列已满时抛出JobQueueFull
+        """
+        if self._stopping:
+            raise JobQueueFull("服务正在关闭，请稍后重试")
+        if not self.started:
+            await self.start()
+        if self._queue.full():
+            raise JobQueueFull(f"任务队列已满（{self.max_queue_depth}），请稍后重试")
+
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "owner": owner,
+            "status": JOB_QUEUED,
+            "phase": JOB_QUEUED,
+            "bytes_transferred": 0,
+            "total_bytes": None,
+            "result": None,
+            "error": None,
+            "webhook_url": webhook_url,
+            "worker_pid": self._pid,
+            "created_at": now,
+            "updated_at": now,
+            "spec": _seal_spec(params, webhook_url, admission_key),
+            "attempts": 0
+        }
+        await self.store.create(job)
+        self._queue.put_nowait((job["id"], params, webhook_url, admission_key))
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self.store is None:
+            if self._stopping:
+                return None
+            await self.start()
+        return await self.store.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._active,
+            "adopted": self._adopted,
+            "max_queue_depth": self.max_queue_depth,
+            "workers": self.workers
+        }
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            job_id, params, webhook_url, admission_key = await queue.get()
+            # 关闭期间不再开始新任务，它们已交还给其他worker
+            if self._stopping:
+                continue
+            self._active += 1
+            try:
+                await self._run(job_id, params, webhook_url, admission_key)
+            except Exception as e:
+                # 存储或回调出错时只影响当前任务，worker继续处理队列
+                logger.exception(f"任务{job_id}执行出错")
+                try:
+                    await self.store.update(job_id, status=JOB_FAILED, error=str(e))
+                except Exception:
+                    pass
+            finally:
+                self._active -= 1
+
+    async def _purge_periodically(self) -> None:
+        """定期删除超过保留时间的任务"""
+        while True:
+            await asyncio.sleep(JOB_PURGE_INTERVAL)
+            try:
+                await self.store.purge_expired()
+            except Exception:
+                logger.exception("清理过期任务失败")
+
+    async def _adopt_periodically(self, queue: asyncio.Queue) -> None:
+        """定期领取其他worker关闭时交还的任务，只在本worker有空闲时领取"""
+        while True:
+            await asyncio.sleep(JOB_ADOPT_INTERVAL)
+            try:
+                while not self._stopping and self._active + queue.qsize() < self.workers:
+                    job = await self.store.adopt(self._pid)
+                    if job is None:
+                        break
+                    try:
+                        params, webhook_url, admission_key = _open_spec(job["spec"])
+                    except (InvalidToken, ValueError):
+                        await self.store.update(job["id"], status=JOB_FAILED, error="任务参数无法解密，请检查JOB_SPEC_KEY配置")
+                        continue
+                    self._adopted += 1
+                    queue.put_nowait((job["id"], params, webhook_url, admission_key))
+            except Exception:
+                logger.exception("领取交还的任务失败")
+
+    async def _run(self, job_id: str, params: Dict[str, Any], webhook_url: Optional[str], admission_key: str) -> None:
+        state = {"phase": "starting", "bytes_transferred": 0, "total_bytes": None}
+        flushed = dict(state)
+
+        def progress(phase: str, transferred: int, total: Optional[int]) -> None:
+            state.update(phase=phase, bytes_transferred=transferred, total_bytes=total)
+
+        finished = asyncio.Event()
+
+        async def flush_progress() -> None:
+            # 定期把进度写入存储，避免每个数据块都写一次
+            while not finished.is_set():
+                try:
+                    await asyncio.wait_for(finished.wait(), JOB_PROGRESS_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                if not finished.is_set() and state != flushed:
+                    snapshot = dict(state)
+                    await self.store.update(job_id, **snapshot)
+                    flushed.update(snapshot)
+
+        # 任务可能已在关闭时交还给其他worker
+        if not await self.store.claim(job_id, self._pid):
+            return
+        await self.store.update(job_id, phase=state["phase"])
+        flusher = asyncio.create_task(flush_progress())
+        try:
+            # 任务已被接受，超出准入限制时一直排队（阶段保持为starting）而不是失败
+            async with admission.admit(admission_key, MAX_FILE_SIZE, queue_timeout=math.inf):
+                result = await FileService().upload_from_url(progress=progress, **params)
+            fields = {
+                "status": JOB_SUCCEEDED,
+                "phase": "done",
+                "bytes_transferred": result.get("size", state["bytes_transferred"]),
+                "total_bytes": result.get("size", state["total_bytes"]),
+                "result": result
+            }
+        except asyncio.CancelledError:
+            # 由stop()交还给其他worker或标记为失败
+            raise
+        except Exception as e:
+            logger.warning(f"任务{job_id}失败: {str(e)}")
+            fields = dict(state, status=JOB_FAILED, error=str(e))
+        finally:
+            # 等待进行中的进度写入完成，避免覆盖最终状态
+            finished.set()
+            await asyncio.gather(flusher, return_exceptions=True)
+
+        await self.store.update(job_id, **fields)
+
+        if webhook_url:
+            await self._notify(webhook_url, await self.store.get(job_id))
+
+    @staticmethod
+    async def _notify(webhook_url: str, job: Dict[str, Any]) -> None:
+        """任务结束后回调webhook，失败只记录日志"""
+        try:
+            response = await get_download_client().post(
+                webhook_url, json=public_job(job), timeout=JOB_WEBHOOK_TIMEOUT
+            )
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"任务{job['id']}的webhook回调失败: {str(e)}")
+
+
+def _seal_spec(params: Dict[str, Any], webhook_url: Optional[str], admission_key: str) -> str:
+    """加密任务参数，供其他worker接手任务"""
+    params = dict(params)
+    settings = params.get("transfer_settings")
+    if isinstance(settings, TransferSettings):
+        params["transfer_settings"] = vars(settings)
+    spec = {"params": params, "webhook_url": webhook_url, "admission_key": admission_key}
+    return _cipher.encrypt(json.dumps(spec).encode()).decode()
+
+
+def _open_spec(token: Optional[str]) -> Tuple[Dict[str, Any], Optional[str], str]:
+    """解密任务参数，返回(params, webhook_url, admission_key)"""
+    if not token:
+        raise ValueError("任务没有保存参数")
+    spec = json.loads(_cipher.decrypt(token.encode()))
+    params = spec["params"]
+    if params.get("transfer_settings") is not None:
+        params["transfer_settings"] = TransferSettings(**params["transfer_settings"])
+    return params, spec["webhook_url"], spec["admission_key"]
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """返回给客户端的任务信息"""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "phase": job["phase"],
+        "bytes_transferred": job["bytes_transferred"],
+        "total_bytes": job["total_bytes"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+
+
+# 进程级单例
+job_manager = JobManager()
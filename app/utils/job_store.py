@@ -0,0 +1,329 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .config import JOB_STORE, JOB_STORE_PATH, JOB_RESULT_TTL
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+UNFINISHED_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+# 可更新的任务字段，result为JSON；spec为加密后的任务参数（见JobManager），attempts为任务被中断的次数
+JOB_FIELDS = (
+    "id", "owner", "status", "phase", "bytes_transferred", "total_bytes",
+    "result", "error", "webhook_url", "worker_pid", "created_at", "updated_at",
+    "spec", "attempts"
+)
+
+
+class JobStore:
+    """
+    任务状态存储接口
+    保存任务状态和结果；任务参数（含R2凭据）只以加密后的spec保存，供其他worker接手任务
+    排队中且worker_pid为空的任务已被原worker交还，可由任意worker领取
+    """
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        raise NotImplementedError
+
+    async def fail_unfinished(self, worker_pid: int, error: str) -> int:
+        """将指定worker进程未完成的任务标记为失败，返回任务数"""
+        raise NotImplementedError
+
+    async def claim(self, job_id: str, worker_pid: int) -> bool:
+        """开始执行任务：仅当任务仍在排队且属于该worker时标记为running，返回是否成功"""
+        raise NotImplementedError
+
+    async def adopt(self, worker_pid: int) -> Optional[Dict[str, Any]]:
+        """领取一个已被交还的排队任务，归属改为该worker并返回任务，没有时返回None"""
+        return None
+
+    async def requeue_unfinished(
+        self, worker_pid: int, error: str, max_attempts: int, running: bool = True
+    ) -> Tuple[int, int]:
+        """
+        交还指定worker进程未完成的任务，返回(重新排队数, 失败数)
+        running为False时只交还排队中的任务；没有spec或中断次数达到max_attempts的任务标记为失败
+        默认实现不能跨进程交还，交还全部任务时将其标记为失败
+        """
+        if not running:
+            return 0, 0
+        return 0, await self.fail_unfinished(worker_pid, error)
+
+    async def requeue_orphaned(self, error: str, max_attempts: int) -> Tuple[int, int]:
+        """交还所属worker进程已退出的未完成任务，返回(重新排队数, 失败数)"""
+        return 0, 0
+
+    async def purge_expired(self) -> None:
+        """删除超过保留时间的任务"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryJobStore(JobStore):
+    """进程内任务存储，worker重启后任务丢失，且只能在提交任务的worker中查询"""
+
+    def __init__(self, ttl: float = JOB_RESULT_TTL):
+        self.ttl = ttl
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = dict(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.update(fields, updated_at=time.time())
+
+    async def claim(self, job_id: str, worker_pid: int) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] != JOB_QUEUED or job["worker_pid"] != worker_pid:
+            return False
+        job.update(status=JOB_RUNNING, updated_at=time.time())
+        return True
+
+    async def fail_unfinished(self, worker_pid: int, error: str) -> int:
+        count = 0
+        for job in self._jobs.values():
+            if job["worker_pid"] == worker_pid and job["status"] in UNFINISHED_STATUSES:
+                job.update(status=JOB_FAILED, error=error, updated_at=time.time())
+                count += 1
+        return count
+
+    async def purge_expired(self) -> None:
+        deadline = time.time() - self.ttl
+        for job_id in [k for k, v in self._jobs.items() if v["updated_at"] < deadline]:
+            del self._jobs[job_id]
+
+
+class SQLiteJobStore(JobStore):
+    """
+    SQLite任务存储，多个worker共享同一个数据库文件
+    任务状态在worker因--max-requests回收后仍可查询，未完成的任务交还后由其他worker继续执行
+    """
+
+    def __init__(self, path: str = JOB_STORE_PATH, ttl: float = JOB_RESULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    owner TEXT,
+                    status TEXT NOT NULL,
+                    phase TEXT,
+                    bytes_transferred INTEGER DEFAULT 0,
+                    total_bytes INTEGER,
+                    result TEXT,
+                    error TEXT,
+                    webhook_url TEXT,
+                    worker_pid INTEGER,
+                    created_at REAL,
+                    updated_at REAL,
+                    spec TEXT,
+                    attempts INTEGER DEFAULT 0
+                )
+                """
+            )
+            # 兼容旧版本创建的数据库
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "spec" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN spec TEXT")
+            if "attempts" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs (updated_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        """执行写语句，返回影响的行数"""
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    def _transaction(self, statements: list) -> list:
+        """在一个写事务中依次执行(sql, params)，返回每条语句影响的行数"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                counts = [self._conn.execute(sql, params).rowcount for sql, params in statements]
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return counts
+
+    @staticmethod
+    def _encode(fields: Dict[str, Any]) -> Dict[str, Any]:
+        if "result" in fields and fields["result"] is not None:
+            fields = dict(fields, result=json.dumps(fields["result"], ensure_ascii=False))
+        return fields
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        job = self._encode({key: job.get(key) for key in JOB_FIELDS})
+        columns = ", ".join(job)
+        placeholders = ", ".join("?" for _ in job)
+        await asyncio.to_thread(
+            self._execute, f"INSERT INTO jobs ({columns}) VALUES ({placeholders})", tuple(job.values())
+        )
+
+    def _get_sync(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = rows[0]
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get_sync, job_id)
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        fields = self._encode(dict(fields, updated_at=time.time()))
+        unknown = set(fields) - set(JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"未知的任务字段: {', '.join(sorted(unknown))}")
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        await asyncio.to_thread(
+            self._execute, f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+        )
+
+    async def claim(self, job_id: str, worker_pid: int) -> bool:
+        return bool(await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ? AND worker_pid = ?",
+            (JOB_RUNNING, time.time(), job_id, JOB_QUEUED, worker_pid)
+        ))
+
+    def _adopt_sync(self, worker_pid: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND worker_pid IS NULL ORDER BY created_at LIMIT 1",
+                    (JOB_QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET worker_pid = ?, updated_at = ? WHERE id = ?",
+                        (worker_pid, time.time(), row["id"])
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return self._get_sync(row["id"]) if row is not None else None
+
+    async def adopt(self, worker_pid: int) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._adopt_sync, worker_pid)
+
+    def _requeue_sync(self, worker_pid: int, error: str, max_attempts: int, running: bool) -> Tuple[int, int]:
+        statuses = UNFINISHED_STATUSES if running else (JOB_QUEUED,)
+        placeholders = ", ".join("?" for _ in statuses)
+        now = time.time()
+        failed, requeued = self._transaction([
+            # 无法恢复参数、或已被中断过多次的任务不再重试
+            (
+                f"UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE worker_pid = ? "
+                f"AND status IN ({placeholders}) AND (spec IS NULL OR (status = ? AND attempts + 1 >= ?))",
+                (JOB_FAILED, error, now, worker_pid, *statuses, JOB_RUNNING, max_attempts)
+            ),
+            # 执行中被中断的任务从头开始，计一次中断
+            (
+                f"UPDATE jobs SET attempts = attempts + (status = ?), status = ?, phase = ?, "
+                f"bytes_transferred = 0, worker_pid = NULL, updated_at = ? "
+                f"WHERE worker_pid = ? AND status IN ({placeholders})",
+                (JOB_RUNNING, JOB_QUEUED, JOB_QUEUED, now, worker_pid, *statuses)
+            ),
+        ])
+        return requeued, failed
+
+    async def requeue_unfinished(
+        self, worker_pid: int, error: str, max_attempts: int, running: bool = True
+    ) -> Tuple[int, int]:
+        return await asyncio.to_thread(self._requeue_sync, worker_pid, error, max_attempts, running)
+
+    def _requeue_orphaned_sync(self, error: str, max_attempts: int) -> Tuple[int, int]:
+        """交还所属进程已不存在的未完成任务（worker异常退出的情况）"""
+        rows = self._query(
+            "SELECT DISTINCT worker_pid FROM jobs WHERE status IN (?, ?) AND worker_pid IS NOT NULL",
+            UNFINISHED_STATUSES
+        )
+        requeued = failed = 0
+        for row in rows:
+            pid = row["worker_pid"]
+            if _pid_alive(pid):
+                continue
+            counts = self._requeue_sync(pid, error, max_attempts, True)
+            requeued += counts[0]
+            failed += counts[1]
+        return requeued, failed
+
+    async def requeue_orphaned(self, error: str, max_attempts: int) -> Tuple[int, int]:
+        return await asyncio.to_thread(self._requeue_orphaned_sync, error, max_attempts)
+
+    async def fail_unfinished(self, worker_pid: int, error: str) -> int:
+        return await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE worker_pid = ? AND status IN (?, ?)",
+            (JOB_FAILED, error, time.time(), worker_pid, *UNFINISHED_STATUSES)
+        )
+
+    async def purge_expired(self) -> None:
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM jobs WHERE updated_at < ?", (time.time() - self.ttl,)
+        )
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def create_job_store() -> JobStore:
+    """根据JOB_STORE配置创建任务存储"""
+    if JOB_STORE == "sqlite":
+        return SQLiteJobStore()
+    if JOB_STORE == "memory":
+        return MemoryJobStore()
+    raise ValueError(f"不支持的任务存储类型: {JOB_STORE}")
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from .config import (
+    SERVICE_NAME,
+    LOOP_MONITOR_ENABLED,
+    LOOP_MONITOR_INTERVAL,
+    LOOP_BLOCK_THRESHOLD,
+    LOOP_MONITOR_HISTORY,
+)
+from .metrics import loop_metrics
+
+logger = logging.getLogger(SERVICE_NAME)
+
+# 保留的最近阻塞事件数
+_MAX_BLOCK_EVENTS = 20
+# 阻塞事件中保留的调用栈帧数（从最内层算起）
+_MAX_STACK_FRAMES = 30
+
+
+def _percentile(ordered: List[float], percent: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)]
+
+
+class LoopMonitor:
+    """
+    事件循环诊断：
+    - 后台任务每隔interval秒sleep一次，记录实际唤醒比预期晚的时间（事件循环延迟）
+    - 看门狗线程检查该任务的心跳，超过threshold秒未更新时说明某个回调阻塞了事件循环，
+      此时抓取事件循环线程的调用栈并写入日志，即阻塞调用所在位置
+    """
+
+    def __init__(
+        self,
+        enabled: bool = LOOP_MONITOR_ENABLED,
+        interval: float = LOOP_MONITOR_INTERVAL,
+        threshold: float = LOOP_BLOCK_THRESHOLD,
+        history: int = LOOP_MONITOR_HISTORY
+    ):
+        self.enabled = enabled
+        self.interval = interval
+        self.threshold = threshold
+        self._samples: Deque[float] = deque(maxlen=history)
+        self._blocks: Deque[Dict[str, Any]] = deque(maxlen=_MAX_BLOCK_EVENTS)
+        self._heartbeat = time.monotonic()
+        self._reported_heartbeat: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.blocked_count = 0
+
+    async def _sample_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        lag_seconds, blocks = loop_metrics()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self._heartbeat = time.monotonic()
+            self._samples.append(lag)
+            lag_seconds.observe(lag)
+            if lag >= self.threshold:
+                self.blocked_count += 1
+                blocks.inc()
+                # 看门狗已记录这次阻塞时，补上实际阻塞时长
+                if self._blocks and self._blocks[-1].get("duration") is None:
+                    self._blocks[-1]["duration"] = round(lag, 3)
+
+    def _watch(self) -> None:
+        check_interval = min(self.interval, self.threshold) / 2
+        while not self._stopping.wait(check_interval):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or self._reported_heartbeat == heartbeat:
+                continue
+            # 每次阻塞只记录一次调用栈
+            self._reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)[-_MAX_STACK_FRAMES:]
+            self._blocks.append({
+                "at": time.time(),
+                "duration": None,
+                "stack": [f"{entry.filename}:{entry.lineno} in {entry.name}" for entry in stack]
+            })
+            logger.warning(
+                f"事件循环已被阻塞{stalled:.3f}秒，事件循环线程当前调用栈:\n"
+                + "".join(traceback.format_list(stack))
+            )
+
+    def start(self) -> None:
+        """在事件循环中启动采样任务和看门狗线程"""
+        if not self.enabled or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._sample_loop())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._stopping.set()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self._samples)
+        return {
+            "enabled": self.enabled,
+            "samples": len(ordered),
+            "lag_p50_ms": round(_percentile(ordered, 50) * 1000, 2),
+            "lag_p99_ms": round(_percentile(ordered, 99) * 1000, 2),
+            "lag_max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+            "blocked": self.blocked_count
+        }
+
+    def report(self) -> Dict[str, Any]:
+        """管理端点使用：延迟分布和最近的阻塞事件（含调用栈）"""
+        ordered = sorted(self._samples)
+        return {
+            "pid": os.getpid(),
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "samples": len(ordered),
+            "lag_ms": {
+                name: round(_percentile(ordered, percent) * 1000, 2)
+                for name, percent in (("p50", 50), ("p90", 90), ("p99", 99), ("p999", 99.9))
+            },
+            "lag_max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+            "blocked": self.blocked_count,
+            "recent_blocks": list(self._blocks)
+        }
+
+
+# 进程级单例
+loop_monitor = LoopMonitor()
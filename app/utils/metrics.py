@@ -0,0 +1,138 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+# 设置PROMETHEUS_MULTIPROC_DIR时，各gunicorn worker把指标写入该目录下的文件，/metrics汇总所有worker
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# 传输耗时从毫秒级（缓存命中）到分钟级（大文件）
+_PHASE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_SECONDS = Histogram(
+    "r2_uploader_request_duration_seconds",
+    "HTTP请求耗时",
+    ["method", "route", "status"],
+    buckets=_PHASE_BUCKETS
+)
+
+PHASE_SECONDS = Histogram(
+    "r2_uploader_phase_duration_seconds",
+    "各处理阶段耗时（auth、download、upload、stream、direct_upload、dedup_check、admission_wait、presign_multipart、qingflow_*）",
+    ["phase"],
+    buckets=_PHASE_BUCKETS
+)
+
+TRANSFER_BYTES = Counter(
+    "r2_uploader_transfer_bytes_total",
+    "传输字节数，in为从源站下载或客户端上传的字节，out为写入R2的字节",
+    ["direction"]
+)
+
+ERRORS = Counter(
+    "r2_uploader_errors_total",
+    "按原因统计的错误数",
+    ["cause"]
+)
+
+QINGFLOW_RETRIES = Counter(
+    "r2_uploader_qingflow_retries_total",
+    "青流API连接超时后的重试次数",
+    ["operation"]
+)
+
+TRANSFERS_IN_FLIGHT = Gauge(
+    "r2_uploader_transfers_in_flight",
+    "进行中的传输数",
+    ["kind"],
+    multiprocess_mode="livesum"
+)
+
+# 没有标签的指标在创建时就会打开多进程指标文件；gunicorn --preload在on_starting创建目录之前导入应用，
+# 因此事件循环指标在worker中启动监控时才创建
+_loop_metrics: Optional[Tuple[Histogram, Counter]] = None
+
+
+def loop_metrics() -> Tuple[Histogram, Counter]:
+    """返回（事件循环延迟直方图, 阻塞次数计数器），首次调用时创建"""
+    global _loop_metrics
+    if _loop_metrics is None:
+        _loop_metrics = (
+            Histogram(
+                "r2_uploader_event_loop_lag_seconds",
+                "事件循环延迟（定时唤醒比预期晚的时间），启用LOOP_MONITOR_ENABLED时采样",
+                buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+            ),
+            Counter(
+                "r2_uploader_event_loop_blocks_total",
+                "事件循环被阻塞超过LOOP_BLOCK_THRESHOLD的次数"
+            )
+        )
+    return _loop_metrics
+
+
+@contextmanager
+def observe_phase(phase: str) -> Iterator[None]:
+    """记录代码块耗时（无论成功或失败）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_SECONDS.labels(phase).observe(time.perf_counter() - start)
+
+
+def record_error(cause: str) -> None:
+    ERRORS.labels(cause).inc()
+
+
+def render_metrics() -> bytes:
+    """生成Prometheus文本格式的指标，多进程模式下汇总所有worker"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+class MetricsMiddleware:
+    """ASGI中间件：记录每个请求从开始到响应发送完毕的耗时，按路由模板区分"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # 路由匹配后scope中带有route，使用路由模板避免job_id等路径参数产生大量标签
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+
+
+def mark_process_dead(pid: int) -> None:
+    """gunicorn回收worker时调用，清理该进程的livesum指标"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from .config import SERVICE_NAME
+from .executor import upload_executor
+from .transfer_settings import TransferSettings
+from .storage import StorageBackend
+from .tracing import span
+
+logger = logging.getLogger(SERVICE_NAME)
+
+
+class MultipartUploader:
+    """
+    将异步到达的字节流按固定大小分片上传到存储后端（R2）
+    内存占用上限约为 max(part_size, multipart_threshold) + part_size * concurrency
+    数据总量不超过分片阈值时退化为单次put_object
+    """
+
+    def __init__(
+        self,
+        storage: StorageBackend,
+        bucket_name: str,
+        object_key: str,
+        content_type: str,
+        settings: Optional[TransferSettings] = None,
+        metadata: Optional[Dict[str, str]] = None
+    ):
+        settings = (settings or TransferSettings()).resolve()
+        self.storage = storage
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.content_type = content_type
+        self.metadata = metadata
+        self.multipart_threshold = settings.multipart_threshold
+        self.part_size = settings.part_size
+        self.max_in_flight = settings.concurrency
+        self.size = 0
+        # 完成后对象的ETag，后端无法得知时为None
+        self.etag: Optional[str] = None
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[Dict[str, Any]] = []
+        self._next_part_number = 1
+        self._pending: Set[asyncio.Task] = set()
+
+    async def write(self, data: bytes) -> None:
+        """追加数据，缓冲区满一个分片时提交上传"""
+        self._buffer += data
+        self.size += len(data)
+        
+        # 未超过分片阈值前只缓冲，以便小文件走单次上传
+        if self._upload_id is None and len(self._buffer) <= self.multipart_threshold:
+            return
+        
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._submit_part(part)
+
+    async def _start(self) -> None:
+        with span("r2.create_multipart_upload", key=self.object_key):
+            self._upload_id = await upload_executor.run(
+                self.storage.create_multipart_upload,
+                self.bucket_name,
+                self.object_key,
+                self.content_type,
+                self.metadata
+            )
+
+    async def _upload_part(self, part_number: int, body: bytes) -> None:
+        with span("r2.upload_part", part_number=part_number, size=len(body)):
+            etag = await upload_executor.run(
+                self.storage.upload_part,
+                self.bucket_name,
+                self.object_key,
+                self._upload_id,
+                part_number,
+                body
+            )
+        self._parts.append({"PartNumber": part_number, "ETag": etag})
+
+    async def _wait_pending(self, limit: int) -> None:
+        """等待进行中的分片数降到limit以下，分片失败时抛出异常"""
+        while len(self._pending) > limit:
+            done, self._pending = await asyncio.wait(
+                self._pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                task.result()
+
+    async def _submit_part(self, body: bytes) -> None:
+        if self._upload_id is None:
+            await self._start()
+
+        # 背压：进行中的分片达到上限时等待
+        await self._wait_pending(self.max_in_flight - 1)
+
+        part_number = self._next_part_number
+        self._next_part_number += 1
+        self._pending.add(asyncio.create_task(self._upload_part(part_number, body)))
+
+    async def complete(self) -> int:
+        """提交剩余数据并完成上传，返回对象大小，对象的ETag记录在etag中"""
+        if self._upload_id is None and self.size <= self.multipart_threshold:
+            # 未超过分片阈值，直接单次上传
+            with span("r2.put_object", key=self.object_key, size=self.size):
+                self.etag = await upload_executor.run(
+                    self.storage.put_object,
+                    self.bucket_name,
+                    self.object_key,
+                    bytes(self._buffer),
+                    self.content_type,
+                    self.metadata
+                )
+            self._buffer = bytearray()
+            return self.size
+
+        if self._buffer:
+            part = bytes(self._buffer)
+            self._buffer = bytearray()
+            await self._submit_part(part)
+        await self._wait_pending(0)
+
+        with span("r2.complete_multipart_upload", key=self.object_key, parts=len(self._parts)):
+            self.etag = await upload_executor.run(
+                self.storage.complete_multipart_upload,
+                self.bucket_name,
+                self.object_key,
+                self._upload_id,
+                sorted(self._parts, key=lambda p: p["PartNumber"])
+            )
+        return self.size
+
+    async def abort(self) -> None:
+        """
+        取消进行中的分片并中止分片上传，避免R2中残留未完成的分片
+        中止失败只记录日志，不掩盖导致中止的原始异常
+        """
+        self._buffer = bytearray()
+        for task in self._pending:
+            task.cancel()
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+            self._pending = set()
+
+        if self._upload_id is not None:
+            try:
+                await upload_executor.run(
+                    self.storage.abort_multipart_upload,
+                    self.bucket_name,
+                    self.object_key,
+                    self._upload_id
+                )
+            except Exception as e:
+                logger.warning(f"中止分片上传失败: {self.object_key} ({self._upload_id}): {str(e)}")
+            finally:
+                self._upload_id = None
@@ -0,0 +1,277 @@
+import math
+from typing import Any, Dict, List, Optional
+
+from .config import PRESIGN_EXPIRES, PRESIGN_MAX_EXPIRES, STORAGE_BACKEND
+from .executor import upload_executor, io_executor
+from .s3_client_cache import s3_client_cache
+from .file_service import FileService
+from .source_cache import source_cache
+from .transfer_settings import TransferSettings, MAX_PARTS
+from .metrics import observe_phase, record_error
+from .tracing import span
+
+
+class PresignService:
+    """
+    生成预签名URL，客户端直接把文件上传到R2，文件内容不经过本服务
+    签名在本地计算，在io_executor中执行；创建、完成、中止分片上传需要访问R2，在upload_executor中执行
+    """
+
+    def __init__(self, s3_client: Optional[Any] = None):
+        self.s3_client = s3_client
+
+    async def _get_s3_client(self, endpoint: str, access_key_id: str, secret_access_key: str) -> Any:
+        if self.s3_client is not None:
+            return self.s3_client
+        if STORAGE_BACKEND != "s3":
+            raise ValueError(f"预签名上传只支持s3存储后端，当前为{STORAGE_BACKEND}")
+        return await io_executor.run(
+            s3_client_cache.get_client, endpoint, access_key_id, secret_access_key
+        )
+
+    @staticmethod
+    def _expires(expires_in: Optional[int]) -> int:
+        expires = expires_in or PRESIGN_EXPIRES
+        if expires > PRESIGN_MAX_EXPIRES:
+            raise ValueError(f"预签名有效期不能超过{PRESIGN_MAX_EXPIRES}秒")
+        return expires
+
+    @staticmethod
+    def _part_urls_sync(
+        s3_client: Any,
+        bucket_name: str,
+        object_key: str,
+        upload_id: str,
+        part_numbers: List[int],
+        expires: int
+    ) -> List[Dict[str, Any]]:
+        """为每个分片签名上传URL（分片较多时CPU开销较大，只应在线程池中调用）"""
+        return [
+            {
+                "partNumber": part_number,
+                "url": s3_client.generate_presigned_url(
+                    "upload_part",
+                    Params={
+                        "Bucket": bucket_name,
+                        "Key": object_key,
+                        "UploadId": upload_id,
+                        "PartNumber": part_number
+                    },
+                    ExpiresIn=expires,
+                    HttpMethod="PUT"
+                )
+            }
+            for part_number in part_numbers
+        ]
+
+    async def presign_put(
+        self,
+        bucket_name: str,
+        object_key: str,
+        endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        content_type: Optional[str] = None,
+        size: Optional[int] = None,
+        expires_in: Optional[int] = None,
+        custom_domain: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        生成单次PUT上传的预签名URL
+        指定content_type或size时一并签名，客户端必须发送相同的Content-Type/Content-Length请求头
+        """
+        expires = self._expires(expires_in)
+        params: Dict[str, Any] = {"Bucket": bucket_name, "Key": object_key}
+        headers: Dict[str, str] = {}
+        if content_type:
+            params["ContentType"] = content_type
+            headers["Content-Type"] = content_type
+        if size is not None:
+            params["ContentLength"] = size
+            headers["Content-Length"] = str(size)
+
+        s3_client = await self._get_s3_client(endpoint, access_key_id, secret_access_key)
+        url = await io_executor.run(
+            s3_client.generate_presigned_url,
+            "put_object",
+            Params=params,
+            ExpiresIn=expires,
+            HttpMethod="PUT"
+        )
+        # 客户端随后会覆盖该对象；之后的写入由源文件缓存命中前的HeadObject检查发现
+        source_cache.invalidate_object(endpoint, bucket_name, object_key)
+        return {
+            "method": "PUT",
+            "url": url,
+            "headers": headers,
+            "expires_in": expires,
+            "public_url": FileService._build_public_url(endpoint, bucket_name, object_key, custom_domain)
+        }
+
+    async def create_multipart(
+        self,
+        bucket_name: str,
+        object_key: str,
+        endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        size: int,
+        content_type: Optional[str] = None,
+        part_size: Optional[int] = None,
+        expires_in: Optional[int] = None,
+        custom_domain: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """创建分片上传，返回upload_id、分片大小和每个分片的预签名URL"""
+        expires = self._expires(expires_in)
+        part_size = TransferSettings(part_size=part_size).resolve(size).part_size
+        part_count = max(math.ceil(size / part_size), 1)
+        if part_count > MAX_PARTS:
+            raise ValueError(f"分片数{part_count}超过上限{MAX_PARTS}，请增大partSize")
+
+        s3_client = await self._get_s3_client(endpoint, access_key_id, secret_access_key)
+        args: Dict[str, Any] = {"Bucket": bucket_name, "Key": object_key}
+        if content_type:
+            args["ContentType"] = content_type
+        try:
+            with observe_phase("presign_multipart"), span("r2.create_multipart_upload", "r2", key=object_key):
+                response = await upload_executor.run(s3_client.create_multipart_upload, **args)
+        except Exception:
+            record_error("r2")
+            raise
+        upload_id = response["UploadId"]
+
+        parts = await io_executor.run(
+            self._part_urls_sync, s3_client, bucket_name, object_key, upload_id,
+            list(range(1, part_count + 1)), expires
+        )
+        for part in parts:
+            start = (part["partNumber"] - 1) * part_size
+            part["size"] = min(part_size, size - start)
+
+        return {
+            "upload_id": upload_id,
+            "part_size": part_size,
+            "parts": parts,
+            "expires_in": expires,
+            "public_url": FileService._build_public_url(endpoint, bucket_name, object_key, custom_domain)
+        }
+
+    async def presign_parts(
+        self,
+        bucket_name: str,
+        object_key: str,
+        endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        upload_id: str,
+        part_numbers: List[int],
+        expires_in: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """为已创建的分片上传重新签名指定分片（如原URL已过期）"""
+        expires = self._expires(expires_in)
+        s3_client = await self._get_s3_client(endpoint, access_key_id, secret_access_key)
+        parts = await io_executor.run(
+            self._part_urls_sync, s3_client, bucket_name, object_key, upload_id, part_numbers, expires
+        )
+        return {"upload_id": upload_id, "parts": parts, "expires_in": expires}
+
+    @staticmethod
+    def _list_parts_sync(s3_client: Any, bucket_name: str, object_key: str, upload_id: str) -> List[Dict[str, Any]]:
+        """查询R2中已上传的分片，只应在线程池中调用"""
+        parts = []
+        paginator = s3_client.get_paginator("list_parts")
+        for page in paginator.paginate(Bucket=bucket_name, Key=object_key, UploadId=upload_id):
+            parts += [
+                {"PartNumber": part["PartNumber"], "ETag": part["ETag"], "Size": part["Size"]}
+                for part in page.get("Parts", [])
+            ]
+        return parts
+
+    @staticmethod
+    def _check_parts(parts: List[Dict[str, Any]], size: Optional[int]) -> None:
+        """
+        检查分片完整：分片序号必须从1开始连续（create_multipart按1..N分配），
+        给出size时已上传分片的总大小必须等于size；中间或末尾的分片缺失时抛出ValueError，避免生成被截断的对象
+        """
+        numbers = [part["PartNumber"] for part in parts]
+        if numbers != list(range(1, len(numbers) + 1)):
+            missing = sorted(set(range(1, max(numbers) + 1)) - set(numbers))
+            if missing:
+                raise ValueError(f"分片不完整，缺少分片: {', '.join(map(str, missing[:20]))}")
+            raise ValueError("分片序号重复")
+        if size is not None:
+            uploaded = sum(part["Size"] for part in parts)
+            if uploaded != size:
+                raise ValueError(f"已上传分片共{uploaded}字节，与文件大小{size}字节不符，可能缺少末尾的分片")
+
+    async def complete_multipart(
+        self,
+        bucket_name: str,
+        object_key: str,
+        endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        upload_id: str,
+        parts: Optional[List[Dict[str, Any]]] = None,
+        size: Optional[int] = None,
+        custom_domain: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        完成分片上传
+        parts为客户端上传各分片时R2返回的ETag；未提供时（如浏览器无法读取ETag响应头）从R2查询已上传的分片，
+        此时必须提供文件大小size，用于确认所有分片（包括最后一个）都已上传
+        分片序号不连续或总大小不符时抛出ValueError
+        """
+        if not parts and size is None:
+            raise ValueError("未提供parts时必须提供文件大小size")
+        s3_client = await self._get_s3_client(endpoint, access_key_id, secret_access_key)
+        try:
+            with observe_phase("presign_multipart"), span("r2.complete_multipart_upload", "r2", key=object_key):
+                if parts:
+                    completed = [{"PartNumber": part["partNumber"], "ETag": part["etag"]} for part in parts]
+                else:
+                    completed = await upload_executor.run(
+                        self._list_parts_sync, s3_client, bucket_name, object_key, upload_id
+                    )
+                if not completed:
+                    raise ValueError("没有已上传的分片")
+                completed.sort(key=lambda part: part["PartNumber"])
+                self._check_parts(completed, None if parts else size)
+                completed = [{"PartNumber": part["PartNumber"], "ETag": part["ETag"]} for part in completed]
+                response = await upload_executor.run(
+                    s3_client.complete_multipart_upload,
+                    Bucket=bucket_name,
+                    Key=object_key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": completed}
+                )
+        except ValueError:
+            raise
+        except Exception:
+            record_error("r2")
+            raise
+        source_cache.invalidate_object(endpoint, bucket_name, object_key)
+
+        return {
+            "etag": response.get("ETag"),
+            "parts": len(completed),
+            "public_url": FileService._build_public_url(endpoint, bucket_name, object_key, custom_domain)
+        }
+
+    async def abort_multipart(
+        self,
+        bucket_name: str,
+        object_key: str,
+        endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        upload_id: str
+    ) -> None:
+        """中止分片上传，R2删除已上传的分片"""
+        s3_client = await self._get_s3_client(endpoint, access_key_id, secret_access_key)
+        await upload_executor.run(
+            s3_client.abort_multipart_upload,
+            Bucket=bucket_name,
+            Key=object_key,
+            UploadId=upload_id
+        )
@@ -0,0 +1,45 @@
+from typing import Any, Dict, List
+
+from .config import FIELD_ID_MAP
+
+# 模块加载时预先编译字段映射，避免每次编解码都遍历FIELD_ID_MAP并做int转换
+QUE_ID_BY_FIELD: Dict[str, int] = {name: int(que_id) for name, que_id in FIELD_ID_MAP.items()}
+
+# 反向映射同时收录int和str形式的queId，接口返回任一类型都只需一次字典查找
+FIELD_BY_QUE_ID: Dict[Any, str] = {}
+for _name, _que_id in QUE_ID_BY_FIELD.items():
+    FIELD_BY_QUE_ID[_que_id] = _name
+    FIELD_BY_QUE_ID[str(_que_id)] = _name
+
+
+def encode_answers(fields: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """将字段字典编码为青流记录的answers列表"""
+    return [
+        {
+            "queId": QUE_ID_BY_FIELD[name],
+            "queTitle": name,
+            "values": [{"value": value}]
+        }
+        for name, value in fields.items()
+    ]
+
+
+def decode_answers(answers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """将青流记录的answers列表解码为字段字典，忽略未知字段和空值"""
+    fields = {}
+    for answer in answers:
+        name = FIELD_BY_QUE_ID.get(answer.get("queId"))
+        if name is not None:
+            values = answer.get("values")
+            if values:
+                fields[name] = values[0].get("value")
+    return fields
+
+
+def search_query(name: str, search_key: str) -> Dict[str, Any]:
+    """构建按字段搜索的查询条件"""
+    return {
+        "queId": QUE_ID_BY_FIELD[name],
+        "queTitle": name,
+        "searchKey": search_key
+    }
@@ -0,0 +1,126 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+from .config import S3_CLIENT_CACHE_MAX_SIZE, S3_CLIENT_CACHE_IDLE_TTL, S3_MAX_POOL_CONNECTIONS
+
+
+class S3ClientCache:
+    """
+    按(endpoint, access_key_id, secret哈希)缓存boto3 S3客户端（LRU + 空闲TTL）
+    同一租户的重复上传可复用客户端及其到R2的连接池
+    boto3客户端本身是线程安全的，可在上传线程池中共享
+    创建客户端（较慢）时只持有该租户的锁，不阻塞其他租户的查询和创建
+    """
+
+    def __init__(
+        self,
+        max_size: int = S3_CLIENT_CACHE_MAX_SIZE,
+        idle_ttl: float = S3_CLIENT_CACHE_IDLE_TTL,
+        max_pool_connections: int = S3_MAX_POOL_CONNECTIONS
+    ):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.max_pool_connections = max_pool_connections
+        self._clients: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 正在创建客户端的租户：键 -> [租户锁, 使用该锁的线程数]
+        self._creating: Dict[Tuple[str, str, str], List[Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _make_key(endpoint: str, access_key_id: str, secret_access_key: str) -> Tuple[str, str, str]:
+        secret_hash = hashlib.sha256(secret_access_key.encode("utf-8")).hexdigest()
+        return endpoint.rstrip('/'), access_key_id, secret_hash
+
+    def _create_client(self, endpoint: str, access_key_id: str, secret_access_key: str) -> Any:
+        # boto3默认会话不是线程安全的，每个客户端使用独立会话创建
+        return boto3.session.Session().client(
+            service_name='s3',
+            endpoint_url=endpoint,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            # R2只接受SigV4；未指定时预签名URL会使用SigV2
+            config=Config(max_pool_connections=self.max_pool_connections, signature_version="s3v4")
+        )
+
+    def _evict_idle(self, now: float) -> None:
+        """移除空闲超时的客户端（调用方需持有锁）"""
+        while self._clients:
+            key, (last_used, _) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            del self._clients[key]
+
+    def _lookup(self, key: Tuple[str, str, str]) -> Optional[Any]:
+        """返回缓存的客户端并更新LRU顺序，没有则返回None（调用方需持有锁）"""
+        now = time.monotonic()
+        self._evict_idle(now)
+        entry = self._clients.get(key)
+        if entry is None:
+            return None
+        self._clients[key] = (now, entry[1])
+        self._clients.move_to_end(key)
+        return entry[1]
+
+    def get_client(self, endpoint: str, access_key_id: str, secret_access_key: str) -> Any:
+        """
+        获取（或创建）S3客户端
+        创建客户端较慢，应在线程池中调用
+        """
+        if self.max_size <= 0:
+            return self._create_client(endpoint, access_key_id, secret_access_key)
+
+        key = self._make_key(endpoint, access_key_id, secret_access_key)
+        with self._lock:
+            client = self._lookup(key)
+            if client is not None:
+                self.hits += 1
+                return client
+            creating = self._creating.setdefault(key, [threading.Lock(), 0])
+            creating[1] += 1
+
+        try:
+            # 同一租户的并发请求在租户锁上等待，只创建一次客户端
+            with creating[0]:
+                with self._lock:
+                    client = self._lookup(key)
+                    if client is not None:
+                        self.hits += 1
+                        return client
+                    self.misses += 1
+
+                client = self._create_client(endpoint, access_key_id, secret_access_key)
+                with self._lock:
+                    self._clients[key] = (time.monotonic(), client)
+                    while len(self._clients) > self.max_size:
+                        self._clients.popitem(last=False)
+                return client
+        finally:
+            with self._lock:
+                creating[1] -= 1
+                if creating[1] == 0:
+                    del self._creating[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+# 进程级单例
+s3_client_cache = S3ClientCache()
@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from .config import SOURCE_CACHE_MAX_SIZE, SOURCE_CACHE_TTL
+from .token_cache import hash_token
+
+# 缓存键：(源URL, 端点, 访问密钥ID哈希, 访问密钥哈希, 存储桶, 对象键)
+SourceKey = Tuple[str, str, str, str, str, str]
+# 目标对象：(端点, 存储桶, 对象键)
+ObjectKey = Tuple[str, str, str]
+
+
+def source_validators(headers: Any) -> Optional[Dict[str, str]]:
+    """从响应头中提取ETag/Last-Modified，两者都没有时返回None"""
+    validators = {}
+    if headers.get("etag"):
+        validators["etag"] = headers["etag"]
+    if headers.get("last-modified"):
+        validators["last_modified"] = headers["last-modified"]
+    return validators or None
+
+
+def conditional_headers(validators: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """根据缓存的校验值构建条件GET请求头"""
+    headers = {}
+    if validators:
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+class SourceCache:
+    """
+    源文件条件请求缓存（TTL + LRU淘汰）
+    记录某个URL上传到某个对象时源站返回的ETag/Last-Modified，以及上传后R2中对象的ETag，
+    同一URL再次上传到同一对象且源站校验值未变化时，跳过下载和上传直接返回已有对象
+    命中前调用方需用自己的凭据HeadObject确认对象ETag未变（见FileService.upload_from_url）；
+    通过其他途径写入同一对象时调用invalidate_object
+    """
+
+    def __init__(self, max_size: int = SOURCE_CACHE_MAX_SIZE, ttl: float = SOURCE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[SourceKey, Tuple[float, Dict[str, str], Dict[str, Any], Optional[str]]]" = OrderedDict()
+        # 目标对象 -> 指向它的缓存键，用于按对象失效
+        self._by_object: Dict[ObjectKey, Set[SourceKey]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(
+        file_url: str,
+        endpoint: str,
+        access_key_id: str,
+        secret_access_key: str,
+        bucket_name: str,
+        object_key: str
+    ) -> SourceKey:
+        # 与s3_client_cache一样按完整凭据区分（访问密钥ID会出现在预签名URL中，不是秘密）
+        return (
+            file_url,
+            endpoint.rstrip('/'),
+            hash_token(access_key_id),
+            hash_token(secret_access_key),
+            bucket_name,
+            object_key
+        )
+
+    @staticmethod
+    def _object_of(key: SourceKey) -> ObjectKey:
+        return key[1], key[4], key[5]
+
+    def _remove(self, key: SourceKey) -> None:
+        """删除缓存条目（调用方需持有锁）"""
+        if self._entries.pop(key, None) is None:
+            return
+        object_id = self._object_of(key)
+        keys = self._by_object.get(object_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_object[object_id]
+
+    def get(self, key: SourceKey) -> Optional[Tuple[Dict[str, str], Dict[str, Any], Optional[str]]]:
+        """返回(源站校验值, 上传结果, 上传后对象的ETag)，未缓存或已过期时返回None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, validators, result, object_etag = entry
+            if time.monotonic() >= expires_at:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return validators, result, object_etag
+
+    def set(
+        self,
+        key: SourceKey,
+        validators: Optional[Dict[str, str]],
+        result: Dict[str, Any],
+        object_etag: Optional[str]
+    ) -> None:
+        """记录上传结果，源站未返回校验值或不知道对象ETag时不缓存"""
+        if not self.enabled or not validators or not object_etag:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, validators, result, object_etag)
+            self._by_object.setdefault(self._object_of(key), set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, key: SourceKey) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_object(self, endpoint: str, bucket_name: str, object_key: str) -> None:
+        """目标对象被写入（任意来源URL、直接上传、预签名上传）后，删除指向它的所有缓存条目"""
+        with self._lock:
+            for key in list(self._by_object.get((endpoint.rstrip('/'), bucket_name, object_key), ())):
+                self._remove(key)
+
+    def record(self, hit: bool) -> None:
+        """记录一次条件请求的结果"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_object.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# 进程级单例
+source_cache = SourceCache()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, BinaryIO, Dict, Optional
+
+from .config import SPOOL_DIR, SPOOL_MIN_FREE_BYTES, ADMISSION_RETRY_AFTER
+from .admission import AdmissionRejected
+from .metrics import record_error
+
+
+class SpoolFull(AdmissionRejected):
+    """临时目录剩余空间不足，按准入拒绝处理（返回429和Retry-After）"""
+
+
+class Spool:
+    """
+    下载临时文件所在的目录（可配置为tmpfs等），在每次下载开始前检查剩余空间
+    剩余空间按文件系统的可用空间减去本进程其他下载的预留计算（预留按完整文件大小，偏保守），
+    同一worker中并发的下载不会同时通过检查后一起写满磁盘
+    """
+
+    def __init__(self, directory: Optional[str] = SPOOL_DIR, min_free_bytes: int = SPOOL_MIN_FREE_BYTES):
+        self.directory = directory or tempfile.gettempdir()
+        self.min_free_bytes = min_free_bytes
+        self._reserved: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._rejected = 0
+
+    def _free_bytes(self) -> int:
+        return shutil.disk_usage(self.directory).free
+
+    def create_file(self) -> BinaryIO:
+        """在临时目录中创建临时文件（调用方负责删除），剩余空间低于下限时抛出SpoolFull"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.ensure_space(None, 0)
+        return tempfile.NamedTemporaryFile(dir=self.directory, delete=False)
+
+    def ensure_space(self, file: Optional[BinaryIO], nbytes: int) -> None:
+        """
+        确认还能写入nbytes字节并为file预留，空间不足时抛出SpoolFull
+        预留在release(file)时释放
+        """
+        with self._lock:
+            key = id(file) if file is not None else None
+            pending = sum(n for k, n in self._reserved.items() if k != key)
+            available = self._free_bytes() - pending - self.min_free_bytes
+            if nbytes > available:
+                self._rejected += 1
+                record_error("spool_full")
+                raise SpoolFull(
+                    f"临时目录空间不足：需要{nbytes}字节，可用{max(available, 0)}字节",
+                    ADMISSION_RETRY_AFTER
+                )
+            if key is not None:
+                self._reserved[key] = nbytes
+
+    def release(self, file: BinaryIO) -> None:
+        """文件已写完或已删除，释放其预留"""
+        with self._lock:
+            self._reserved.pop(id(file), None)
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            free_bytes = self._free_bytes()
+        except OSError:
+            free_bytes = None
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "free_bytes": free_bytes,
+                "min_free_bytes": self.min_free_bytes,
+                "reserved_bytes": sum(self._reserved.values()),
+                "rejected": self._rejected
+            }
+
+
+# 进程级临时目录
+spool = Spool()
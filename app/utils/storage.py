@@ -0,0 +1,623 @@
+import contextvars
+import errno
+import io
+import json
+import mmap
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from .config import STORAGE_BACKEND, STORAGE_LOCAL_ROOT, UPLOAD_MMAP_ENABLED
+from .transfer_settings import TransferSettings
+from .tracing import span
+
+# 上传进度回调，参数为本次新增的字节数（与boto3的Callback一致）
+BytesCallback = Callable[[int], None]
+
+# 内核复制时每次调用的最大字节数
+_COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+class StorageBackend:
+    """
+    对象存储后端接口，bucket_name/object_key的含义与S3相同
+    所有方法都是阻塞的，只应通过upload_executor在线程池中调用
+    """
+
+    name = "base"
+
+    def put_object(
+        self,
+        bucket_name: str,
+        object_key: str,
+        body: bytes,
+        content_type: str,
+        metadata: Optional[Dict[str, str]] = None
+    ) -> Optional[str]:
+        """上传整个对象，返回对象的ETag（与head_object的etag相同，无法得知时为None，下同）"""
+        raise NotImplementedError
+
+    def upload_file(
+        self,
+        bucket_name: str,
+        object_key: str,
+        file: BinaryIO,
+        size: int,
+        content_type: str,
+        settings: TransferSettings,
+        callback: Optional[BytesCallback] = None,
+        metadata: Optional[Dict[str, str]] = None
+    ) -> Optional[str]:
+        """从文件开头上传整个文件，settings为已确定的分片参数，返回对象的ETag"""
+        raise NotImplementedError
+
+    def head_object(self, bucket_name: str, object_key: str) -> Optional[Dict[str, Any]]:
+        """返回对象的size、content_type、metadata和etag（对象内容变化时改变），对象不存在时返回None"""
+        raise NotImplementedError
+
+    def delete_object(self, bucket_name: str, object_key: str) -> None:
+        raise NotImplementedError
+
+    def create_multipart_upload(
+        self,
+        bucket_name: str,
+        object_key: str,
+        content_type: str,
+        metadata: Optional[Dict[str, str]] = None
+    ) -> str:
+        """创建分片上传，返回upload_id"""
+        raise NotImplementedError
+
+    def upload_part(self, bucket_name: str, object_key: str, upload_id: str, part_number: int, body: bytes) -> str:
+        """上传一个分片，返回ETag"""
+        raise NotImplementedError
+
+    def complete_multipart_upload(
+        self,
+        bucket_name: str,
+        object_key: str,
+        upload_id: str,
+        parts: List[Dict[str, Any]]
+    ) -> Optional[str]:
+        """parts为按PartNumber排序的[{"PartNumber", "ETag"}]，返回对象的ETag"""
+        raise NotImplementedError
+
+    def abort_multipart_upload(self, bucket_name: str, object_key: str, upload_id: str) -> None:
+        raise NotImplementedError
+
+
+class _MemoryviewReader:
+    """
+    把memoryview包装为只读文件对象（botocore的Body只接受bytes或文件对象）
+    read()返回memoryview切片而不是bytes，数据从mmap直接写入socket和签名哈希，不产生中间副本
+    """
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+    def read(self, size: Optional[int] = -1) -> memoryview:
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        chunk = self._view[self._pos:end]
+        self._pos = end
+        return chunk
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: len(self._view)}[whence]
+        self._pos = min(max(base + offset, 0), len(self._view))
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def release(self) -> None:
+        self._view.release()
+
+
+def _map_file(file: BinaryIO, size: int) -> Optional[mmap.mmap]:
+    """只读映射文件的前size字节，文件对象没有文件描述符时返回None"""
+    try:
+        fd = file.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return None
+    # 下载时写入的数据可能仍在Python缓冲区中
+    file.flush()
+    mapped = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+    if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    return mapped
+
+
+def _close_map(mapped: mmap.mmap) -> None:
+    """
+    关闭映射；botocore仍引用映射区的切片时（如重试中或保存在异常的回溯里）mmap.close()会抛出BufferError，
+    此时不关闭，映射在这些引用释放后由GC回收，避免掩盖上传本身的异常
+    """
+    try:
+        mapped.close()
+    except BufferError:
+        pass
+
+
+class S3Backend(StorageBackend):
+    """S3/R2后端，使用请求凭据对应的boto3客户端（来自s3_client_cache）"""
+
+    name = "s3"
+
+    def __init__(self, s3_client: Any):
+        self.s3_client = s3_client
+
+    @staticmethod
+    def _object_args(bucket_name: str, object_key: str, content_type: str, metadata: Optional[Dict[str, str]]) -> Dict[str, Any]:
+        args = {"Bucket": bucket_name, "Key": object_key, "ContentType": content_type}
+        if metadata:
+            args["Metadata"] = metadata
+        return args
+
+    def put_object(self, bucket_name, object_key, body, content_type, metadata=None):
+        response = self.s3_client.put_object(Body=body, **self._object_args(bucket_name, object_key, content_type, metadata))
+        return response.get("ETag")
+
+    def upload_file(self, bucket_name, object_key, file, size, content_type, settings, callback=None, metadata=None):
+        mapped = _map_file(file, size) if UPLOAD_MMAP_ENABLED and size > 0 else None
+        if mapped is not None:
+            try:
+                return self._upload_mapped(bucket_name, object_key, mapped, content_type, settings, callback, metadata)
+            finally:
+                _close_map(mapped)
+
+        extra_args = {"ContentType": content_type}
+        if metadata:
+            extra_args["Metadata"] = metadata
+        self.s3_client.upload_fileobj(
+            file,
+            bucket_name,
+            object_key,
+            ExtraArgs=extra_args,
+            Config=settings.to_transfer_config(),
+            Callback=callback
+        )
+        # upload_fileobj不返回PutObject/CompleteMultipartUpload的响应
+        return None
+
+    def _send_view(self, view: memoryview, send: Callable[[_MemoryviewReader], Any]) -> Any:
+        """用view包装的Body调用send，结束后释放view，使mmap可以关闭"""
+        reader = _MemoryviewReader(view)
+        try:
+            return send(reader)
+        finally:
+            reader.release()
+
+    def _upload_mapped(
+        self,
+        bucket_name: str,
+        object_key: str,
+        mapped: mmap.mmap,
+        content_type: str,
+        settings: TransferSettings,
+        callback: Optional[BytesCallback],
+        metadata: Optional[Dict[str, str]]
+    ) -> Optional[str]:
+        """
+        从mmap上传，返回对象的ETag：每个分片是映射区的memoryview切片，由botocore直接发送，
+        不像upload_fileobj那样先把整个分片读成bytes；分片大小、阈值和并发数与upload_fileobj一致
+        """
+        size = len(mapped)
+        with memoryview(mapped) as view:
+            if size <= settings.multipart_threshold:
+                with span("r2.put_object", key=object_key, size=size):
+                    etag = self._send_view(view, lambda body: self.put_object(
+                        bucket_name, object_key, body, content_type, metadata
+                    ))
+                if callback is not None:
+                    callback(size)
+                return etag
+
+            with span("r2.create_multipart_upload", key=object_key):
+                upload_id = self.create_multipart_upload(bucket_name, object_key, content_type, metadata)
+
+            def upload(part_number: int, offset: int) -> Dict[str, Any]:
+                part = view[offset:offset + settings.part_size]
+                length = len(part)
+                with span("r2.upload_part", part_number=part_number, size=length):
+                    etag = self._send_view(
+                        part, lambda body: self.upload_part(bucket_name, object_key, upload_id, part_number, body)
+                    )
+                if callback is not None:
+                    callback(length)
+                return {"PartNumber": part_number, "ETag": etag}
+
+            try:
+                with ThreadPoolExecutor(max_workers=settings.concurrency) as pool:
+                    # 每个分片在调用方的上下文中执行，span挂在同一个父span下
+                    futures = [
+                        pool.submit(contextvars.copy_context().run, upload, part_number, offset)
+                        for part_number, offset in enumerate(range(0, size, settings.part_size), start=1)
+                    ]
+                    try:
+                        parts = [future.result() for future in futures]
+                    except BaseException:
+                        for future in futures:
+                            future.cancel()
+                        raise
+                with span("r2.complete_multipart_upload", key=object_key, parts=len(parts)):
+                    return self.complete_multipart_upload(bucket_name, object_key, upload_id, parts)
+            except BaseException:
+                self.abort_multipart_upload(bucket_name, object_key, upload_id)
+                raise
+
+    def head_object(self, bucket_name, object_key):
+        try:
+            head = self.s3_client.head_object(Bucket=bucket_name, Key=object_key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return {
+            "size": head.get("ContentLength"),
+            "content_type": head.get("ContentType"),
+            "metadata": head.get("Metadata", {}),
+            "etag": head.get("ETag")
+        }
+
+    def delete_object(self, bucket_name, object_key):
+        self.s3_client.delete_object(Bucket=bucket_name, Key=object_key)
+
+    def create_multipart_upload(self, bucket_name, object_key, content_type, metadata=None):
+        response = self.s3_client.create_multipart_upload(
+            **self._object_args(bucket_name, object_key, content_type, metadata)
+        )
+        return response["UploadId"]
+
+    def upload_part(self, bucket_name, object_key, upload_id, part_number, body):
+        response = self.s3_client.upload_part(
+            Bucket=bucket_name,
+            Key=object_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        return response["ETag"]
+
+    def complete_multipart_upload(self, bucket_name, object_key, upload_id, parts):
+        response = self.s3_client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=object_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts}
+        )
+        return response.get("ETag")
+
+    def abort_multipart_upload(self, bucket_name, object_key, upload_id):
+        self.s3_client.abort_multipart_upload(Bucket=bucket_name, Key=object_key, UploadId=upload_id)
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    """
+    从src_fd的offset处复制最多count字节到dst_fd的当前位置，返回复制的字节数
+    优先使用copy_file_range（同一文件系统内可直接共享数据块），其次sendfile，都不可用时回退到pread/write
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            return os.copy_file_range(src_fd, dst_fd, count, offset)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    if hasattr(os, "sendfile"):
+        try:
+            return os.sendfile(dst_fd, src_fd, offset, count)
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP):
+                raise
+    return os.write(dst_fd, os.pread(src_fd, count, offset))
+
+
+def _copy_fd(src_fd: int, dst_fd: int, size: int, callback: Optional[BytesCallback] = None) -> None:
+    """在内核中把src_fd的前size字节复制到dst_fd"""
+    offset = 0
+    while offset < size:
+        copied = _copy_range(src_fd, dst_fd, offset, min(size - offset, _COPY_CHUNK_SIZE))
+        if copied == 0:
+            raise IOError(f"源文件在复制过程中被截断：{offset} < {size}")
+        offset += copied
+        if callback is not None:
+            callback(copied)
+
+
+class LocalBackend(StorageBackend):
+    """
+    本地文件系统后端：对象保存在{root}/{bucket}/{key}，内容类型和元数据保存在{root}/.meta下
+    从临时文件写入对象时用copy_file_range/sendfile在内核中复制，不经过用户态缓冲区
+    对象先写入同目录的临时文件再重命名，读者不会看到写了一半的对象
+    """
+
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_LOCAL_ROOT):
+        self.root = os.path.realpath(root)
+
+    def _path(self, bucket_name: str, object_key: str, *, area: str = "", suffix: str = "") -> str:
+        if not bucket_name or bucket_name.startswith(".") or "/" in bucket_name:
+            raise ValueError(f"无效的存储桶名称: {bucket_name}")
+        base = os.path.join(self.root, area) if area else self.root
+        path = os.path.realpath(os.path.join(base, bucket_name, object_key) + suffix)
+        if not path.startswith(os.path.join(base, bucket_name) + os.sep):
+            raise ValueError(f"无效的对象键名: {object_key}")
+        return path
+
+    def _meta_path(self, bucket_name: str, object_key: str) -> str:
+        return self._path(bucket_name, object_key, area=".meta", suffix=".json")
+
+    def _upload_dir(self, upload_id: str) -> str:
+        if not upload_id or os.sep in upload_id or upload_id.startswith("."):
+            raise ValueError(f"无效的upload_id: {upload_id}")
+        return os.path.join(self.root, ".multipart", upload_id)
+
+    def _commit(
+        self,
+        bucket_name: str,
+        object_key: str,
+        content_type: str,
+        metadata: Optional[Dict[str, str]],
+        write: Callable[[int], None]
+    ) -> str:
+        """通过write(fd)写入同目录的临时文件，然后原子替换目标对象并写入元数据，返回对象的ETag"""
+        path = self._path(bucket_name, object_key)
+        meta_path = self._meta_path(bucket_name, object_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            try:
+                write(fd)
+            finally:
+                os.close(fd)
+            os.replace(temp_path, path)
+            etag = self._etag(os.stat(path))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        with open(meta_path, "w") as f:
+            json.dump({"content_type": content_type, "metadata": metadata or {}}, f)
+        return etag
+
+    @staticmethod
+    def _etag(stat: os.stat_result) -> str:
+        # 对象总是整体替换（os.replace），修改时间和inode随每次写入变化
+        return f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    def put_object(self, bucket_name, object_key, body, content_type, metadata=None):
+        def write(fd: int) -> None:
+            view = memoryview(body)
+            while view:
+                view = view[os.write(fd, view):]
+
+        return self._commit(bucket_name, object_key, content_type, metadata, write)
+
+    def upload_file(self, bucket_name, object_key, file, size, content_type, settings, callback=None, metadata=None):
+        try:
+            src_fd = file.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            src_fd = None
+
+        def write(fd: int) -> None:
+            if src_fd is not None:
+                # 下载时写入的数据可能仍在Python缓冲区中
+                file.flush()
+                _copy_fd(src_fd, fd, size, callback)
+                return
+            # 内存中的文件对象（如未落盘的SpooledTemporaryFile）只能经用户态复制
+            file.seek(0)
+            with os.fdopen(os.dup(fd), "wb") as out:
+                while True:
+                    chunk = file.read(_COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    if callback is not None:
+                        callback(len(chunk))
+
+        return self._commit(bucket_name, object_key, content_type, metadata, write)
+
+    def head_object(self, bucket_name, object_key):
+        path = self._path(bucket_name, object_key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        try:
+            with open(self._meta_path(bucket_name, object_key)) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            meta = {}
+        return {
+            "size": stat.st_size,
+            "content_type": meta.get("content_type", "application/octet-stream"),
+            "metadata": meta.get("metadata", {}),
+            "etag": self._etag(stat)
+        }
+
+    def delete_object(self, bucket_name, object_key):
+        for path in (self._path(bucket_name, object_key), self._meta_path(bucket_name, object_key)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def create_multipart_upload(self, bucket_name, object_key, content_type, metadata=None):
+        # 提前校验路径，避免上传完分片后才失败
+        self._path(bucket_name, object_key)
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._upload_dir(upload_id)
+        os.makedirs(upload_dir)
+        with open(os.path.join(upload_dir, "upload.json"), "w") as f:
+            json.dump({
+                "bucket": bucket_name,
+                "key": object_key,
+                "content_type": content_type,
+                "metadata": metadata or {}
+            }, f)
+        return upload_id
+
+    def _load_upload(self, bucket_name: str, object_key: str, upload_id: str) -> Tuple[str, Dict[str, Any]]:
+        upload_dir = self._upload_dir(upload_id)
+        try:
+            with open(os.path.join(upload_dir, "upload.json")) as f:
+                upload = json.load(f)
+        except FileNotFoundError:
+            raise KeyError(f"分片上传不存在: {upload_id}")
+        if (upload["bucket"], upload["key"]) != (bucket_name, object_key):
+            raise KeyError(f"分片上传不属于该对象: {upload_id}")
+        return upload_dir, upload
+
+    def upload_part(self, bucket_name, object_key, upload_id, part_number, body):
+        upload_dir, _ = self._load_upload(bucket_name, object_key, upload_id)
+        with open(os.path.join(upload_dir, f"part-{part_number:05d}"), "wb") as f:
+            f.write(body)
+        return f'"{part_number}-{len(body)}"'
+
+    def complete_multipart_upload(self, bucket_name, object_key, upload_id, parts):
+        upload_dir, upload = self._load_upload(bucket_name, object_key, upload_id)
+
+        def write(fd: int) -> None:
+            for part in parts:
+                part_fd = os.open(os.path.join(upload_dir, f"part-{part['PartNumber']:05d}"), os.O_RDONLY)
+                try:
+                    _copy_fd(part_fd, fd, os.fstat(part_fd).st_size)
+                finally:
+                    os.close(part_fd)
+
+        etag = self._commit(bucket_name, object_key, upload["content_type"], upload["metadata"], write)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return etag
+
+    def abort_multipart_upload(self, bucket_name, object_key, upload_id):
+        upload_dir, _ = self._load_upload(bucket_name, object_key, upload_id)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+class MemoryBackend(StorageBackend):
+    """进程内存后端，用于测试和单独测量传输流水线的吞吐量；进程退出后数据丢失"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._objects: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._uploads: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, bucket_name, object_key, body, content_type, metadata=None):
+        etag = f'"{uuid.uuid4().hex}"'
+        with self._lock:
+            self._objects[(bucket_name, object_key)] = {
+                "body": bytes(body),
+                "content_type": content_type,
+                "metadata": dict(metadata or {}),
+                "etag": etag
+            }
+        return etag
+
+    def upload_file(self, bucket_name, object_key, file, size, content_type, settings, callback=None, metadata=None):
+        file.seek(0)
+        body = file.read(size)
+        if callback is not None:
+            callback(len(body))
+        return self.put_object(bucket_name, object_key, body, content_type, metadata)
+
+    def get_object(self, bucket_name: str, object_key: str) -> Optional[bytes]:
+        """读取对象内容（测试用），不存在时返回None"""
+        with self._lock:
+            entry = self._objects.get((bucket_name, object_key))
+        return entry["body"] if entry is not None else None
+
+    def head_object(self, bucket_name, object_key):
+        with self._lock:
+            entry = self._objects.get((bucket_name, object_key))
+        if entry is None:
+            return None
+        return {
+            "size": len(entry["body"]),
+            "content_type": entry["content_type"],
+            "metadata": dict(entry["metadata"]),
+            "etag": entry["etag"]
+        }
+
+    def delete_object(self, bucket_name, object_key):
+        with self._lock:
+            self._objects.pop((bucket_name, object_key), None)
+
+    def create_multipart_upload(self, bucket_name, object_key, content_type, metadata=None):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {
+                "bucket": bucket_name,
+                "key": object_key,
+                "content_type": content_type,
+                "metadata": dict(metadata or {}),
+                "parts": {}
+            }
+        return upload_id
+
+    def _get_upload(self, bucket_name: str, object_key: str, upload_id: str) -> Dict[str, Any]:
+        upload = self._uploads.get(upload_id)
+        if upload is None or (upload["bucket"], upload["key"]) != (bucket_name, object_key):
+            raise KeyError(f"分片上传不存在: {upload_id}")
+        return upload
+
+    def upload_part(self, bucket_name, object_key, upload_id, part_number, body):
+        with self._lock:
+            self._get_upload(bucket_name, object_key, upload_id)["parts"][part_number] = bytes(body)
+        return f'"{part_number}-{len(body)}"'
+
+    def complete_multipart_upload(self, bucket_name, object_key, upload_id, parts):
+        with self._lock:
+            upload = self._get_upload(bucket_name, object_key, upload_id)
+            body = b"".join(upload["parts"][part["PartNumber"]] for part in parts)
+            del self._uploads[upload_id]
+        return self.put_object(bucket_name, object_key, body, upload["content_type"], upload["metadata"])
+
+    def abort_multipart_upload(self, bucket_name, object_key, upload_id):
+        with self._lock:
+            self._get_upload(bucket_name, object_key, upload_id)
+            del self._uploads[upload_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "objects": len(self._objects),
+                "bytes": sum(len(entry["body"]) for entry in self._objects.values()),
+                "multipart_uploads": len(self._uploads)
+            }
+
+
+_shared_backend: Optional[StorageBackend] = None
+
+
+def shared_storage_backend() -> Optional[StorageBackend]:
+    """
+    STORAGE_BACKEND为local或memory时返回进程级后端（忽略请求中的endpoint和凭据）
+    为s3时返回None，由调用方按请求凭据创建S3Backend
+    """
+    global _shared_backend
+    if STORAGE_BACKEND == "s3":
+        return None
+    if _shared_backend is None:
+        if STORAGE_BACKEND == "local":
+            _shared_backend = LocalBackend()
+        elif STORAGE_BACKEND == "memory":
+            _shared_backend = MemoryBackend()
+        else:
+            raise ValueError(f"不支持的存储后端: {STORAGE_BACKEND}")
+    return _shared_backend
@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+
+from .config import TOKEN_CACHE_MAX_SIZE, TOKEN_CACHE_TTL, TOKEN_CACHE_NEGATIVE_TTL
+
+
+def hash_token(token: str) -> str:
+    """计算Token的哈希值，缓存中不保存Token明文"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenCache:
+    """
+    Token验证结果的进程内缓存（TTL + LRU淘汰）
+    有效结果与无效结果使用不同的TTL，有效结果的过期时间不会晚于Token本身的expires_at
+    """
+
+    def __init__(
+        self,
+        max_size: int = TOKEN_CACHE_MAX_SIZE,
+        ttl: float = TOKEN_CACHE_TTL,
+        negative_ttl: float = TOKEN_CACHE_NEGATIVE_TTL
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, Tuple[float, bool, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _expires_at(self, is_valid: bool, token_data: Optional[Dict[str, Any]]) -> float:
+        """计算缓存条目的过期时刻（time.monotonic时间轴）"""
+        now = time.monotonic()
+        if not is_valid:
+            return now + self.negative_ttl
+
+        ttl = self.ttl
+        if token_data and token_data.get("is_permanent", "").lower() != "true":
+            expires_at = token_data.get("expires_at")
+            if expires_at:
+                try:
+                    expires_date = datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S")
+                    ttl = min(ttl, (expires_date - datetime.now()).total_seconds())
+                except ValueError:
+                    # 无法解析过期时间时不缓存
+                    ttl = 0
+        return now + ttl
+
+    def get(self, token: str) -> Optional[Tuple[bool, Optional[Dict[str, Any]]]]:
+        """获取缓存的验证结果，未命中或已过期时返回None"""
+        if not self.enabled:
+            return None
+
+        key = hash_token(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, is_valid, token_data = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return is_valid, token_data
+
+    def set(self, token: str, is_valid: bool, token_data: Optional[Dict[str, Any]]) -> None:
+        """写入验证结果"""
+        if not self.enabled:
+            return
+
+        expires_at = self._expires_at(is_valid, token_data)
+        if expires_at <= time.monotonic():
+            return
+
+        key = hash_token(token)
+        with self._lock:
+            self._entries[key] = (expires_at, is_valid, token_data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str) -> None:
+        """删除指定Token的缓存条目"""
+        with self._lock:
+            self._entries.pop(hash_token(token), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# 进程级单例
+token_cache = TokenCache()
@@ -3,14 +3,21 @@ import httpx
 import json
 from datetime import datetime, timedelta
 import secrets
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, Tuple, List
 import asyncio
 
 from .config import QINGFLOW_API_BASE_URL, QINGFLOW_APP_ID, QINGFLOW_ACCESS_TOKEN, FIELD_ID_MAP
+from .token_cache import token_cache
+from .token_store import token_store
+from .http_client import get_qingflow_client
+from .record_codec import encode_answers, decode_answers, search_query
+from .metrics import observe_phase, record_error, QINGFLOW_RETRIES
+from .tracing import span
 
 
 class TokenService:
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        self._client = client
         self.api_base_url = QINGFLOW_API_BASE_URL
         self.app_id = QINGFLOW_APP_ID
         self.access_token = QINGFLOW_ACCESS_TOKEN
@@ -20,10 +27,68 @@ class TokenService:
             "accessToken": self.access_token
         }
 
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """青流API客户端，默认使用应用级共享连接池"""
+        return self._client or get_qingflow_client()
+
     def _format_datetime(self, dt: datetime) -> str:
         """格式化日期时间为青流平台接受的格式"""
         return dt.strftime("%Y-%m-%d %H:%M:%S")
 
+    def parse_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """将青流记录的answers解析为Token数据"""
+        return decode_answers(record.get("answers", []))
+
+    @staticmethod
+    def _is_token_data_valid(token_data: Optional[Dict[str, Any]]) -> bool:
+        """检查Token数据是否为已激活且未过期"""
+        if not token_data:
+            return False
+        
+        # 检查是否激活
+        if token_data.get("active", "").lower() != "true":
+            return False
+        
+        # 检查是否永久有效或未过期
+        is_permanent = token_data.get("is_permanent", "").lower() == "true"
+        if not is_permanent:
+            expires_at = token_data.get("expires_at")
+            if expires_at:
+                expires_date = datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S")
+                if datetime.now() > expires_date:
+                    return False
+        
+        return True
+
+    async def fetch_records(self, page_num: int, page_size: int) -> List[Dict[str, Any]]:
+        """分页查询青流应用中的Token记录，用于同步本地Token索引"""
+        max_retries = 3
+        retry_count = 0
+        
+        while retry_count < max_retries:
+            try:
+                url = f"{self.api_base_url}/app/{self.app_id}/apply/filter"
+                payload = {"pageSize": page_size, "pageNum": page_num}
+                
+                with observe_phase("qingflow_fetch"), span("qingflow.fetch", "qingflow", attempt=retry_count + 1, page=page_num):
+                    response = await self.client.post(url, headers=self.headers, json=payload)
+                response.raise_for_status()
+                return response.json().get("result", {}).get("result", []) or []
+                
+            except httpx.ConnectTimeout:
+                # 连接超时，尝试重试
+                retry_count += 1
+                if retry_count >= max_retries:
+                    record_error("qingflow")
+                    raise Exception(f"查询Token记录连接超时，已重试{retry_count}次")
+                QINGFLOW_RETRIES.labels("fetch").inc()
+                # 等待短暂时间后重试
+                await asyncio.sleep(1)
+            except httpx.HTTPError as e:
+                record_error("qingflow")
+                raise Exception(f"查询Token记录失败: {str(e)}")
+
     async def create_token(self, username: str, email: str, expires_in_days: int = 30) -> Dict[str, Any]:
         """创建新的API Token"""
         # 生成唯一ID和Token
@@ -36,64 +101,21 @@ class TokenService:
         expires_at = None if is_permanent else created_at + timedelta(days=expires_in_days)
         
         # 准备请求体
-        answers = []
-        
-        # ID字段
-        answers.append({
-            "queId": int(self.field_id_map["id"]),
-            "queTitle": "id",
-            "values": [{"value": token_id}]
-        })
-        
-        # 激活状态
-        answers.append({
-            "queId": int(self.field_id_map["active"]),
-            "queTitle": "active",
-            "values": [{"value": "true"}]
-        })
-        
-        # 用户名
-        answers.append({
-            "queId": int(self.field_id_map["username"]),
-            "queTitle": "username",
-            "values": [{"value": username}]
-        })
-        
-        # 邮箱
-        answers.append({
-            "queId": int(self.field_id_map["email"]),
-            "queTitle": "email",
-            "values": [{"value": email}]
-        })
-        
-        # Token值
-        answers.append({
-            "queId": int(self.field_id_map["token"]),
-            "queTitle": "token",
-            "values": [{"value": token_value}]
-        })
-        
-        # 创建时间
-        answers.append({
-            "queId": int(self.field_id_map["created_at"]),
-            "queTitle": "created_at",
-            "values": [{"value": self._format_datetime(created_at)}]
-        })
+        fields = {
+            "id": token_id,
+            "active": "true",
+            "username": username,
+            "email": email,
+            "token": token_value,
+            "created_at": self._format_datetime(created_at)
+        }
         
         # 过期时间
         if not is_permanent:
-            answers.append({
-                "queId": int(self.field_id_map["expires_at"]),
-                "queTitle": "expires_at",
-                "values": [{"value": self._format_datetime(expires_at)}]
-            })
+            fields["expires_at"] = self._format_datetime(expires_at)
         
         # 是否永久有效
-        answers.append({
-            "queId": int(self.field_id_map["is_permanent"]),
-            "queTitle": "is_permanent",
-            "values": [{"value": str(is_permanent).lower()}]
-        })
+        fields["is_permanent"] = str(is_permanent).lower()
         
         # 发送请求创建记录
         max_retries = 3
@@ -102,32 +124,54 @@ class TokenService:
         while retry_count < max_retries:
             try:
                 url = f"{self.api_base_url}/app/{self.app_id}/apply"
-                payload = {"answers": answers}
+                payload = {"answers": encode_answers(fields)}
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(url, headers=self.headers, json=payload)
-                    response.raise_for_status()
-                    
-                    return {
-                        "id": token_id,
-                        "token": token_value,
-                        "created_at": created_at.isoformat(),
-                        "expires_at": expires_at.isoformat() if expires_at else None,
-                        "is_permanent": is_permanent
-                    }
+                with observe_phase("qingflow_create"), span("qingflow.create", "qingflow", attempt=retry_count + 1):
+                    response = await self.client.post(url, headers=self.headers, json=payload)
+                response.raise_for_status()
+                
+                # 写入本地Token索引
+                try:
+                    apply_id = (response.json().get("result") or {}).get("applyId")
+                except ValueError:
+                    apply_id = None
+                token_store.put(token_value, fields, apply_id)
+                
+                return {
+                    "id": token_id,
+                    "token": token_value,
+                    "created_at": created_at.isoformat(),
+                    "expires_at": expires_at.isoformat() if expires_at else None,
+                    "is_permanent": is_permanent
+                }
                     
             except httpx.ConnectTimeout:
                 # 连接超时，尝试重试
                 retry_count += 1
                 if retry_count >= max_retries:
+                    record_error("qingflow")
                     raise Exception(f"创建Token连接超时，已重试{retry_count}次")
+                QINGFLOW_RETRIES.labels("create").inc()
                 # 等待短暂时间后重试
                 await asyncio.sleep(1)
             except httpx.HTTPError as e:
+                record_error("qingflow")
                 raise Exception(f"Failed to create token: {str(e)}")
 
-    async def validate_token(self, token: str) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
-        """验证Token是否有效，并返回Token数据和数据ID"""
+    async def validate_token(
+        self,
+        token: str,
+        use_local: bool = True
+    ) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
+        """
+        验证Token是否有效，并返回Token数据和数据ID
+        本地Token索引可用时优先使用；索引中无记录或记录显示无效时（可能尚未同步到最新状态）查询青流
+        """
+        if use_local:
+            local = token_store.lookup(token)
+            if local is not None and self._is_token_data_valid(local[0]):
+                return True, local[0], local[1]
+        
         max_retries = 3
         retry_count = 0
         
@@ -138,72 +182,49 @@ class TokenService:
                 payload = {
                     "pageSize": 1,
                     "pageNum": 1,
-                    "queries": [
-                        {
-                            "queId": int(self.field_id_map["token"]),
-                            "queTitle": "token",
-                            "searchKey": token
-                        }
-                    ]
+                    "queries": [search_query("token", token)]
                 }
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(url, headers=self.headers, json=payload)
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    # 检查是否有结果
-                    results = data.get("result", {}).get("result", [])
-                    if not results or len(results) == 0:
-                        return False, None, None
-                    
-                    # 获取数据ID
-                    apply_id = results[0].get("applyId")
-                    
-                    # 解析Token数据
-                    token_data = {}
-                    for answer in results[0].get("answers", []):
-                        que_id = str(answer.get("queId"))
-                        
-                        # 查找字段名称
-                        field_name = None
-                        for key, value in self.field_id_map.items():
-                            if value == que_id:
-                                field_name = key
-                                break
-                        
-                        if field_name and answer.get("values") and len(answer.get("values")) > 0:
-                            token_data[field_name] = answer.get("values")[0].get("value")
-                    
-                    # 验证Token是否有效
-                    if not token_data:
-                        return False, None, None
-                    
-                    # 检查是否激活
-                    if token_data.get("active", "").lower() != "true":
-                        return False, None, None
-                    
-                    # 检查是否永久有效或未过期
-                    is_permanent = token_data.get("is_permanent", "").lower() == "true"
-                    if not is_permanent:
-                        expires_at = token_data.get("expires_at")
-                        if expires_at:
-                            expires_date = datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S")
-                            if datetime.now() > expires_date:
-                                return False, None, None
-                    
-                    return True, token_data, apply_id
+                with observe_phase("qingflow_validate"), span("qingflow.validate", "qingflow", attempt=retry_count + 1):
+                    response = await self.client.post(url, headers=self.headers, json=payload)
+                response.raise_for_status()
+                data = response.json()
+                
+                # 检查是否有结果
+                results = data.get("result", {}).get("result", [])
+                if not results or len(results) == 0:
+                    return False, None, None
+                
+                # 获取数据ID
+                apply_id = results[0].get("applyId")
+                
+                # 解析Token数据
+                token_data = self.parse_record(results[0])
+                
+                # 写入本地Token索引
+                if token_data.get("token") == token:
+                    token_store.put(token, token_data, apply_id)
+                
+                # 验证Token是否有效
+                if not self._is_token_data_valid(token_data):
+                    return False, None, None
+                
+                return True, token_data, apply_id
                     
             except httpx.ConnectTimeout:
                 # 连接超时，尝试重试
                 retry_count += 1
                 if retry_count >= max_retries:
+                    record_error("qingflow")
                     raise Exception(f"Token验证连接超时，已重试{retry_count}次")
+                QINGFLOW_RETRIES.labels("validate").inc()
                 # 等待短暂时间后重试
                 await asyncio.sleep(1)
             except httpx.HTTPError as e:
+                record_error("qingflow")
                 raise Exception(f"Token validation failed: {str(e)}")
             except Exception as e:
+                record_error("qingflow")
                 raise Exception(f"Token validation error: {str(e)}")
 
     async def renew_token(self, token: str, extend_days: int = 30) -> Dict[str, Any]:
@@ -215,7 +236,8 @@ class TokenService:
         """
         try:
             # 先验证Token并获取数据ID
-            is_valid, token_data, apply_id = await self.validate_token(token)
+            # 续期需要最新的记录，不使用本地Token索引
+            is_valid, token_data, apply_id = await self.validate_token(token, use_local=False)
             
             if not is_valid or not apply_id:
                 raise Exception("无效的Token或Token已过期")
@@ -224,7 +246,7 @@ class TokenService:
             is_permanent = token_data.get("is_permanent", "").lower() == "true"
             
             # 准备更新请求
-            answers = []
+            updates = {}
             old_expires_at = token_data.get("expires_at")
             
             # 情况1: 将永久有效的token修改为有限期限
@@ -234,18 +256,10 @@ class TokenService:
                 new_expires_at = current_time + timedelta(days=extend_days)
                 
                 # 更新is_permanent字段为false
-                answers.append({
-                    "queId": int(self.field_id_map["is_permanent"]),
-                    "queTitle": "is_permanent",
-                    "values": [{"value": "false"}]
-                })
+                updates["is_permanent"] = "false"
                 
                 # 设置新的过期时间
-                answers.append({
-                    "queId": int(self.field_id_map["expires_at"]),
-                    "queTitle": "expires_at",
-                    "values": [{"value": self._format_datetime(new_expires_at)}]
-                })
+                updates["expires_at"] = self._format_datetime(new_expires_at)
                 
                 message = "Token已从永久有效修改为有限期限"
             
@@ -261,18 +275,10 @@ class TokenService:
             # 情况3: 将有期限的token设为永久有效
             elif not is_permanent and extend_days == -99:
                 # 更新is_permanent字段
-                answers.append({
-                    "queId": int(self.field_id_map["is_permanent"]),
-                    "queTitle": "is_permanent",
-                    "values": [{"value": "true"}]
-                })
+                updates["is_permanent"] = "true"
                 
                 # 清空expires_at字段
-                answers.append({
-                    "queId": int(self.field_id_map["expires_at"]),
-                    "queTitle": "expires_at",
-                    "values": [{"value": ""}]
-                })
+                updates["expires_at"] = ""
                 
                 new_expires_at = None
                 message = "Token已设为永久有效"
@@ -284,35 +290,37 @@ class TokenService:
                 new_expires_at = current_expires_at + timedelta(days=extend_days)
                 
                 # 更新过期时间
-                answers.append({
-                    "queId": int(self.field_id_map["expires_at"]),
-                    "queTitle": "expires_at",
-                    "values": [{"value": self._format_datetime(new_expires_at)}]
-                })
+                updates["expires_at"] = self._format_datetime(new_expires_at)
                 
                 message = "Token有效期已延长"
             
             # 发送更新请求
             url = f"{self.api_base_url.replace('/app', '')}/{self.app_id}/apply/{apply_id}"
-            payload = {"answers": answers}
+            payload = {"answers": encode_answers(updates)}
             
             max_retries = 3
             retry_count = 0
             
             while retry_count < max_retries:
                 try:
-                    async with httpx.AsyncClient(timeout=30.0) as client:
-                        response = await client.post(url, headers=self.headers, json=payload)
-                        response.raise_for_status()
-                        break
+                    with observe_phase("qingflow_renew"), span("qingflow.renew", "qingflow", attempt=retry_count + 1):
+                        response = await self.client.post(url, headers=self.headers, json=payload)
+                    response.raise_for_status()
+                    break
                 except httpx.ConnectTimeout:
                     # 连接超时，尝试重试
                     retry_count += 1
                     if retry_count >= max_retries:
+                        record_error("qingflow")
                         raise Exception(f"续期Token连接超时，已重试{retry_count}次")
+                    QINGFLOW_RETRIES.labels("renew").inc()
                     # 等待短暂时间后重试
                     await asyncio.sleep(1)
             
+            # 有效期已变更，使缓存的验证结果失效并更新本地Token索引
+            token_cache.invalidate(token)
+            token_store.put(token, dict(token_data, **updates), apply_id)
+            
             # 构建返回结果
             result = {
                 "status": "success",
@@ -331,6 +339,18 @@ class TokenService:
             return result
                 
         except httpx.HTTPError as e:
+            record_error("qingflow")
             raise Exception(f"续期Token失败: {str(e)}")
         except Exception as e:
-            raise Exception(f"续期Token错误: {str(e)}")
\ No newline at end of file
+            raise Exception(f"续期Token错误: {str(e)}")
+
+
+_token_service: Optional[TokenService] = None
+
+
+def get_token_service() -> TokenService:
+    """FastAPI依赖项：返回进程级TokenService单例"""
+    global _token_service
+    if _token_service is None:
+        _token_service = TokenService()
+    return _token_service
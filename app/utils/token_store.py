@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .config import (
+    SERVICE_NAME,
+    TOKEN_STORE_ENABLED,
+    TOKEN_STORE_SYNC_INTERVAL,
+    TOKEN_STORE_MAX_STALENESS,
+    TOKEN_STORE_PAGE_SIZE,
+)
+from .token_cache import hash_token
+
+logger = logging.getLogger(SERVICE_NAME)
+
+# 防止青流接口分页异常时无限翻页
+_MAX_SYNC_PAGES = 10000
+
+
+class TokenStore:
+    """
+    本地Token索引：按Token哈希保存青流记录（token_data, apply_id）
+    后台任务定期分页拉取青流应用中的全部记录并整体替换索引，create/renew时直接写入
+    同步期间写入的记录在替换时合并到新索引，不会被分页拉取到的旧记录覆盖
+    青流不可用导致同步失败时，索引在TOKEN_STORE_MAX_STALENESS秒内仍可使用
+    """
+
+    def __init__(
+        self,
+        enabled: bool = TOKEN_STORE_ENABLED,
+        sync_interval: float = TOKEN_STORE_SYNC_INTERVAL,
+        max_staleness: float = TOKEN_STORE_MAX_STALENESS,
+        page_size: int = TOKEN_STORE_PAGE_SIZE
+    ):
+        self.enabled = enabled
+        self.sync_interval = sync_interval
+        self.max_staleness = max_staleness
+        self.page_size = page_size
+        self._index: Dict[str, Tuple[Dict[str, Any], Optional[str]]] = {}
+        self._last_sync: Optional[float] = None
+        # 同步进行中时记录期间put的记录，同步结束后合并
+        self._pending: Optional[Dict[str, Tuple[Dict[str, Any], Optional[str]]]] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self.sync_failures = 0
+
+    @property
+    def age(self) -> Optional[float]:
+        """距上次成功同步的秒数，从未同步时为None"""
+        if self._last_sync is None:
+            return None
+        return time.monotonic() - self._last_sync
+
+    @property
+    def usable(self) -> bool:
+        """索引已同步且未超过允许的陈旧时间"""
+        age = self.age
+        return self.enabled and age is not None and age <= self.max_staleness
+
+    def lookup(self, token: str) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+        """查找Token记录，索引不可用或不存在时返回None"""
+        if not self.usable:
+            return None
+        return self._index.get(hash_token(token))
+
+    def put(self, token: str, token_data: Dict[str, Any], apply_id: Optional[str]) -> None:
+        """写入（或更新）单条Token记录"""
+        if self.enabled:
+            key = hash_token(token)
+            self._index[key] = (token_data, apply_id)
+            if self._pending is not None:
+                self._pending[key] = (token_data, apply_id)
+
+    async def sync(self, token_service: Any) -> int:
+        """分页拉取全部Token记录并替换索引，返回记录数"""
+        index: Dict[str, Tuple[Dict[str, Any], Optional[str]]] = {}
+        pending: Dict[str, Tuple[Dict[str, Any], Optional[str]]] = {}
+        self._pending = pending
+        try:
+            for page_num in range(1, _MAX_SYNC_PAGES + 1):
+                records = await token_service.fetch_records(page_num, self.page_size)
+                for record in records:
+                    token_data = token_service.parse_record(record)
+                    token = token_data.get("token")
+                    if token:
+                        index[hash_token(token)] = (token_data, record.get("applyId"))
+                if len(records) < self.page_size:
+                    break
+
+            # 同步期间create/renew写入的记录比分页拉取到的更新
+            index.update(pending)
+            self._index = index
+            self._last_sync = time.monotonic()
+            return len(index)
+        finally:
+            if self._pending is pending:
+                self._pending = None
+
+    async def _sync_loop(self, token_service: Any) -> None:
+        while True:
+            try:
+                count = await self.sync(token_service)
+                self.sync_failures = 0
+                logger.debug(f"本地Token索引已同步，共{count}条")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.sync_failures += 1
+                logger.warning(f"本地Token索引同步失败（连续{self.sync_failures}次）: {str(e)}")
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self, token_service: Any) -> None:
+        """启动后台同步任务"""
+        if self.enabled and self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_loop(token_service))
+
+    async def stop(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        age = self.age
+        return {
+            "enabled": self.enabled,
+            "size": len(self._index),
+            "age": round(age, 1) if age is not None else None,
+            "usable": self.usable,
+            "sync_failures": self.sync_failures
+        }
+
+
+# 进程级单例
+token_store = TokenStore()
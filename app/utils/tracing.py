@@ -0,0 +1,122 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from .config import SERVICE_NAME, TRACING_ENABLED, SERVER_TIMING_ENABLED
+
+logger = logging.getLogger(SERVICE_NAME)
+
+# 当前请求各阶段的累计耗时（秒），由ServerTimingMiddleware在请求开始时设置
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("server_timings", default=None)
+
+# 未启用追踪或未安装opentelemetry时为None，span()只记录Server-Timing
+_tracer: Optional[Any] = None
+_provider: Optional[Any] = None
+
+
+def init_tracing() -> None:
+    """
+    初始化OpenTelemetry追踪，应在worker进程启动后调用（BatchSpanProcessor的后台线程不能跨fork）
+    安装了opentelemetry-sdk和OTLP导出器时按OTEL_*环境变量导出span；
+    只安装了opentelemetry-api时使用外部配置的TracerProvider（如opentelemetry-instrument）
+    """
+    global _tracer, _provider
+    if not TRACING_ENABLED or _tracer is not None:
+        return
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("未安装opentelemetry-api，请求追踪保持关闭")
+        return
+
+    if isinstance(trace.get_tracer_provider(), trace.ProxyTracerProvider):
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("未安装opentelemetry-sdk或OTLP导出器，span不会被导出")
+        else:
+            _provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+            _provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(_provider)
+
+    _tracer = trace.get_tracer(SERVICE_NAME)
+
+
+def shutdown_tracing() -> None:
+    """导出剩余的span"""
+    global _tracer, _provider
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+    _tracer = None
+
+
+@contextmanager
+def span(name: str, timing: Optional[str] = None, **attributes: Any) -> Iterator[Optional[Any]]:
+    """
+    追踪一个代码块：启用追踪时创建OpenTelemetry span（异常会记录在span上）
+    指定timing时把耗时累加到当前请求Server-Timing的对应阶段；并行执行的代码块不应指定timing
+    """
+    start = time.perf_counter()
+    try:
+        if _tracer is None:
+            yield None
+        else:
+            attributes = {key: value for key, value in attributes.items() if value is not None}
+            with _tracer.start_as_current_span(name, attributes=attributes) as current:
+                yield current
+    finally:
+        if timing is not None:
+            timings = _timings.get()
+            if timings is not None:
+                timings[timing] = timings.get(timing, 0.0) + time.perf_counter() - start
+
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    """格式化为Server-Timing头，单位毫秒"""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI中间件：为每个请求建立阶段耗时记录，响应头中返回Server-Timing，例如
+    Server-Timing: auth;dur=35.2, qingflow;dur=33.9, source;dur=812.4, r2;dur=1204.7, total;dur=2061.3
+    启用追踪时同时创建请求的根span
+    流式响应（NDJSON）在响应头发送之后执行的阶段不计入Server-Timing
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and SERVER_TIMING_ENABLED:
+                timings["total"] = time.perf_counter() - start
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", format_server_timing(timings).encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            with span(f"{scope['method']} request", **{"http.method": scope["method"], "http.target": scope["path"]}) as root:
+                await self.app(scope, receive, send_with_timing)
+                # 路由匹配后使用路由模板命名根span
+                route = getattr(scope.get("route"), "path", None)
+                if root is not None and route:
+                    root.update_name(f"{scope['method']} {route}")
+                    root.set_attribute("http.route", route)
+        finally:
+            _timings.reset(token)
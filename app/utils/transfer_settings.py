@@ -0,0 +1,74 @@
+import math
+from typing import Optional
+
+from boto3.s3.transfer import TransferConfig
+
+from .config import (
+    MULTIPART_THRESHOLD,
+    MULTIPART_PART_SIZE,
+    MULTIPART_CONCURRENCY,
+    MULTIPART_MAX_CONCURRENCY,
+    MULTIPART_ADAPTIVE_PART_SIZE,
+    MULTIPART_TARGET_PARTS,
+    MULTIPART_MAX_PART_SIZE,
+)
+
+# S3协议要求除最后一个分片外，每个分片不小于5MB，且分片数不超过10000
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+_MB = 1024 * 1024
+
+
+class TransferSettings:
+    """
+    分片上传参数：分片阈值、分片大小、分片并发数
+    未指定的参数使用部署配置；开启自适应时根据已知的文件大小选择分片大小
+    """
+
+    def __init__(
+        self,
+        multipart_threshold: Optional[int] = None,
+        part_size: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ):
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.concurrency = concurrency
+
+    @staticmethod
+    def adaptive_part_size(content_length: int) -> int:
+        """按目标分片数计算分片大小，向上取整到MB"""
+        part_size = math.ceil(content_length / MULTIPART_TARGET_PARTS / _MB) * _MB
+        part_size = min(max(part_size, MIN_PART_SIZE), MULTIPART_MAX_PART_SIZE)
+        # 保证分片数不超过S3上限
+        return max(part_size, math.ceil(content_length / MAX_PARTS))
+
+    def resolve(self, content_length: Optional[int] = None) -> "TransferSettings":
+        """
+        返回所有参数均已确定的设置
+        分片大小和分片阈值不超过MULTIPART_MAX_PART_SIZE：流式和直接上传会在内存中缓冲到阈值、按分片读取，
+        过大的值会退化为整文件读入内存（仅当文件过大、分片数会超过上限时放宽分片大小）
+        """
+        if self.part_size:
+            part_size = self.part_size
+        elif MULTIPART_ADAPTIVE_PART_SIZE and content_length:
+            part_size = self.adaptive_part_size(content_length)
+        else:
+            part_size = MULTIPART_PART_SIZE
+
+        max_part_size = max(MULTIPART_MAX_PART_SIZE, math.ceil((content_length or 0) / MAX_PARTS))
+        concurrency = self.concurrency or MULTIPART_CONCURRENCY
+
+        return TransferSettings(
+            multipart_threshold=min(self.multipart_threshold or MULTIPART_THRESHOLD, MULTIPART_MAX_PART_SIZE),
+            part_size=min(max(part_size, MIN_PART_SIZE), max_part_size),
+            concurrency=min(max(concurrency, 1), MULTIPART_MAX_CONCURRENCY)
+        )
+
+    def to_transfer_config(self) -> TransferConfig:
+        """转换为boto3 upload_fileobj使用的TransferConfig"""
+        return TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.part_size,
+            max_concurrency=self.concurrency
+        )
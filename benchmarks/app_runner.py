@@ -0,0 +1,80 @@
+"""
+以单个uvicorn worker运行被测服务，并增加性能测试用的统计端点：
+    GET  /__bench__/stats   事件循环延迟（p50/p99/max）、当前RSS和峰值RSS
+    POST /__bench__/reset   清空事件循环延迟样本
+
+由run_load启动，一般不需要单独运行:
+    python -m benchmarks.app_runner --port 5073
+"""
+import argparse
+import asyncio
+import resource
+import time
+from typing import List
+
+import uvicorn
+
+from app.main import app
+
+# 事件循环延迟采样间隔（秒）
+_SAMPLE_INTERVAL = 0.01
+
+_lag_samples: List[float] = []
+
+
+async def _sample_loop_lag() -> None:
+    """定期sleep并记录实际唤醒时间比预期晚了多久"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + _SAMPLE_INTERVAL
+        await asyncio.sleep(_SAMPLE_INTERVAL)
+        _lag_samples.append(max(loop.time() - expected, 0.0))
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)]
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize()
+
+
+@app.on_event("startup")
+async def _start_sampler() -> None:
+    app.state.bench_sampler = asyncio.create_task(_sample_loop_lag())
+
+
+@app.get("/__bench__/stats", include_in_schema=False)
+async def bench_stats():
+    samples = list(_lag_samples)
+    return {
+        "loop_lag_p50_ms": round(_percentile(samples, 50) * 1000, 2),
+        "loop_lag_p99_ms": round(_percentile(samples, 99) * 1000, 2),
+        "loop_lag_max_ms": round(max(samples, default=0.0) * 1000, 2),
+        "rss_mb": round(_rss_bytes() / 1024 / 1024, 1),
+        # Linux下ru_maxrss单位为KB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "timestamp": time.time()
+    }
+
+
+@app.post("/__bench__/reset", include_in_schema=False)
+async def bench_reset():
+    _lag_samples.clear()
+    return {"status": "ok"}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5073)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
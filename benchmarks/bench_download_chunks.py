@@ -0,0 +1,153 @@
+"""
+下载写入微基准：对比旧实现（aiter_bytes(chunk_size=8192)，每8KB写一次临时文件、检查大小并上报进度）
+与FileService._write_response（自适应批次 + 可复用bytearray缓冲区）的CPU耗时
+
+源站为本地启动的 benchmarks.origin_server 子进程，其CPU不计入结果；
+结果为本进程每下载1GB消耗的CPU秒数（process_time），以及写入临时文件的次数
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_download_chunks
+    python -m benchmarks.bench_download_chunks --size 200MiB --repeat 5 --hash
+    DOWNLOAD_CHUNK_MAX_SIZE=1048576 python -m benchmarks.bench_download_chunks
+"""
+import argparse
+import asyncio
+import hashlib
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, IO, List, Optional
+
+import httpx
+
+from app.utils.file_service import FileService
+from benchmarks.run_load import parse_size, format_size
+
+
+class CountingFile:
+    """记录write调用次数的临时文件包装"""
+
+    def __init__(self, file: IO[bytes]):
+        self.file = file
+        self.writes = 0
+
+    def write(self, data) -> int:
+        self.writes += 1
+        return self.file.write(data)
+
+
+async def legacy_write_response(response: httpx.Response, temp_file: CountingFile, max_file_size: int,
+                                progress=None, hasher: Optional[Any] = None) -> int:
+    """优化前的_write_response"""
+    file_size = 0
+    content_length = response.headers.get("content-length")
+    total_bytes = int(content_length) if content_length and content_length.isdigit() else None
+    async for chunk in response.aiter_bytes(chunk_size=8192):
+        file_size += len(chunk)
+        if file_size > max_file_size:
+            raise ValueError(f"文件大小超过限制：{file_size} > {max_file_size}")
+        temp_file.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+        if progress is not None:
+            progress("downloading", file_size, total_bytes)
+    return file_size
+
+
+async def measure(client: httpx.AsyncClient, url: str, variant: str, args: argparse.Namespace) -> Dict[str, Any]:
+    service = FileService()
+    service.max_file_size = args.size
+    progress_calls = 0
+
+    def progress(stage: str, done: int, total: Optional[int]) -> None:
+        nonlocal progress_calls
+        progress_calls += 1
+
+    cpu = wall = 0.0
+    writes = 0
+    for _ in range(args.repeat):
+        with tempfile.TemporaryFile(dir=args.dir) as raw:
+            temp_file = CountingFile(raw)
+            hasher = hashlib.sha256() if args.hash else None
+            cpu_start, wall_start = time.process_time(), time.perf_counter()
+            async with client.stream("GET", url) as response:
+                response.raise_for_status()
+                if variant == "legacy":
+                    size = await legacy_write_response(response, temp_file, args.size, progress, hasher)
+                else:
+                    size = await service._write_response(response, temp_file, progress, hasher)
+            cpu += time.process_time() - cpu_start
+            wall += time.perf_counter() - wall_start
+            writes += temp_file.writes
+            if size != args.size:
+                raise Exception(f"下载大小不符: {size} != {args.size}")
+
+    gigabytes = args.size * args.repeat / 1024 ** 3
+    return {
+        "variant": variant,
+        "cpu_s_per_gb": cpu / gigabytes,
+        "mb_per_s": args.size * args.repeat / 1024 ** 2 / wall,
+        "writes_per_file": writes / args.repeat,
+        "progress_per_file": progress_calls / args.repeat
+    }
+
+
+def wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise Exception(f"等待端口{port}超时")
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    url = f"http://127.0.0.1:{args.port}/files/bench.bin?size={args.size}"
+    async with httpx.AsyncClient(timeout=300) as client:
+        # 预热连接和源站的数据块缓存
+        await client.get(url)
+        results = []
+        for variant in ("legacy", "adaptive"):
+            results.append(await measure(client, url, variant, args))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=parse_size, default=parse_size("128MiB"), help="每次下载的文件大小")
+    parser.add_argument("--repeat", type=int, default=3, help="每种实现下载的次数")
+    parser.add_argument("--hash", action="store_true", help="同时计算SHA-256（去重模式）")
+    parser.add_argument("--bandwidth", type=float, default=0, help="源站每个连接的带宽（MB/s），0表示不限速")
+    parser.add_argument("--dir", default=None, help="临时文件目录，默认使用系统临时目录")
+    parser.add_argument("--port", type=int, default=5075)
+    args = parser.parse_args()
+
+    with socket.socket() as sock:
+        if sock.connect_ex(("127.0.0.1", args.port)) == 0:
+            raise SystemExit(f"端口已被占用: {args.port}")
+    origin = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.origin_server", "--port", str(args.port), "--bandwidth", str(args.bandwidth)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_port(args.port)
+        results = asyncio.run(run(args))
+    finally:
+        origin.terminate()
+        origin.wait()
+
+    print(f"文件大小 {format_size(args.size)} x {args.repeat}，SHA-256: {'是' if args.hash else '否'}")
+    print(f"{'实现':<10}{'CPU秒/GB':>12}{'MB/s':>10}{'写入次数':>12}{'进度回调':>12}")
+    for r in results:
+        print(f"{r['variant']:<10}{r['cpu_s_per_gb']:>12.3f}{r['mb_per_s']:>10.0f}"
+              f"{r['writes_per_file']:>12.0f}{r['progress_per_file']:>12.0f}")
+    legacy, adaptive = results
+    print(f"CPU/GB变化: {(adaptive['cpu_s_per_gb'] / legacy['cpu_s_per_gb'] - 1) * 100:+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
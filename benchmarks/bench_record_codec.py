@@ -0,0 +1,88 @@
+"""
+青流记录编解码微基准：对比逐字段扫描FIELD_ID_MAP的旧实现与预编译的record_codec
+
+运行方式（在项目根目录）:
+    python -m benchmarks.bench_record_codec
+"""
+import timeit
+
+from app.utils.config import FIELD_ID_MAP
+from app.utils.record_codec import encode_answers, decode_answers
+
+
+def make_record(extra_fields: int = 12) -> dict:
+    """构造接近真实的青流记录：8个Token字段，外加若干未映射的系统字段"""
+    values = {
+        "id": "0b6e4f0e-5c1d-4f7e-9a53-1f0f6c1d2e3a",
+        "active": "true",
+        "username": "testuser",
+        "email": "test@example.com",
+        "token": "Q4g7EFT8SNFCtSAu6F6-t8F8UNvZ2QmVkWl5qhM82OE",
+        "created_at": "2024-01-01 10:00:00",
+        "expires_at": "2024-12-31 10:00:00",
+        "is_permanent": "false"
+    }
+    answers = [
+        {"queId": int(FIELD_ID_MAP[name]), "queTitle": name, "values": [{"value": value}]}
+        for name, value in values.items()
+    ]
+    answers += [
+        {"queId": 900000000 + i, "queTitle": f"系统字段{i}", "values": [{"value": str(i)}]}
+        for i in range(extra_fields)
+    ]
+    return {"applyId": 123456, "answers": answers}
+
+
+def legacy_decode(answers: list) -> dict:
+    token_data = {}
+    for answer in answers:
+        que_id = str(answer.get("queId"))
+        field_name = None
+        for key, value in FIELD_ID_MAP.items():
+            if value == que_id:
+                field_name = key
+                break
+        if field_name and answer.get("values") and len(answer.get("values")) > 0:
+            token_data[field_name] = answer.get("values")[0].get("value")
+    return token_data
+
+
+def legacy_encode(fields: dict) -> list:
+    answers = []
+    for name, value in fields.items():
+        answers.append({
+            "queId": int(FIELD_ID_MAP[name]),
+            "queTitle": name,
+            "values": [{"value": value}]
+        })
+    return answers
+
+
+def bench(label: str, func, number: int) -> float:
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    per_call = seconds / number * 1e6
+    print(f"{label:<28}{per_call:>10.2f} µs/次")
+    return per_call
+
+
+def main() -> None:
+    record = make_record()
+    answers = record["answers"]
+    fields = legacy_decode(answers)
+    assert decode_answers(answers) == fields
+    assert encode_answers(fields) == legacy_encode(fields)
+
+    number = 20000
+    print(f"解码：{len(answers)}个answers，其中{len(fields)}个Token字段")
+    old = bench("旧实现 (扫描FIELD_ID_MAP)", lambda: legacy_decode(answers), number)
+    new = bench("record_codec.decode_answers", lambda: decode_answers(answers), number)
+    print(f"{'加速比':<28}{old / new:>10.2f}x\n")
+
+    print(f"编码：{len(fields)}个字段")
+    old = bench("旧实现 (逐字段int转换)", lambda: legacy_encode(fields), number)
+    new = bench("record_codec.encode_answers", lambda: encode_answers(fields), number)
+    print(f"{'加速比':<28}{old / new:>10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
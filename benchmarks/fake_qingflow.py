@@ -0,0 +1,88 @@
+"""
+轻流API的本地模拟服务，供性能测试使用
+
+实现TokenService用到的接口（记录保存在内存中）：
+    POST /app/{app_id}/apply            创建记录
+    POST /app/{app_id}/apply/filter     按字段搜索或分页查询
+    POST /{app_id}/apply/{apply_id}     更新记录（续期）
+
+运行方式:
+    python -m benchmarks.fake_qingflow --port 5071 --latency 30
+"""
+import argparse
+import asyncio
+import itertools
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+app = FastAPI(title="fake-qingflow")
+
+# 每个请求的模拟网络延迟（秒）
+app.state.latency = 0.0
+
+_records: Dict[int, List[Dict[str, Any]]] = {}
+_apply_ids = itertools.count(1)
+
+
+def _value_of(answers: List[Dict[str, Any]], que_id: int) -> Any:
+    for answer in answers:
+        if int(answer.get("queId")) == que_id and answer.get("values"):
+            return answer["values"][0].get("value")
+    return None
+
+
+async def _delay() -> None:
+    if app.state.latency > 0:
+        await asyncio.sleep(app.state.latency)
+
+
+@app.post("/app/{app_id}/apply")
+async def create_record(app_id: str, request: Request):
+    await _delay()
+    payload = await request.json()
+    apply_id = next(_apply_ids)
+    _records[apply_id] = payload.get("answers", [])
+    return {"errCode": 0, "result": {"applyId": apply_id}}
+
+
+@app.post("/app/{app_id}/apply/filter")
+async def filter_records(app_id: str, request: Request):
+    await _delay()
+    payload = await request.json()
+    items = [{"applyId": apply_id, "answers": answers} for apply_id, answers in _records.items()]
+
+    for query in payload.get("queries", []):
+        que_id = int(query["queId"])
+        items = [item for item in items if _value_of(item["answers"], que_id) == query.get("searchKey")]
+
+    page_size = int(payload.get("pageSize", 10))
+    page_num = int(payload.get("pageNum", 1))
+    page = items[(page_num - 1) * page_size:page_num * page_size]
+    return {"errCode": 0, "result": {"result": page, "resultAmount": len(items)}}
+
+
+@app.post("/{app_id}/apply/{apply_id}")
+async def update_record(app_id: str, apply_id: int, request: Request):
+    await _delay()
+    payload = await request.json()
+    answers = _records.setdefault(apply_id, [])
+    updated = {int(answer["queId"]) for answer in payload.get("answers", [])}
+    answers[:] = [answer for answer in answers if int(answer["queId"]) not in updated] + payload.get("answers", [])
+    return {"errCode": 0, "result": {"applyId": apply_id}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5071)
+    parser.add_argument("--latency", type=float, default=0, help="每个请求的模拟延迟（毫秒）")
+    args = parser.parse_args()
+
+    app.state.latency = args.latency / 1000
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+可限速的本地源站，供性能测试使用
+
+GET/HEAD /files/{name}?size=字节数 返回指定大小的确定性内容，
+支持单个Range请求、ETag/Last-Modified和If-None-Match，
+每个连接按--bandwidth限速，响应头发送前等待--latency毫秒
+
+运行方式:
+    python -m benchmarks.origin_server --port 5072 --bandwidth 50 --latency 20
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import re
+from email.utils import formatdate
+from typing import AsyncIterator, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="bench-origin")
+
+app.state.bandwidth = 0.0  # 每个连接的带宽（字节/秒），0表示不限速
+app.state.latency = 0.0  # 响应头发送前的延迟（秒）
+
+_BLOCK_SIZE = 1024 * 1024
+_CHUNK_SIZE = 64 * 1024
+_LAST_MODIFIED = formatdate(0, usegmt=True)
+
+
+def _block_for(name: str) -> bytes:
+    """按文件名生成1MiB的伪随机内容，文件内容为该块的重复"""
+    return random.Random(hashlib.sha256(name.encode()).digest()).randbytes(_BLOCK_SIZE)
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header or "")
+    if not match or size == 0:
+        return None
+    start, end = match.groups()
+    if start:
+        return int(start), min(int(end) if end else size - 1, size - 1)
+    return max(size - int(end), 0), size - 1
+
+
+async def _body(name: str, start: int, end: int) -> AsyncIterator[bytes]:
+    block = _block_for(name)
+    offset = start
+    while offset <= end:
+        length = min(_CHUNK_SIZE, end + 1 - offset)
+        position = offset % _BLOCK_SIZE
+        chunk = (block[position:] + block)[:length] if position + length > _BLOCK_SIZE else block[position:position + length]
+        yield chunk
+        offset += length
+        if app.state.bandwidth > 0:
+            await asyncio.sleep(length / app.state.bandwidth)
+
+
+@app.api_route("/files/{name}", methods=["GET", "HEAD"])
+async def serve_file(name: str, size: int, request: Request):
+    if app.state.latency > 0:
+        await asyncio.sleep(app.state.latency)
+
+    etag = f'"{name}-{size}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": _LAST_MODIFIED,
+        "Accept-Ranges": "bytes",
+        "Content-Type": "application/octet-stream"
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = _parse_range(request.headers.get("range"), size)
+    if byte_range is not None and request.headers.get("if-range") not in (None, etag):
+        byte_range = None
+
+    start, end = byte_range if byte_range is not None else (0, size - 1)
+    headers["Content-Length"] = str(end + 1 - start)
+    status_code = 200
+    if byte_range is not None:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        status_code = 206
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers)
+    return StreamingResponse(_body(name, start, end), status_code=status_code, headers=headers)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5072)
+    parser.add_argument("--bandwidth", type=float, default=0, help="每个连接的带宽（MB/s），0表示不限速")
+    parser.add_argument("--latency", type=float, default=0, help="响应头发送前的延迟（毫秒）")
+    args = parser.parse_args()
+
+    app.state.bandwidth = args.bandwidth * 1024 * 1024
+    app.state.latency = args.latency / 1000
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
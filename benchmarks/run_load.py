@@ -0,0 +1,328 @@
+"""
+端到端负载测试：在本地启动模拟轻流、S3（moto）、可限速源站和被测服务，
+按指定并发数和文件大小分布压测 /R2api/register、/R2api/upload、/R2api/upload-direct，
+输出吞吐量、p50/p99延迟、峰值RSS和事件循环延迟
+
+依赖见 benchmarks/requirements.txt，运行方式（在项目根目录）:
+    python -m benchmarks.run_load
+    python -m benchmarks.run_load --scenarios upload --concurrency 1,8,32 \\
+        --sizes 64KiB:0.7,4MiB:0.25,64MiB:0.05 --requests 200 --bandwidth 20 --latency 20
+    python -m benchmarks.run_load --s3-endpoint http://127.0.0.1:9000 \\
+        --access-key minioadmin --secret-key minioadmin   # 使用已运行的MinIO
+    python -m benchmarks.run_load --storage memory        # 不经过S3，只测量传输流水线本身
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import boto3
+import httpx
+
+_UNITS = {"": 1, "B": 1, "KIB": 1024, "MIB": 1024 ** 2, "GIB": 1024 ** 3, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3}
+
+
+def parse_size(text: str) -> int:
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([A-Za-z]*)\s*", text)
+    if not match or match.group(2).upper() not in _UNITS:
+        raise argparse.ArgumentTypeError(f"无法解析的大小: {text}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+def parse_size_mix(text: str) -> List[Tuple[int, float]]:
+    """解析"64KiB:0.7,4MiB:0.3"形式的文件大小分布，权重省略时为1"""
+    mix = []
+    for item in text.split(","):
+        size, _, weight = item.partition(":")
+        mix.append((parse_size(size), float(weight or 1)))
+    return mix
+
+
+def format_size(size: int) -> str:
+    for unit in ("GiB", "MiB", "KiB"):
+        scale = _UNITS[unit.upper()]
+        if size >= scale and size % scale == 0:
+            return f"{size // scale}{unit}"
+    return f"{size}B"
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)]
+
+
+class Stack:
+    """按顺序启动依赖服务和被测服务的子进程，退出时全部终止"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.processes: List[subprocess.Popen] = []
+        self.qingflow_url = f"http://127.0.0.1:{args.qingflow_port}"
+        self.origin_url = f"http://127.0.0.1:{args.origin_port}"
+        self.s3_endpoint = args.s3_endpoint or f"http://127.0.0.1:{args.s3_port}"
+        # 使用local/memory存储后端或外部S3时不启动moto
+        self.use_moto = args.storage == "s3" and not args.s3_endpoint
+        self.app_url = f"http://127.0.0.1:{args.app_port}"
+
+    def _spawn(self, module: str, *argv: str, env: Optional[Dict[str, str]] = None) -> None:
+        stdout = None if self.args.verbose else subprocess.DEVNULL
+        process = subprocess.Popen(
+            [sys.executable, "-m", module, *argv],
+            env=dict(os.environ, **(env or {})),
+            stdout=stdout,
+            stderr=stdout
+        )
+        self.processes.append(process)
+
+    @staticmethod
+    def _port_open(port: int) -> bool:
+        with socket.socket() as sock:
+            return sock.connect_ex(("127.0.0.1", port)) == 0
+
+    def _wait_for_port(self, port: int, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._port_open(port):
+                return
+            time.sleep(0.1)
+        raise Exception(f"等待端口{port}超时")
+
+    def start(self) -> None:
+        args = self.args
+        ports = [args.qingflow_port, args.origin_port, args.app_port]
+        if self.use_moto:
+            ports.append(args.s3_port)
+        # 端口已被占用时测到的会是其他进程，直接报错
+        busy = [port for port in ports if self._port_open(port)]
+        if busy:
+            raise Exception(f"端口已被占用: {busy}")
+
+        self._spawn("benchmarks.fake_qingflow", "--port", str(args.qingflow_port),
+                    "--latency", str(args.qingflow_latency))
+        self._spawn("benchmarks.origin_server", "--port", str(args.origin_port),
+                    "--bandwidth", str(args.bandwidth), "--latency", str(args.latency))
+        if self.use_moto:
+            self._spawn("moto.server", "-p", str(args.s3_port))
+        self._spawn("benchmarks.app_runner", "--port", str(args.app_port), env={
+            "QINGFLOW_API_BASE_URL": self.qingflow_url,
+            "STORAGE_BACKEND": args.storage,
+            "STORAGE_LOCAL_ROOT": args.storage_root,
+            "LOG_LEVEL": "WARNING"
+        })
+
+        for port in ports:
+            self._wait_for_port(port)
+
+        if args.storage != "s3":
+            return
+        s3 = boto3.client(
+            "s3",
+            endpoint_url=self.s3_endpoint,
+            aws_access_key_id=args.access_key,
+            aws_secret_access_key=args.secret_key,
+            region_name="us-east-1"
+        )
+        try:
+            s3.create_bucket(Bucket=args.bucket)
+        except s3.exceptions.BucketAlreadyOwnedByYou:
+            pass
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class LoadRunner:
+    def __init__(self, args: argparse.Namespace, stack: Stack, client: httpx.AsyncClient):
+        self.args = args
+        self.stack = stack
+        self.client = client
+        self.random = random.Random(args.seed)
+        self.token: Optional[str] = None
+        self._payloads: Dict[int, bytes] = {}
+        self._counter = 0
+
+    def _next_id(self) -> int:
+        self._counter += 1
+        return self._counter
+
+    def _pick_size(self) -> int:
+        sizes, weights = zip(*self.args.sizes)
+        return self.random.choices(sizes, weights)[0]
+
+    def _payload(self, size: int) -> bytes:
+        if size not in self._payloads:
+            self._payloads[size] = random.Random(size).randbytes(size)
+        return self._payloads[size]
+
+    @property
+    def _auth(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def register(self) -> int:
+        n = self._next_id()
+        response = await self.client.post(f"{self.stack.app_url}/R2api/register", json={
+            "username": f"bench{n}",
+            "email": f"bench{n}@example.com",
+            "expires_in_days": 30
+        })
+        response.raise_for_status()
+        if self.token is None:
+            self.token = response.json()["token"]
+        return 0
+
+    async def upload(self) -> int:
+        n, size = self._next_id(), self._pick_size()
+        response = await self.client.post(f"{self.stack.app_url}/R2api/upload", headers=self._auth, json={
+            "fileUrl": f"{self.stack.origin_url}/files/f{n}?size={size}",
+            "bucketName": self.args.bucket,
+            "objectKey": f"bench/upload/{n}-{format_size(size)}",
+            "endpoint": self.stack.s3_endpoint,
+            "accessKeyId": self.args.access_key,
+            "secretAccessKey": self.args.secret_key,
+            "sourceCache": False
+        })
+        response.raise_for_status()
+        return size
+
+    async def upload_direct(self) -> int:
+        n, size = self._next_id(), self._pick_size()
+        response = await self.client.post(
+            f"{self.stack.app_url}/R2api/upload-direct",
+            headers=self._auth,
+            data={
+                "bucket_name": self.args.bucket,
+                "object_key": f"bench/upload-direct/{n}-{format_size(size)}",
+                "endpoint": self.stack.s3_endpoint,
+                "access_key_id": self.args.access_key,
+                "secret_access_key": self.args.secret_key
+            },
+            files={"file": (f"f{n}.bin", self._payload(size), "application/octet-stream")}
+        )
+        response.raise_for_status()
+        return size
+
+    async def run(self, scenario: str, concurrency: int) -> Dict[str, Any]:
+        operation = getattr(self, scenario.replace("-", "_"))
+        await self.client.post(f"{self.stack.app_url}/__bench__/reset")
+
+        latencies: List[float] = []
+        errors: List[str] = []
+        total_bytes = 0
+        remaining = self.args.requests
+
+        async def worker():
+            nonlocal remaining, total_bytes
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    total_bytes += await operation()
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    errors.append(str(e))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        stats = (await self.client.get(f"{self.stack.app_url}/__bench__/stats")).json()
+        if errors and self.args.verbose:
+            print(f"  {scenario} c={concurrency} 首个错误: {errors[0]}", file=sys.stderr)
+        return {
+            "scenario": scenario,
+            "concurrency": concurrency,
+            "requests": len(latencies) + len(errors),
+            "errors": len(errors),
+            "rps": round(len(latencies) / elapsed, 2),
+            "mb_per_s": round(total_bytes / elapsed / 1024 / 1024, 2),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+            "peak_rss_mb": stats["peak_rss_mb"],
+            "loop_lag_p99_ms": stats["loop_lag_p99_ms"],
+            "loop_lag_max_ms": stats["loop_lag_max_ms"]
+        }
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    columns = [
+        ("scenario", "场景"), ("concurrency", "并发"), ("requests", "请求数"), ("errors", "错误"),
+        ("rps", "req/s"), ("mb_per_s", "MB/s"), ("p50_ms", "p50(ms)"), ("p99_ms", "p99(ms)"),
+        ("peak_rss_mb", "峰值RSS(MB)"), ("loop_lag_p99_ms", "循环延迟p99(ms)"), ("loop_lag_max_ms", "循环延迟max(ms)")
+    ]
+    rows = [[title for _, title in columns]] + [[str(result[key]) for key, _ in columns] for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    stack = Stack(args)
+    try:
+        stack.start()
+        async with httpx.AsyncClient(timeout=args.timeout, limits=httpx.Limits(max_connections=None)) as client:
+            runner = LoadRunner(args, stack, client)
+            # 上传场景需要先注册一个Token
+            await runner.register()
+            results = []
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    results.append(await runner.run(scenario, concurrency))
+            return results
+    finally:
+        stack.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=["register", "upload", "upload-direct"],
+                        help="逗号分隔：register、upload、upload-direct")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 8, 32],
+                        help="逗号分隔的并发数，每个场景依次运行")
+    parser.add_argument("--sizes", type=parse_size_mix, default=parse_size_mix("64KiB:0.7,4MiB:0.25,64MiB:0.05"),
+                        help="文件大小分布，如64KiB:0.7,4MiB:0.25,64MiB:0.05")
+    parser.add_argument("--requests", type=int, default=100, help="每个场景、每个并发数的请求数")
+    parser.add_argument("--bandwidth", type=float, default=0, help="源站每个连接的带宽（MB/s），0表示不限速")
+    parser.add_argument("--latency", type=float, default=0, help="源站响应延迟（毫秒）")
+    parser.add_argument("--qingflow-latency", type=float, default=30, help="模拟轻流API的响应延迟（毫秒）")
+    parser.add_argument("--storage", choices=["s3", "local", "memory"], default="s3",
+                        help="被测服务的存储后端，local/memory不经过S3，用于单独测量传输流水线")
+    parser.add_argument("--storage-root", default="/tmp/r2-uploader-bench", help="local存储后端的根目录")
+    parser.add_argument("--s3-endpoint", help="使用已运行的S3兼容服务（如MinIO），不指定时启动moto")
+    parser.add_argument("--access-key", default="bench")
+    parser.add_argument("--secret-key", default="bench-secret")
+    parser.add_argument("--bucket", default="bench")
+    parser.add_argument("--qingflow-port", type=int, default=5071)
+    parser.add_argument("--origin-port", type=int, default=5072)
+    parser.add_argument("--app-port", type=int, default=5073)
+    parser.add_argument("--s3-port", type=int, default=5074)
+    parser.add_argument("--timeout", type=float, default=300, help="单个请求的超时时间（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="文件大小抽样的随机种子，保证多次运行可比")
+    parser.add_argument("--json", dest="json_path", help="同时将结果写入该JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示子进程输出和错误详情")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "json_path"}, "results": results},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
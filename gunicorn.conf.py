@@ -0,0 +1,34 @@
+import os
+import shutil
+
+from cryptography.fernet import Fernet
+
+# 各worker共用同一个任务参数加密密钥，worker回收时交还的任务才能由其他worker解密执行
+os.environ.setdefault("JOB_SPEC_KEY", Fernet.generate_key().decode())
+
+
+def on_starting(server):
+    """
+    启动时清空Prometheus多进程指标目录，避免上次运行留下的数据
+    多worker时拒绝使用内存任务存储：任务只能在提交它的worker中查询，其余worker返回404
+    JOB_SHUTDOWN_GRACE不小于graceful_timeout时告警：worker可能在交还任务前被强制结束
+    """
+    from app.utils.config import JOB_STORE, JOB_SHUTDOWN_GRACE
+    if server.cfg.workers > 1 and JOB_STORE == "memory":
+        raise RuntimeError("JOB_STORE=memory只能用于单worker，多worker部署请使用JOB_STORE=sqlite")
+    if JOB_SHUTDOWN_GRACE >= server.cfg.graceful_timeout:
+        server.log.warning(
+            f"JOB_SHUTDOWN_GRACE({JOB_SHUTDOWN_GRACE}s)不小于--graceful-timeout({server.cfg.graceful_timeout}s)，"
+            "关闭时进行中的任务可能来不及交还"
+        )
+
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """worker退出（包括--max-requests回收）时清理该进程的进行中指标"""
+    from app.utils.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
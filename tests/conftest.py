@@ -0,0 +1,38 @@
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import file_service as file_service_module  # noqa: E402
+
+
+class FakeOrigin:
+    """内存中的源站：files为{路径: 内容}，支持ETag条件请求，记录收到的请求"""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        # 为False时模拟不支持条件请求的源站（忽略If-None-Match，总是返回200）
+        self.conditional = True
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        body = self.files.get(request.url.path)
+        if body is None:
+            return httpx.Response(404)
+        etag = f'"{len(body)}-{hash(body) & 0xffffffff:x}"'
+        if self.conditional and request.headers.get("if-none-match") == etag:
+            return httpx.Response(304, headers={"etag": etag})
+        return httpx.Response(200, content=body, headers={"etag": etag, "content-type": "application/octet-stream"})
+
+
+@pytest.fixture
+def origin(monkeypatch):
+    """把FileService使用的下载客户端替换为FakeOrigin"""
+    fake = FakeOrigin()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake.handler))
+    monkeypatch.setattr(file_service_module, "get_download_client", lambda: client)
+    return fake
@@ -0,0 +1,231 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.utils.admission import AdmissionController, AdmissionMiddleware, AdmissionRejected, token_key
+
+
+def test_global_and_token_limits():
+    async def run():
+        controller = AdmissionController(max_transfers=2, max_bytes=100, token_max_transfers=1,
+                                         token_max_bytes=0, queue_timeout=0)
+        first = await controller.acquire("a", 10)
+        # 同一Token超过每Token传输数
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("a", 10)
+        second = await controller.acquire("b", 10)
+        # 全局传输数已满
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await controller.acquire("c", 10)
+        assert excinfo.value.retry_after == controller.retry_after
+        first.release()
+        second.release()
+        # 重复release不会重复归还
+        second.release()
+        assert controller.stats()["transfers"] == 0
+        assert controller.stats()["bytes"] == 0
+        assert controller.stats()["rejected"] == 2
+
+    asyncio.run(run())
+
+
+def test_shrink_frees_bytes_for_waiters():
+    async def run():
+        controller = AdmissionController(max_transfers=0, max_bytes=100, token_max_transfers=0,
+                                         token_max_bytes=0, queue_timeout=5)
+        big = await controller.acquire("a", 1000)
+        # 超过上限的预留按上限计
+        assert big.nbytes == 100
+        waiter = asyncio.create_task(controller.acquire("b", 60))
+        await asyncio.sleep(0)
+        assert controller.stats()["waiting"] == 1
+        big.shrink(40)
+        reservation = await asyncio.wait_for(waiter, 1)
+        assert controller.stats()["bytes"] == 100
+        # 缩小只能变小
+        reservation.shrink(80)
+        assert reservation.nbytes == 60
+        big.release()
+        reservation.release()
+        assert controller.stats()["bytes"] == 0
+
+    asyncio.run(run())
+
+
+def test_queue_timeout_rejects():
+    async def run():
+        controller = AdmissionController(max_transfers=1, max_bytes=0, token_max_transfers=0,
+                                         token_max_bytes=0, queue_timeout=0.05)
+        held = await controller.acquire("a", 0)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("b", 0)
+        held.release()
+        assert controller.stats()["waiting"] == 0
+
+    asyncio.run(run())
+
+
+class _Recorder:
+    """记录到达下游应用的请求"""
+
+    def __init__(self, controller: AdmissionController):
+        self.controller = controller
+        self.seen = []
+
+    async def __call__(self, scope, receive, send):
+        self.seen.append(self.controller.stats()["transfers"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _client(middleware: AdmissionMiddleware) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://test")
+
+
+def test_middleware_rejects_invalid_token_without_reserving():
+    async def authenticate(token):
+        return {"id": "1", "token": token} if token == "good" else None
+
+    async def run():
+        controller = AdmissionController(max_transfers=1, max_bytes=0, token_max_transfers=0,
+                                         token_max_bytes=0, queue_timeout=0)
+        downstream = _Recorder(controller)
+        middleware = AdmissionMiddleware(downstream, ["/upload"], controller, authenticate)
+        async with _client(middleware) as client:
+            for headers in ({}, {"Authorization": "Bearer bad"}, {"Authorization": "Basic good"}):
+                response = await client.post("/upload", content=b"x" * 10, headers=headers)
+                assert response.status_code == 401
+                assert response.headers["www-authenticate"] == "Bearer"
+            assert downstream.seen == []
+            assert controller.stats()["admitted"] == 0
+
+            response = await client.post("/upload", content=b"x" * 10, headers={"Authorization": "Bearer good"})
+            assert response.status_code == 200
+            # 请求期间占用一个名额，结束后归还
+            assert downstream.seen == [1]
+            assert controller.stats()["transfers"] == 0
+
+            # 其他路径不经过认证和准入
+            response = await client.post("/other", content=b"x")
+            assert response.status_code == 200
+
+    asyncio.run(run())
+
+
+def test_middleware_charges_per_token():
+    async def authenticate(token):
+        return {"id": token, "token": token}
+
+    async def run():
+        controller = AdmissionController(max_transfers=0, max_bytes=0, token_max_transfers=1,
+                                         token_max_bytes=0, queue_timeout=0)
+        # 模拟"a"已有一个进行中的传输
+        held = await controller.acquire(token_key("a"), 0)
+        middleware = AdmissionMiddleware(_Recorder(controller), ["/upload"], controller, authenticate)
+        async with _client(middleware) as client:
+            response = await client.post("/upload", content=b"x", headers={"Authorization": "Bearer a"})
+            assert response.status_code == 429
+            assert response.headers["retry-after"] == str(controller.retry_after)
+            response = await client.post("/upload", content=b"x", headers={"Authorization": "Bearer b"})
+            assert response.status_code == 200
+        held.release()
+
+    asyncio.run(run())
+
+
+class _BodyReader:
+    """读取完整请求体后返回200，记录读到的字节数"""
+
+    def __init__(self):
+        self.received = None
+
+    async def __call__(self, scope, receive, send):
+        received = 0
+        while True:
+            message = await receive()
+            received += len(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        self.received = received
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def _chunks(count: int, size: int):
+    for _ in range(count):
+        yield b"x" * size
+
+
+def test_middleware_rejects_oversized_body():
+    calls = []
+
+    async def authenticate(token):
+        calls.append(token)
+        return {"id": "1", "token": token}
+
+    async def run():
+        controller = AdmissionController(queue_timeout=0)
+        downstream = _BodyReader()
+        middleware = AdmissionMiddleware(downstream, ["/upload"], controller, authenticate, max_body_size=100)
+        headers = {"Authorization": "Bearer good"}
+        async with _client(middleware) as client:
+            # Content-Length超限：不认证、不占用名额、不读取请求体
+            response = await client.post("/upload", content=b"x" * 101, headers=headers)
+            assert response.status_code == 413
+            assert calls == [] and downstream.received is None
+
+            # 分块传输：读到的字节数超限时中止
+            response = await client.post("/upload", content=_chunks(10, 30), headers=headers)
+            assert response.status_code == 413
+            assert downstream.received is None
+            assert controller.stats()["transfers"] == 0
+
+            response = await client.post("/upload", content=_chunks(3, 30), headers=headers)
+            assert response.status_code == 200
+            assert downstream.received == 90
+
+    asyncio.run(run())
+
+
+def test_direct_upload_aborts_chunked_body_before_route(monkeypatch):
+    from app.main import app
+    from app.utils import file_service as file_service_module
+    from app.utils.auth import get_current_token
+    from app.utils.token_cache import token_cache
+
+    token = "direct-upload-limit-token"
+    token_cache.set(token, True, {"id": "t1", "token": token, "is_permanent": "true"})
+    app.dependency_overrides[get_current_token] = lambda: {"id": "t1", "token": token}
+    uploads = []
+
+    async def upload_file_directly(self, *args, **kwargs):
+        uploads.append(kwargs)
+        return {}
+
+    monkeypatch.setattr(file_service_module.FileService, "upload_file_directly", upload_file_directly)
+
+    async def body():
+        yield (
+            b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.bin\"\r\n"
+            b"Content-Type: application/octet-stream\r\n\r\n"
+        )
+        for _ in range(64):
+            yield b"x" * 1024
+
+    async def run():
+        middleware = AdmissionMiddleware(app, ["/R2api/upload-direct"], AdmissionController(), max_body_size=16 * 1024)
+        async with _client(middleware) as client:
+            response = await client.post(
+                "/R2api/upload-direct",
+                content=body(),
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "multipart/form-data; boundary=b"}
+            )
+        assert response.status_code == 413
+        assert uploads == []
+
+    try:
+        asyncio.run(run())
+    finally:
+        app.dependency_overrides.clear()
+        token_cache.invalidate(token)
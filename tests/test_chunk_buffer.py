@@ -0,0 +1,51 @@
+import asyncio
+
+from app.utils.chunk_buffer import ChunkBuffer, ChunkSizer
+
+_KB = 1024
+
+
+def test_sizer_stays_within_bounds():
+    sizer = ChunkSizer(min_size=64 * _KB, max_size=1024 * _KB, interval=0.05, adaptive=True)
+    assert sizer.size == 64 * _KB
+    # 极快：不超过上限
+    sizer.observe(1024 * 1024 * _KB, 0.001)
+    assert sizer.size == 1024 * _KB
+    sizer.observe(1, 0)
+    assert sizer.size == 1024 * _KB
+    # 极慢：不低于下限
+    sizer.observe(1, 10)
+    assert sizer.size == 64 * _KB
+    # 中间值取不小于目标的2的幂：10MB/s * 0.05s = 500KB -> 512KB
+    sizer.observe(10 * 1000 * _KB, 1)
+    assert sizer.size == 512 * _KB
+
+
+def test_sizer_fixed_when_not_adaptive():
+    sizer = ChunkSizer(min_size=64 * _KB, max_size=1024 * _KB, adaptive=False)
+    sizer.observe(1024 * 1024 * _KB, 0.001)
+    assert sizer.size == 64 * _KB
+
+
+def test_sizer_normalizes_bounds():
+    sizer = ChunkSizer(min_size=0, max_size=-1, adaptive=True)
+    assert sizer.min_size == 1
+    assert sizer.max_size == 1
+
+
+def test_buffer_batches_and_preserves_data():
+    batches = []
+
+    async def flush(view):
+        batches.append(bytes(view))
+
+    async def run():
+        buffer = ChunkBuffer(flush, ChunkSizer(min_size=4, max_size=4, adaptive=False))
+        for piece in (b"ab", b"cdefghij", b"k", b"lmnop"):
+            await buffer.write(piece)
+        await buffer.flush()
+
+    asyncio.run(run())
+    assert b"".join(batches) == b"abcdefghijklmnop"
+    assert all(len(batch) >= 4 for batch in batches[:-1])
+    assert len(batches) < 16
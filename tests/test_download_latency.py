@@ -0,0 +1,173 @@
+import asyncio
+import tempfile
+import time
+
+import httpx
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from app.main import app
+from app.utils import file_service as file_service_module
+from app.utils.executor import BoundedExecutor
+from app.utils.file_service import FileService
+from app.utils.storage import MemoryBackend
+from app.utils.transfer_settings import TransferSettings, MIN_PART_SIZE
+
+_CHUNK = 1024 * 1024
+_CHUNKS = 4
+# 模拟慢速磁盘/哈希：每批写出耗时
+_SLOW_BATCH = 0.25
+
+
+class _SlowBody(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        for _ in range(_CHUNKS):
+            yield b"x" * _CHUNK
+
+
+class _SlowHasher:
+    def __init__(self):
+        self.updates = 0
+
+    def update(self, data) -> None:
+        time.sleep(_SLOW_BATCH)
+        self.updates += 1
+
+
+def test_small_requests_stay_fast_during_large_download(monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, stream=_SlowBody(), headers={"content-length": str(_CHUNK * _CHUNKS)})
+
+    download_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(file_service_module, "get_download_client", lambda: download_client)
+
+    async def run():
+        hasher = _SlowHasher()
+        download = asyncio.create_task(FileService().download_file("http://origin/big.bin", ranged=False, hasher=hasher))
+        latencies = []
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            while not download.done():
+                start = time.perf_counter()
+                response = await client.get("/health")
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+                await asyncio.sleep(0.01)
+        temp_file, _, size = await download
+        FileService._remove_temp_file_sync(temp_file)
+
+        assert size == _CHUNK * _CHUNKS
+        assert hasher.updates == _CHUNKS
+        # 写文件和哈希在线程池中执行，下载期间小请求不会被整批写出阻塞
+        assert len(latencies) > _CHUNKS
+        assert max(latencies) < _SLOW_BATCH / 2
+
+    asyncio.run(run())
+
+
+# 模拟慢速R2：每次上传整个文件或分片时阻塞所在线程
+_SLOW_UPLOAD = 0.5
+
+_TARGET = {
+    "bucket_name": "bkt",
+    "endpoint": "http://r2",
+    "access_key_id": "ak",
+    "secret_access_key": "sk",
+    "custom_domain": None
+}
+
+
+class _BlockingBackend(MemoryBackend):
+    def __init__(self):
+        super().__init__()
+        self.blocked = 0
+
+    def upload_file(self, *args, **kwargs):
+        self.blocked += 1
+        time.sleep(_SLOW_UPLOAD)
+        return super().upload_file(*args, **kwargs)
+
+    def upload_part(self, *args, **kwargs):
+        self.blocked += 1
+        time.sleep(_SLOW_UPLOAD)
+        return super().upload_part(*args, **kwargs)
+
+
+async def _poll_health(task: asyncio.Task) -> list:
+    """任务进行期间反复请求/health，返回每次的耗时"""
+    latencies = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        while not task.done():
+            start = time.perf_counter()
+            response = await client.get("/health")
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+            await asyncio.sleep(0.01)
+    return latencies
+
+
+def test_small_requests_stay_fast_during_url_upload(origin):
+    origin.files["/big.bin"] = b"x" * (2 * 1024 * 1024)
+    backend = _BlockingBackend()
+
+    async def run():
+        upload = asyncio.create_task(FileService(backend).upload_from_url(
+            file_url="http://origin/big.bin", object_key="big.bin", streaming=False,
+            use_source_cache=False, **_TARGET
+        ))
+        latencies = await _poll_health(upload)
+        result = await upload
+        assert result["size"] == 2 * 1024 * 1024
+        assert backend.blocked == 1
+        assert len(latencies) > 5
+        assert max(latencies) < _SLOW_UPLOAD / 5
+
+    asyncio.run(run())
+
+
+def test_small_requests_stay_fast_during_direct_multipart_upload():
+    backend = _BlockingBackend()
+    size = 2 * MIN_PART_SIZE + 10
+    spooled = tempfile.SpooledTemporaryFile()
+    spooled.write(b"x" * size)
+    spooled.seek(0)
+    upload_file = UploadFile(spooled, size=size, filename="big.bin",
+                             headers=Headers({"content-type": "application/octet-stream"}))
+    settings = TransferSettings(multipart_threshold=MIN_PART_SIZE, part_size=MIN_PART_SIZE)
+
+    async def run():
+        upload = asyncio.create_task(FileService(backend).upload_file_directly(
+            upload_file, object_key="big.bin", transfer_settings=settings, **_TARGET
+        ))
+        latencies = await _poll_health(upload)
+        result = await upload
+        assert result["size"] == size
+        assert backend.blocked == 3
+        assert len(latencies) > 5
+        assert max(latencies) < _SLOW_UPLOAD / 5
+
+    asyncio.run(run())
+
+
+def test_downloads_are_not_queued_behind_r2_uploads(origin, monkeypatch):
+    """R2上传线程全部被占用时，其他传输写临时文件不需要排队"""
+    origin.files["/a.bin"] = b"a" * 1024
+    origin.files["/b.bin"] = b"b" * 1024
+    monkeypatch.setattr(file_service_module, "upload_executor", BoundedExecutor(1, 1, "test-upload"))
+    backend = _BlockingBackend()
+
+    async def run():
+        upload = asyncio.create_task(FileService(backend).upload_from_url(
+            file_url="http://origin/a.bin", object_key="a.bin", streaming=False,
+            use_source_cache=False, **_TARGET
+        ))
+        while not backend.blocked:
+            await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        temp_file, _, size = await FileService(backend).download_file("http://origin/b.bin", ranged=False)
+        elapsed = time.perf_counter() - start
+        FileService._remove_temp_file_sync(temp_file)
+        await upload
+        assert size == 1024
+        assert elapsed < _SLOW_UPLOAD / 2
+
+    asyncio.run(run())
@@ -0,0 +1,137 @@
+import asyncio
+
+from app.utils import job_manager as job_manager_module
+from app.utils.job_manager import JobManager
+from app.utils.job_store import MemoryJobStore, SQLiteJobStore, JOB_FAILED, JOB_QUEUED, JOB_SUCCEEDED
+from app.utils.transfer_settings import TransferSettings
+
+
+class _FlakyStore(MemoryJobStore):
+    """第一次把任务标记为running时出错"""
+
+    def __init__(self, ttl: float = 3600):
+        super().__init__(ttl)
+        self.failed_once = False
+        self.purges = 0
+
+    async def claim(self, job_id, worker_pid):
+        if not self.failed_once:
+            self.failed_once = True
+            raise RuntimeError("存储不可用")
+        return await super().claim(job_id, worker_pid)
+
+    async def purge_expired(self):
+        self.purges += 1
+        await super().purge_expired()
+
+
+async def _wait_for(predicate, timeout: float = 2) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_worker_survives_errors_and_purges_periodically(monkeypatch):
+    store = _FlakyStore()
+    monkeypatch.setattr(job_manager_module, "create_job_store", lambda: store)
+    monkeypatch.setattr(job_manager_module, "JOB_PURGE_INTERVAL", 0.05)
+
+    async def upload_from_url(self, progress=None, **params):
+        return {"size": 1, "url": params["file_url"]}
+
+    monkeypatch.setattr(job_manager_module.FileService, "upload_from_url", upload_from_url)
+
+    async def run():
+        manager = JobManager(workers=1, max_queue_depth=10)
+        await manager.start()
+        try:
+            first = await manager.submit("owner", {"file_url": "http://origin/1"})
+            second = await manager.submit("owner", {"file_url": "http://origin/2"})
+            await _wait_for(lambda: store._jobs[second["id"]]["status"] == JOB_SUCCEEDED)
+            assert store._jobs[first["id"]]["status"] == JOB_FAILED
+            assert "存储不可用" in store._jobs[first["id"]]["error"]
+            # 启动时清理一次，之后定期清理
+            await _wait_for(lambda: store.purges >= 3)
+        finally:
+            await manager.stop()
+
+    asyncio.run(run())
+
+
+def test_unfinished_jobs_are_handed_over_on_stop(monkeypatch, tmp_path):
+    """worker关闭时进行中和排队中的任务交还，由另一个worker从头执行"""
+    path = str(tmp_path / "jobs.db")
+    monkeypatch.setattr(job_manager_module, "create_job_store", lambda: SQLiteJobStore(path))
+    monkeypatch.setattr(job_manager_module, "JOB_SHUTDOWN_GRACE", 0.1)
+    monkeypatch.setattr(job_manager_module, "JOB_ADOPT_INTERVAL", 0.05)
+    started = []
+    release = asyncio.Event()
+
+    async def upload_from_url(self, progress=None, **params):
+        started.append(params)
+        await release.wait()
+        return {"size": 1, "url": params["file_url"]}
+
+    monkeypatch.setattr(job_manager_module.FileService, "upload_from_url", upload_from_url)
+
+    async def run():
+        params = {"file_url": "http://origin/1", "secret_access_key": "r2-secret",
+                  "transfer_settings": TransferSettings(part_size=8 * 1024 * 1024)}
+        old = JobManager(workers=1, max_queue_depth=10)
+        await old.start()
+        running = await old.submit("owner", params, webhook_url=None, admission_key="k")
+        queued = await old.submit("owner", dict(params, file_url="http://origin/2"))
+        await _wait_for(lambda: len(started) == 1)
+        await old.stop()
+        # 关闭中的worker不再接收任务
+        try:
+            await old.submit("owner", params)
+            assert False, "关闭后仍接收任务"
+        except job_manager_module.JobQueueFull:
+            pass
+
+        store = SQLiteJobStore(path)
+        for job_id, attempts in ((running["id"], 1), (queued["id"], 0)):
+            job = await store.get(job_id)
+            assert job["status"] == JOB_QUEUED and job["worker_pid"] is None
+            assert job["attempts"] == attempts
+            # 参数只以密文保存
+            assert "r2-secret" not in job["spec"]
+
+        release.set()
+        new = JobManager(workers=2, max_queue_depth=10)
+        await new.start()
+        try:
+            for job_id in (running["id"], queued["id"]):
+                for _ in range(200):
+                    job = await store.get(job_id)
+                    if job["status"] == JOB_SUCCEEDED:
+                        break
+                    await asyncio.sleep(0.01)
+                assert job["status"] == JOB_SUCCEEDED
+            assert new.stats()["adopted"] == 2
+            # 被中断的任务从头执行，参数（含分片设置）完整恢复
+            assert [p["file_url"] for p in started].count("http://origin/1") == 2
+            assert started[-1]["transfer_settings"].part_size == 8 * 1024 * 1024
+        finally:
+            await new.stop()
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_job_fails_after_max_attempts(tmp_path):
+    async def run():
+        store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+        now = 0.0
+        for job_id, spec in (("a", "x"), ("b", None)):
+            await store.create({"id": job_id, "status": "running", "worker_pid": 1, "spec": spec,
+                                "attempts": 2, "created_at": now, "updated_at": now})
+        # 已中断过2次的任务和没有参数的任务都不再交还
+        assert await store.requeue_unfinished(1, "中断", max_attempts=3) == (0, 2)
+        assert (await store.get("a"))["status"] == JOB_FAILED
+        assert await store.adopt(2) is None
+        await store.close()
+
+    asyncio.run(run())
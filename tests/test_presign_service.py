@@ -0,0 +1,113 @@
+import asyncio
+from urllib.parse import parse_qs, urlsplit
+
+import boto3
+from botocore.config import Config
+import pytest
+try:
+    from moto import mock_aws
+except ImportError:  # moto<5（benchmarks/requirements.txt）
+    from moto import mock_s3 as mock_aws
+
+from app.utils.config import PRESIGN_MAX_EXPIRES
+from app.utils.presign_service import PresignService
+from app.utils.transfer_settings import MIN_PART_SIZE
+
+_TARGET = {
+    "bucket_name": "bkt",
+    "object_key": "dir/a.bin",
+    "endpoint": "https://s3.us-east-1.amazonaws.com",
+    "access_key_id": "testing",
+    "secret_access_key": "testing"
+}
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="testing",
+                              aws_secret_access_key="testing", config=Config(signature_version="s3v4"))
+        client.create_bucket(Bucket="bkt")
+        yield client
+
+
+def test_expiry_is_capped(s3_client):
+    service = PresignService(s3_client)
+    with pytest.raises(ValueError):
+        asyncio.run(service.presign_put(**_TARGET, expires_in=PRESIGN_MAX_EXPIRES + 1))
+
+    result = asyncio.run(service.presign_put(**_TARGET, expires_in=PRESIGN_MAX_EXPIRES, size=3))
+    assert result["expires_in"] == PRESIGN_MAX_EXPIRES
+    assert result["headers"] == {"Content-Length": "3"}
+    query = parse_qs(urlsplit(result["url"]).query)
+    assert query["X-Amz-Expires"] == [str(PRESIGN_MAX_EXPIRES)]
+
+
+def test_complete_without_etags_uses_list_parts(s3_client):
+    service = PresignService(s3_client)
+    size = MIN_PART_SIZE + 10
+    created = asyncio.run(service.create_multipart(**_TARGET, size=size, part_size=MIN_PART_SIZE))
+    assert created["part_size"] == MIN_PART_SIZE
+    assert [part["size"] for part in created["parts"]] == [MIN_PART_SIZE, 10]
+
+    # 模拟客户端按预签名URL上传各分片（倒序，且不回传ETag）
+    upload_id = created["upload_id"]
+    for part in reversed(created["parts"]):
+        s3_client.upload_part(Bucket="bkt", Key="dir/a.bin", UploadId=upload_id,
+                              PartNumber=part["partNumber"], Body=b"x" * part["size"])
+
+    result = asyncio.run(service.complete_multipart(**_TARGET, upload_id=upload_id, size=size))
+    assert result["parts"] == 2
+    assert s3_client.head_object(Bucket="bkt", Key="dir/a.bin")["ContentLength"] == size
+
+
+def test_complete_without_uploaded_parts_is_rejected(s3_client):
+    service = PresignService(s3_client)
+    created = asyncio.run(service.create_multipart(**_TARGET, size=10))
+    with pytest.raises(ValueError):
+        asyncio.run(service.complete_multipart(**_TARGET, upload_id=created["upload_id"], size=10))
+
+
+def _upload_parts(s3_client, created, part_numbers):
+    for part in created["parts"]:
+        if part["partNumber"] in part_numbers:
+            s3_client.upload_part(Bucket="bkt", Key="dir/a.bin", UploadId=created["upload_id"],
+                                  PartNumber=part["partNumber"], Body=b"x" * part["size"])
+
+
+def test_complete_rejects_missing_parts(s3_client):
+    service = PresignService(s3_client)
+    size = 2 * MIN_PART_SIZE + 10
+    created = asyncio.run(service.create_multipart(**_TARGET, size=size, part_size=MIN_PART_SIZE))
+    upload_id = created["upload_id"]
+
+    # 不提供parts时必须提供size
+    with pytest.raises(ValueError, match="size"):
+        asyncio.run(service.complete_multipart(**_TARGET, upload_id=upload_id))
+
+    # 中间分片缺失
+    _upload_parts(s3_client, created, {1, 3})
+    with pytest.raises(ValueError, match="缺少分片: 2"):
+        asyncio.run(service.complete_multipart(**_TARGET, upload_id=upload_id, size=size))
+
+    # 客户端提供的ETag同样检查连续性
+    with pytest.raises(ValueError, match="缺少分片: 2"):
+        asyncio.run(service.complete_multipart(**_TARGET, upload_id=upload_id, parts=[
+            {"partNumber": 1, "etag": "a"}, {"partNumber": 3, "etag": "c"}
+        ]))
+    assert "Contents" not in s3_client.list_objects_v2(Bucket="bkt")
+
+
+def test_complete_rejects_missing_last_part(s3_client):
+    service = PresignService(s3_client)
+    size = 2 * MIN_PART_SIZE + 10
+    created = asyncio.run(service.create_multipart(**_TARGET, size=size, part_size=MIN_PART_SIZE))
+    _upload_parts(s3_client, created, {1, 2})
+    with pytest.raises(ValueError, match="文件大小"):
+        asyncio.run(service.complete_multipart(**_TARGET, upload_id=created["upload_id"], size=size))
+
+    _upload_parts(s3_client, created, {3})
+    result = asyncio.run(service.complete_multipart(**_TARGET, upload_id=created["upload_id"], size=size))
+    assert result["parts"] == 3
+    assert s3_client.head_object(Bucket="bkt", Key="dir/a.bin")["ContentLength"] == size
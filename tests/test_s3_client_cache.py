@@ -0,0 +1,50 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.s3_client_cache import S3ClientCache
+
+
+class _SlowCache(S3ClientCache):
+    """创建客户端较慢，并记录创建次数"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.created = []
+        self.release = {}
+
+    def _create_client(self, endpoint, access_key_id, secret_access_key):
+        self.created.append(access_key_id)
+        event = self.release.get(access_key_id)
+        if event is not None:
+            event.wait(5)
+        else:
+            time.sleep(0.05)
+        return object()
+
+
+def test_same_tenant_creates_one_client():
+    cache = _SlowCache(max_size=10, idle_ttl=60)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        clients = list(pool.map(lambda _: cache.get_client("https://r2", "ak", "sk"), range(8)))
+    assert cache.created == ["ak"]
+    assert all(client is clients[0] for client in clients)
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 7
+    assert cache._creating == {}
+
+
+def test_slow_creation_does_not_block_other_tenants():
+    cache = _SlowCache(max_size=10, idle_ttl=60)
+    cache.release["slow"] = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        slow = pool.submit(cache.get_client, "https://r2", "slow", "sk")
+        while "slow" not in cache.created:
+            time.sleep(0.001)
+        start = time.perf_counter()
+        cache.get_client("https://r2", "fast", "sk")
+        assert time.perf_counter() - start < 1
+        assert not slow.done()
+        cache.release["slow"].set()
+        slow.result()
+    assert cache.stats()["size"] == 2
@@ -0,0 +1,145 @@
+import asyncio
+
+from app.utils.file_service import FileService
+from app.utils.source_cache import SourceCache, source_cache
+from app.utils.storage import MemoryBackend
+
+
+def _key(secret="secret", url="http://origin/a.bin", key="a.bin"):
+    return SourceCache.make_key(url, "http://r2/", "AKID", secret, "bkt", key)
+
+
+def test_key_includes_secret_and_normalizes_endpoint():
+    assert _key("secret") != _key("WRONG-SECRET")
+    assert _key() == SourceCache.make_key("http://origin/a.bin", "http://r2", "AKID", "secret", "bkt", "a.bin")
+    assert "secret" not in repr(_key())
+
+
+def test_set_requires_validators_and_object_etag():
+    cache = SourceCache(max_size=10, ttl=60)
+    cache.set(_key(), None, {"size": 1}, '"e"')
+    cache.set(_key(), {"etag": '"v"'}, {"size": 1}, None)
+    assert cache.get(_key()) is None
+    cache.set(_key(), {"etag": '"v"'}, {"size": 1}, '"e"')
+    assert cache.get(_key()) == ({"etag": '"v"'}, {"size": 1}, '"e"')
+    assert cache.get(_key("WRONG-SECRET")) is None
+
+
+def test_invalidate_object_drops_every_url_and_credential():
+    cache = SourceCache(max_size=10, ttl=60)
+    for key in (_key(), _key("other"), _key(url="http://origin/b.bin"), _key(key="other.bin")):
+        cache.set(key, {"etag": '"v"'}, {}, '"e"')
+    cache.invalidate_object("http://r2", "bkt", "a.bin")
+    assert cache.get(_key()) is None
+    assert cache.get(_key("other")) is None
+    assert cache.get(_key(url="http://origin/b.bin")) is None
+    assert cache.get(_key(key="other.bin")) is not None
+
+
+def test_lru_eviction_keeps_object_index_consistent():
+    cache = SourceCache(max_size=2, ttl=60)
+    for name in ("a", "b", "c"):
+        cache.set(_key(key=name), {"etag": '"v"'}, {}, '"e"')
+    assert cache.get(_key(key="a")) is None
+    cache.invalidate_object("http://r2", "bkt", "a")
+    assert cache.stats()["size"] == 2
+
+
+def _upload(service, secret="secret", **kwargs):
+    return service.upload_from_url(
+        file_url="http://origin/a.bin",
+        bucket_name="bkt",
+        object_key="a.bin",
+        endpoint="http://r2",
+        access_key_id="AKID",
+        secret_access_key=secret,
+        custom_domain=None,
+        **kwargs
+    )
+
+
+def test_hit_requires_unchanged_object(origin):
+    source_cache.clear()
+    origin.files["/a.bin"] = b"x" * 1000
+    storage = MemoryBackend()
+    service = FileService(storage=storage)
+
+    async def scenario():
+        first = await _upload(service)
+        assert "not_modified" not in first
+        second = await _upload(service)
+        assert second["not_modified"] is True
+
+        # 对象在服务之外被覆盖后，HeadObject的ETag不同，不能命中
+        storage.put_object("bkt", "a.bin", b"other", "text/plain")
+        third = await _upload(service)
+        assert "not_modified" not in third
+        assert storage.get_object("bkt", "a.bin") == b"x" * 1000
+
+    asyncio.run(scenario())
+    # 第二次是条件GET（304），第三次因ETag不符重新完整下载
+    assert [r.headers.get("if-none-match") is not None for r in origin.requests] == [False, True, False]
+
+
+def test_other_secret_does_not_hit(origin):
+    source_cache.clear()
+    origin.files["/a.bin"] = b"y" * 100
+    service = FileService(storage=MemoryBackend())
+
+    async def scenario():
+        await _upload(service)
+        return await _upload(service, secret="WRONG-SECRET")
+
+    assert "not_modified" not in asyncio.run(scenario())
+
+
+def test_streaming_compares_validators_without_conditional_support(origin):
+    source_cache.clear()
+    origin.files["/a.bin"] = b"z" * 100
+    origin.conditional = False
+    storage = MemoryBackend()
+    service = FileService(storage=storage)
+
+    async def scenario():
+        await _upload(service, streaming=True)
+        storage.delete_object("bkt", "a.bin")
+        storage.put_object("bkt", "a.bin", b"z" * 100, "application/octet-stream")
+        # 对象ETag变化，重新上传并记录新的ETag
+        await _upload(service, streaming=True)
+        return await _upload(service, streaming=True)
+
+    assert asyncio.run(scenario())["not_modified"] is True
+
+
+class _CountingBackend(MemoryBackend):
+    def __init__(self):
+        super().__init__()
+        self.heads = 0
+
+    def head_object(self, bucket_name, object_key):
+        self.heads += 1
+        return super().head_object(bucket_name, object_key)
+
+
+def test_upload_records_etag_without_head_object(origin):
+    source_cache.clear()
+    origin.files["/a.bin"] = b"w" * 100
+    storage = _CountingBackend()
+    service = FileService(storage=storage)
+
+    async def scenario():
+        for streaming in (False, True):
+            result = await _upload(service, streaming=streaming)
+            # 缓存的ETag来自上传响应
+            assert result["etag"] == storage.head_object("bkt", "a.bin")["etag"]
+            storage.heads -= 1
+            storage.delete_object("bkt", "a.bin")
+            source_cache.clear()
+        assert storage.heads == 0
+        await _upload(service)
+        hit = await _upload(service)
+        assert hit["not_modified"] is True
+        # 只有命中前确认对象未变时查询一次
+        assert storage.heads == 1
+
+    asyncio.run(scenario())
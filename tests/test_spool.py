@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from app.utils.spool import Spool, SpoolFull
+
+_MB = 1024 * 1024
+
+
+class _FixedSpool(Spool):
+    """文件系统剩余空间固定为free字节"""
+
+    def __init__(self, directory, free, min_free_bytes):
+        super().__init__(directory, min_free_bytes)
+        self.free = free
+
+    def _free_bytes(self):
+        return self.free
+
+
+def test_ensure_space_counts_other_reservations(tmp_path):
+    spool = _FixedSpool(str(tmp_path), free=100 * _MB, min_free_bytes=10 * _MB)
+    first, second, third = object(), object(), object()
+
+    spool.ensure_space(first, 50 * _MB)
+    # 重新检查同一文件时不计入自己的预留
+    spool.ensure_space(first, 60 * _MB)
+    spool.ensure_space(second, 30 * _MB)
+    with pytest.raises(SpoolFull) as excinfo:
+        spool.ensure_space(third, 1)
+    assert excinfo.value.retry_after > 0
+    assert spool.stats()["reserved_bytes"] == 90 * _MB
+    assert spool.stats()["rejected"] == 1
+
+    spool.release(first)
+    spool.ensure_space(third, 60 * _MB)
+    assert spool.stats()["reserved_bytes"] == 90 * _MB
+
+
+def test_create_file_checks_min_free(tmp_path):
+    directory = str(tmp_path / "spool")
+    spool = _FixedSpool(directory, free=5 * _MB, min_free_bytes=10 * _MB)
+    with pytest.raises(SpoolFull):
+        spool.create_file()
+
+    spool.free = 20 * _MB
+    file = spool.create_file()
+    try:
+        assert os.path.dirname(file.name) == directory
+    finally:
+        file.close()
+        os.unlink(file.name)
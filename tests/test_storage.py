@@ -0,0 +1,121 @@
+import tempfile
+
+import pytest
+
+from app.utils.storage import S3Backend
+from app.utils.transfer_settings import TransferSettings
+
+
+class _LeakyClient:
+    """模拟botocore：保留读到的Body切片（如重试或异常回溯中），可选地让上传失败"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.kept = []
+
+    def put_object(self, Body, **kwargs):
+        self.kept.append(Body.read())
+        if self.error is not None:
+            raise self.error
+        return {"ETag": '"e1"'}
+
+
+def _spooled(data: bytes):
+    file = tempfile.TemporaryFile()
+    file.write(data)
+    return file
+
+
+def test_mapped_upload_error_is_not_masked_by_buffer_error():
+    client = _LeakyClient(error=ConnectionError("连接被重置"))
+    with _spooled(b"x" * 1024) as file:
+        with pytest.raises(ConnectionError, match="连接被重置"):
+            S3Backend(client).upload_file("bkt", "a.bin", file, 1024, "application/octet-stream", TransferSettings().resolve(1024))
+
+
+def test_mapped_upload_succeeds_while_slices_are_referenced():
+    client = _LeakyClient()
+    with _spooled(b"abc") as file:
+        etag = S3Backend(client).upload_file("bkt", "a.bin", file, 3, "text/plain", TransferSettings().resolve(3))
+    assert bytes(client.kept[0]) == b"abc"
+    # ETag取自PutObject的响应，不需要再HeadObject
+    assert etag == '"e1"'
+
+
+def _local(tmp_path):
+    from app.utils.storage import LocalBackend
+    return LocalBackend(str(tmp_path / "root"))
+
+
+@pytest.mark.parametrize("bucket, key", [
+    ("bkt", "../other/a.bin"),
+    ("bkt", "a/../../other/a.bin"),
+    ("bkt", "/etc/passwd"),
+    ("bkt", ""),
+    ("..", "a.bin"),
+    (".meta", "a.bin"),
+    ("a/b", "c.bin"),
+])
+def test_local_backend_rejects_path_escape(tmp_path, bucket, key):
+    with pytest.raises(ValueError):
+        _local(tmp_path).put_object(bucket, key, b"x", "text/plain")
+    assert not (tmp_path / "other").exists()
+
+
+def test_local_backend_rejects_symlink_escape(tmp_path):
+    backend = _local(tmp_path)
+    (tmp_path / "outside").mkdir()
+    (tmp_path / "root" / "bkt").mkdir(parents=True)
+    (tmp_path / "root" / "bkt" / "link").symlink_to(tmp_path / "outside")
+    with pytest.raises(ValueError):
+        backend.put_object("bkt", "link/a.bin", b"x", "text/plain")
+    assert list((tmp_path / "outside").iterdir()) == []
+
+
+def _upload_local(tmp_path, data: bytes):
+    backend = _local(tmp_path)
+    progress = []
+    with _spooled(data) as file:
+        etag = backend.upload_file("bkt", "dir/a.bin", file, len(data), "application/octet-stream",
+                                   TransferSettings().resolve(len(data)), progress.append)
+    head = backend.head_object("bkt", "dir/a.bin")
+    assert etag == head["etag"]
+    return (tmp_path / "root" / "bkt" / "dir" / "a.bin").read_bytes(), head, progress
+
+
+def test_local_upload_falls_back_when_kernel_copy_is_unsupported(tmp_path, monkeypatch):
+    import errno
+    import os
+
+    calls = []
+
+    def unsupported(name, code):
+        def fail(*args):
+            calls.append(name)
+            raise OSError(code, os.strerror(code))
+        return fail
+
+    monkeypatch.setattr(os, "copy_file_range", unsupported("copy_file_range", errno.EXDEV), raising=False)
+    monkeypatch.setattr(os, "sendfile", unsupported("sendfile", errno.EINVAL), raising=False)
+
+    data = os.urandom(300 * 1024)
+    content, head, progress = _upload_local(tmp_path, data)
+    assert content == data
+    assert head["size"] == len(data)
+    assert sum(progress) == len(data)
+    assert calls[:2] == ["copy_file_range", "sendfile"]
+
+
+def test_local_upload_propagates_real_copy_errors(tmp_path, monkeypatch):
+    import errno
+    import os
+
+    def no_space(*args):
+        raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+    monkeypatch.setattr(os, "copy_file_range", no_space, raising=False)
+    with pytest.raises(OSError) as excinfo:
+        _upload_local(tmp_path, b"x" * 1024)
+    assert excinfo.value.errno == errno.ENOSPC
+    # 临时文件已清理，目标对象不存在
+    assert os.listdir(tmp_path / "root" / "bkt" / "dir") == []
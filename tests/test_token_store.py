@@ -0,0 +1,44 @@
+import asyncio
+
+from app.utils.token_store import TokenStore
+
+
+class _FakeQingflow:
+    """分页返回记录；拉取第一页后执行on_page回调（模拟同步期间的renew）"""
+
+    def __init__(self, records, on_page=None):
+        self.records = records
+        self.on_page = on_page
+
+    async def fetch_records(self, page_num, page_size):
+        page = self.records[(page_num - 1) * page_size:page_num * page_size]
+        if page_num == 1 and self.on_page is not None:
+            self.on_page()
+        await asyncio.sleep(0)
+        return page
+
+    @staticmethod
+    def parse_record(record):
+        return {"token": record["token"], "expires": record["expires"]}
+
+
+def test_put_during_sync_is_kept():
+    store = TokenStore(enabled=True, sync_interval=60, max_staleness=60, page_size=2)
+    records = [{"token": f"t{i}", "expires": "old", "applyId": str(i)} for i in range(3)]
+    # 第一页已拉取到t0的旧记录之后，renew写入新记录
+    service = _FakeQingflow(records, on_page=lambda: store.put("t0", {"token": "t0", "expires": "new"}, "0"))
+
+    count = asyncio.run(store.sync(service))
+
+    assert count == 3
+    assert store.lookup("t0")[0]["expires"] == "new"
+    assert store.lookup("t2")[0]["expires"] == "old"
+    assert store._pending is None
+
+
+def test_sync_replaces_removed_records():
+    store = TokenStore(enabled=True, sync_interval=60, max_staleness=60, page_size=10)
+    store.put("gone", {"token": "gone"}, "9")
+    asyncio.run(store.sync(_FakeQingflow([{"token": "t0", "expires": "x", "applyId": "0"}])))
+    assert store.lookup("gone") is None
+    assert store.lookup("t0") is not None
@@ -0,0 +1,83 @@
+import asyncio
+import tempfile
+
+import pytest
+
+pytest.importorskip("opentelemetry.sdk")
+
+from opentelemetry.sdk.trace import TracerProvider  # noqa: E402
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor  # noqa: E402
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter  # noqa: E402
+
+from app.utils import tracing  # noqa: E402
+from app.utils.executor import upload_executor  # noqa: E402
+from app.utils.file_service import FileService  # noqa: E402
+from app.utils.storage import S3Backend  # noqa: E402
+from app.utils.transfer_settings import TransferSettings, MIN_PART_SIZE  # noqa: E402
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(tracing, "_tracer", provider.get_tracer("test"))
+    return exporter
+
+
+class _S3Client:
+    """只实现分片上传所需调用的S3客户端"""
+
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "u1"}
+
+    def upload_part(self, Body, PartNumber, **kwargs):
+        Body.read()
+        return {"ETag": f'"p{PartNumber}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        return {"ETag": '"e-3"'}
+
+
+def _children(exporter, parent_name):
+    spans = exporter.get_finished_spans()
+    parent = next(s for s in spans if s.name == parent_name)
+    return [s for s in spans if s.parent is not None and s.parent.span_id == parent.context.span_id]
+
+
+def test_mapped_upload_records_span_per_part(exporter):
+    size = 2 * MIN_PART_SIZE + 10
+    settings = TransferSettings(multipart_threshold=MIN_PART_SIZE, part_size=MIN_PART_SIZE).resolve(size)
+
+    async def run():
+        with tempfile.TemporaryFile() as file:
+            file.write(b"x" * size)
+            with tracing.span("r2.upload"):
+                return await upload_executor.run(
+                    S3Backend(_S3Client()).upload_file, "bkt", "a.bin", file, size, "application/octet-stream", settings
+                )
+
+    assert asyncio.run(run()) == '"e-3"'
+    # 线程池中执行的分片span挂在调用方的span下
+    children = _children(exporter, "r2.upload")
+    parts = sorted((s.attributes["part_number"], s.attributes["size"]) for s in children if s.name == "r2.upload_part")
+    assert parts == [(1, MIN_PART_SIZE), (2, MIN_PART_SIZE), (3, 10)]
+    assert {s.name for s in children} == {
+        "r2.create_multipart_upload", "r2.upload_part", "r2.complete_multipart_upload"
+    }
+
+
+def test_download_records_span_per_flush(exporter, origin):
+    origin.files["/a.bin"] = b"x" * (3 * 1024 * 1024)
+
+    async def run():
+        with tracing.span("source.download"):
+            temp_file, _, size = await FileService().download_file("http://origin/a.bin", ranged=False)
+        FileService._remove_temp_file_sync(temp_file)
+        return size
+
+    size = asyncio.run(run())
+    writes = [s for s in _children(exporter, "source.download") if s.name == "spool.write"]
+    assert writes
+    assert sum(s.attributes["size"] for s in writes) == size
+    assert [s.attributes["offset"] for s in writes][0] == 0
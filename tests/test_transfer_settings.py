@@ -0,0 +1,49 @@
+from app.utils.config import MULTIPART_MAX_PART_SIZE, MULTIPART_MAX_CONCURRENCY
+from app.utils.transfer_settings import TransferSettings, MIN_PART_SIZE, MAX_PARTS
+
+_MB = 1024 * 1024
+
+
+def test_requested_sizes_are_clamped():
+    settings = TransferSettings(multipart_threshold=200 * _MB, part_size=200 * _MB, concurrency=10 ** 6).resolve(200 * _MB)
+    assert settings.part_size == MULTIPART_MAX_PART_SIZE
+    assert settings.multipart_threshold == MULTIPART_MAX_PART_SIZE
+    assert settings.concurrency == MULTIPART_MAX_CONCURRENCY
+
+
+def test_minimum_part_size():
+    assert TransferSettings(part_size=1).resolve().part_size == MIN_PART_SIZE
+
+
+def test_huge_objects_still_fit_part_limit():
+    size = 2 * MULTIPART_MAX_PART_SIZE * MAX_PARTS
+    settings = TransferSettings(part_size=MIN_PART_SIZE).resolve(size)
+    assert settings.part_size == MIN_PART_SIZE
+    assert -(-size // TransferSettings().resolve(size).part_size) <= MAX_PARTS
+
+
+def test_upload_rejects_oversized_part_size():
+    import asyncio
+    import httpx
+    from app.main import app
+    from app.utils.auth import get_current_token
+
+    app.dependency_overrides[get_current_token] = lambda: {"id": "t1", "token": "tok"}
+    body = {
+        "fileUrl": "http://origin/a.bin",
+        "bucketName": "bkt",
+        "objectKey": "a.bin",
+        "endpoint": "http://r2",
+        "accessKeyId": "a",
+        "secretAccessKey": "b",
+        "partSize": MULTIPART_MAX_PART_SIZE + 1
+    }
+
+    async def post():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            return await client.post("/R2api/upload", json=body)
+
+    try:
+        assert asyncio.run(post()).status_code == 422
+    finally:
+        app.dependency_overrides.clear()